@@ -0,0 +1,95 @@
+# pyright: basic
+"""
+Compare rows/sec of the executemany and binary COPY insert paths.
+
+Loads synthetic flavored-motif rows into a scratch copy of the
+flavored_motifs table, which is dropped afterwards.
+
+    python -m benchmarks.bench_bulk_load --rows 1000000
+"""
+
+import argparse
+import os
+import time
+from uuid import uuid4
+
+from psycopg import sql
+
+from src import database
+
+BENCHMARK_TABLE = "cyberbullying_motifs.flavored_motifs_load_benchmark"
+
+
+def synthetic_flavored_rows(num_rows: int, blob_size: int):
+    node_flavors = ["fine", "coarse"]
+    edge_flavors = ["fine", "coarse", "unweighted"]
+    blob = os.urandom(blob_size)
+    for i in range(num_rows):
+        yield {
+            "flavored_motif_id": str(uuid4()),
+            "plain_motif_id": str(uuid4()),
+            "node_flavor": node_flavors[i % 2],
+            "edge_flavor": edge_flavors[i % 3],
+            "motif_hash": f"{i:032x}",
+            "serialized_motif": blob,
+        }
+
+
+def _insert_statement() -> str:
+    names = [name for name, _ in database.FLAVORED_MOTIF_COLUMNS]
+    columns = ", ".join(names)
+    values = ", ".join(f"%({name})s" for name in names)
+    return f"INSERT INTO {BENCHMARK_TABLE} ({columns}) VALUES ({values});"
+
+
+def _reset_table(con) -> None:
+    con.execute(
+        sql.SQL("DROP TABLE IF EXISTS {}").format(
+            sql.Identifier(*BENCHMARK_TABLE.split("."))
+        )
+    )
+    con.execute(
+        sql.SQL("CREATE TABLE {} (LIKE {})").format(
+            sql.Identifier(*BENCHMARK_TABLE.split(".")),
+            sql.Identifier(*database.FLAVORED_MOTIFS_TABLE.split(".")),
+        )
+    )
+    con.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--blob-size", type=int, default=400)
+    args = parser.parse_args()
+
+    with database.pipeline_run(max_size=1), database.stage() as con:
+        _reset_table(con)
+        start = time.perf_counter()
+        database._insert_or_update_postgres(
+            _insert_statement(),
+            list(synthetic_flavored_rows(args.rows, args.blob_size)),
+        )
+        executemany_seconds = time.perf_counter() - start
+
+        _reset_table(con)
+        start = time.perf_counter()
+        database._copy_postgres(
+            BENCHMARK_TABLE,
+            database.FLAVORED_MOTIF_COLUMNS,
+            synthetic_flavored_rows(args.rows, args.blob_size),
+        )
+        copy_seconds = time.perf_counter() - start
+
+        con.execute(
+            sql.SQL("DROP TABLE {}").format(sql.Identifier(*BENCHMARK_TABLE.split(".")))
+        )
+        con.commit()
+
+    print(f"executemany: {args.rows / executemany_seconds:,.0f} rows/sec")
+    print(f"copy binary: {args.rows / copy_seconds:,.0f} rows/sec")
+    print(f"speedup: {executemany_seconds / copy_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
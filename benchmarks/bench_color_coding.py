@@ -0,0 +1,105 @@
+# pyright: basic
+"""
+Sampled and color-coded estimates against exact flavored motif counts of
+sessions small enough to flavor completely: time, the error of the total,
+and per frequent flavored motif the worst relative error and how many exact
+counts fall inside the 95% interval.
+
+    python -m benchmarks.bench_color_coding --size 5 --sessions 20x6 40x10 60x15
+"""
+
+import argparse
+import math
+import time
+from dataclasses import replace
+
+import numpy as np
+
+from src.color_coding import (
+    CONFIDENCE_Z,
+    ColorCoding,
+    color_coding_counts,
+    exact_flavored_counts,
+)
+from src.compact_graph import CompactSessionGraph
+from src.pickle_sessions import build_session_graph
+from tests.synthetic import synthetic_session
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument(
+        "--sessions",
+        nargs="+",
+        default=["20x6", "40x10", "60x15"],
+        help="comments x authors of each synthetic session",
+    )
+    parser.add_argument("--relative-error", type=float, default=0.1)
+    parser.add_argument("--max-colorings", type=int, default=16)
+    args = parser.parse_args()
+    sampled = ColorCoding(
+        sizes=(args.size,),
+        relative_error=args.relative_error,
+        max_colorings=args.max_colorings,
+    )
+    # Force color coding, the sessions are small enough to be enumerated.
+    estimators = {
+        "sampled": sampled,
+        "colored": replace(sampled, max_enumerated_occurrences=0),
+    }
+
+    print(
+        f"{'session':>8} {'motifs':>10} {'exact':>7} {'estimator':>9} "
+        f"{'time':>7} {'p':>6} {'R':>3} {'total err':>9} {'frequent':>8} "
+        f"{'max err':>8} {'in CI':>6}"
+    )
+    for unit_id, shape in enumerate(args.sessions):
+        num_comments, num_authors = map(int, shape.split("x"))
+        session, comments = synthetic_session(
+            unit_id, num_comments, num_authors, np.random.default_rng(unit_id)
+        )
+        session_G = CompactSessionGraph.from_session_digraph(
+            build_session_graph(session, comments, True)
+        )
+
+        start = time.perf_counter()
+        exact = exact_flavored_counts(session_G, args.size)
+        exact_seconds = time.perf_counter() - start
+        # Every flavor splits the same occurrences.
+        num_occurrences = sum(exact.values()) / 6
+        frequent = [
+            key
+            for key, hash_count in exact.items()
+            if hash_count >= sampled.min_share * num_occurrences
+        ]
+        for name, color_coding in estimators.items():
+            start = time.perf_counter()
+            counts = color_coding_counts(session_G, args.size, color_coding)
+            seconds = time.perf_counter() - start
+            total = counts.total_count / counts.sampling_probability
+            errors = [
+                abs(counts.hash_counts[key] / counts.sampling_probability - exact[key])
+                for key in frequent
+            ]
+            max_error = max(
+                (error / exact[key] for error, key in zip(errors, frequent)),
+                default=0.0,
+            )
+            covered = np.mean(
+                [
+                    error <= CONFIDENCE_Z * math.sqrt(counts.count_variance(key))
+                    for error, key in zip(errors, frequent)
+                ]
+            )
+            print(
+                f"{shape:>8} {num_occurrences:>10,.0f} {exact_seconds:>6.1f}s "
+                f"{name:>9} {seconds:>6.1f}s {counts.keep_probability:>6.3f} "
+                f"{counts.num_colorings:>3} "
+                f"{abs(total / num_occurrences - 1):>9.1%} {len(frequent):>8} "
+                f"{max_error:>8.1%} {covered:>6.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
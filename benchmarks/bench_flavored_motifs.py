@@ -0,0 +1,76 @@
+# pyright: basic
+"""
+Flavoring plain motifs through materialized subgraphs versus the
+FlavoredMotifLabeler lookup tables. The motif hash cache is cleared before
+each run so both pay for their distinct hashes.
+
+    python -m benchmarks.bench_flavored_motifs --sessions 5 --comments 100 --authors 20
+"""
+
+import argparse
+import itertools
+import time
+
+from src.flavored_motif_graph import (
+    EDGE_FLAVORS,
+    NODE_FLAVORS,
+    FlavoredMotifGraph,
+    FlavoredMotifLabeler,
+)
+from src.graph_hashing import motif_hash_cache
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import SIZES, find_session_graph_motifs, to_session_igraph
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--comments", type=int, default=100)
+    parser.add_argument("--authors", type=int, default=20)
+    args = parser.parse_args()
+
+    sessions = []
+    for session, comments in synthetic_sessions(
+        args.sessions, args.comments, args.authors
+    ):
+        session_G = build_session_graph(session, comments, True)
+        session_igraph = to_session_igraph(session_G)
+        plain_motifs = [
+            plain_motif
+            for size in SIZES
+            for plain_motif in find_session_graph_motifs(
+                session_G, size, session_igraph
+            )
+        ]
+        sessions.append((session_igraph, plain_motifs))
+    num_motifs = sum(len(plain_motifs) for _, plain_motifs in sessions)
+
+    motif_hash_cache.clear()
+    start = time.perf_counter()
+    for _, plain_motifs in sessions:
+        for node_flavor, edge_flavor in itertools.product(NODE_FLAVORS, EDGE_FLAVORS):
+            for plain_motif in plain_motifs:
+                FlavoredMotifGraph.from_plain_motif(
+                    plain_motif, node_flavor, edge_flavor
+                )
+    subgraph_seconds = time.perf_counter() - start
+
+    motif_hash_cache.clear()
+    start = time.perf_counter()
+    for session_igraph, plain_motifs in sessions:
+        labeler = FlavoredMotifLabeler(session_igraph)
+        for plain_motif in plain_motifs:
+            labeler.flavor(plain_motif)
+    labeler_seconds = time.perf_counter() - start
+
+    print(
+        f"{num_motifs:,} plain motifs  "
+        f"subgraph {1e6 * subgraph_seconds / num_motifs:.1f} us/motif  "
+        f"labeler {1e6 * labeler_seconds / num_motifs:.1f} us/motif  "
+        f"({subgraph_seconds / labeler_seconds:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
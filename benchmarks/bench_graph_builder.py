@@ -0,0 +1,61 @@
+# pyright: basic
+"""
+Eager versus lazy GraphBuilder edges on sessions with many distinct bullies.
+
+    python -m benchmarks.bench_graph_builder --sessions 20 --comments 2000 --authors 1000
+"""
+
+import argparse
+import time
+
+from src.graph_builder import GraphBuilder
+from src.pickle_sessions import GRAPH_ENGINES
+from src.author_role import AuthorRole
+from tests.synthetic import synthetic_sessions
+
+
+def build(session, comments, engine: str, lazy_edges: bool):
+    session_G = GRAPH_ENGINES[engine].from_session(session, is_true_graph=True)
+    builder = GraphBuilder(session_G, lazy_edges=lazy_edges)
+    builder.add_node(
+        AuthorRole(
+            unit_id=session.unit_id,
+            comment_id=comments[0].comment_id,
+            author_name=session.owner_user_name,
+            role="main_victim",
+            severity=0.0,
+            timestamp=session.posted_at,
+        )
+    )
+    for author_role in comments:
+        builder.add_node(author_role)
+        builder.add_edge(author_role)
+    builder.finalize()
+    return session_G
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--authors", type=int, default=1000)
+    args = parser.parse_args()
+
+    session_comments = synthetic_sessions(args.sessions, args.comments, args.authors)
+    for engine in GRAPH_ENGINES:
+        for lazy_edges in [False, True]:
+            start = time.perf_counter()
+            num_edges = sum(
+                build(session, comments, engine, lazy_edges).num_edges
+                for session, comments in session_comments
+            )
+            seconds = time.perf_counter() - start
+            mode = "lazy" if lazy_edges else "eager"
+            print(
+                f"{engine:>8} {mode:>5}: {1e3 * seconds / len(session_comments):.1f} "
+                f"ms/session  {num_edges / len(session_comments):,.0f} edges/session"
+            )
+
+
+if __name__ == "__main__":
+    main()
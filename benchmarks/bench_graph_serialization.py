@@ -0,0 +1,56 @@
+# pyright: basic
+"""
+Size and latency of the pickle and compact session graph formats.
+
+Load latency covers getting from the blob to an ig.Graph ready for motif work.
+
+    python -m benchmarks.bench_graph_serialization --sessions 500 --comments 200
+"""
+
+import argparse
+import time
+
+import igraph as ig
+
+from src.compact_graph import SERIALIZATION_FORMATS, load_session_graph
+from src.compact_graph import serialize_session_graph
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import to_session_igraph
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--authors", type=int, default=80)
+    args = parser.parse_args()
+
+    session_graphs = [
+        build_session_graph(session, comments, is_true_graph=True)
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    for serialization in SERIALIZATION_FORMATS:
+        start = time.perf_counter()
+        blobs = [serialize_session_graph(G, serialization) for G in session_graphs]
+        dump_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        igraphs: list[ig.Graph] = [
+            to_session_igraph(load_session_graph(blob)) for blob in blobs
+        ]
+        load_seconds = time.perf_counter() - start
+        assert len(igraphs) == len(session_graphs)
+
+        total_bytes = sum(len(blob) for blob in blobs)
+        print(
+            f"{serialization:>8}: {total_bytes / len(blobs):>10,.0f} bytes/graph  "
+            f"dump {1e3 * dump_seconds / len(blobs):.3f} ms/graph  "
+            f"load->igraph {1e3 * load_seconds / len(blobs):.3f} ms/graph"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# pyright: basic
+"""
+WL versus canonical (BLISS) motif hashing: time per labeled motif and a
+collision report of WL hashes that cover several canonical forms. WL is also
+timed on interned integer labels, with the label cache's hit rate and bytes
+hashed.
+
+    python -m benchmarks.bench_hash_backends --sessions 200 --comments 30 --authors 10
+    python -m benchmarks.bench_hash_backends --from-db
+"""
+
+import argparse
+import itertools
+import time
+from collections import Counter, defaultdict
+
+from src import database
+from src.compact_graph import load_session_graph
+from src.flavored_motif_graph import EDGE_FLAVORS, NODE_FLAVORS, FlavoredMotifLabeler
+from src.graph_hashing import (
+    canonical_hash_from_edges,
+    weisfeiler_lehman_hashes_from_edges,
+    weisfeiler_lehman_hashes_interned,
+    wl_label_cache,
+)
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import SIZES, compute_motifs_randesu, to_session_igraph
+from tests.synthetic import synthetic_sessions
+
+
+def labeled_motifs(session_graphs) -> dict[tuple[str, str], Counter]:
+    """
+    Occurrences of every distinct (node labels, edges, edge labels) motif,
+    per flavor, plus the unlabeled motifs under ("plain", "plain"). Plain
+    motifs are labeled by degree, as weisfeiler_lehman_graph_hash does.
+    """
+    population: dict[tuple[str, str], Counter] = defaultdict(Counter)
+    for session_G in session_graphs:
+        session_igraph = to_session_igraph(session_G)
+        labeler = FlavoredMotifLabeler(session_igraph)
+        for size in SIZES:
+            for motifs in compute_motifs_randesu(session_igraph, size).values():
+                for motif_vertices in motifs:
+                    vertices = sorted(motif_vertices)
+                    edges, eids = labeler._induced_edges(vertices)
+                    edges = tuple(edges)
+                    degrees = Counter(itertools.chain.from_iterable(edges))
+                    population[("plain", "plain")][
+                        (tuple(str(degrees[v]) for v in range(size)), edges, None)
+                    ] += 1
+                    for node_flavor, edge_flavor in itertools.product(
+                        NODE_FLAVORS, EDGE_FLAVORS
+                    ):
+                        node_labels = labeler.node_labels[node_flavor]
+                        edge_labels = labeler.edge_labels[edge_flavor]
+                        population[(node_flavor, edge_flavor)][
+                            (
+                                tuple(node_labels[v] for v in vertices),
+                                edges,
+                                tuple(edge_labels[eid] for eid in eids),
+                            )
+                        ] += 1
+    return population
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--comments", type=int, default=30)
+    parser.add_argument("--authors", type=int, default=10)
+    parser.add_argument(
+        "--from-db", action="store_true", help="Use the stored true session graphs."
+    )
+    args = parser.parse_args()
+
+    if args.from_db:
+        with database.stage():
+            session_graphs = [
+                load_session_graph(blob) for blob in database.iter_session_graph_blobs()
+            ]
+    else:
+        session_graphs = [
+            build_session_graph(session, comments, True)
+            for session, comments in synthetic_sessions(
+                args.sessions, args.comments, args.authors
+            )
+        ]
+    population = labeled_motifs(session_graphs)
+
+    wl_seconds = interned_seconds = canonical_seconds = 0.0
+    wl_label_cache.clear()
+    print(
+        f"{'flavor':>18} {'motifs':>9} {'distinct':>9} {'wl':>7} {'canonical':>9} "
+        f"{'colliding':>9} {'occurrences':>11}"
+    )
+    for (node_flavor, edge_flavor), occurrences in population.items():
+        motifs = list(occurrences)
+        start = time.perf_counter()
+        wl_hashes = [
+            weisfeiler_lehman_hashes_from_edges(
+                list(edges),
+                [
+                    (
+                        list(node_labels),
+                        None if edge_labels is None else list(edge_labels),
+                    )
+                ],
+            )[0]
+            for node_labels, edges, edge_labels in motifs
+        ]
+        wl_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        interned_hashes = [
+            weisfeiler_lehman_hashes_interned(
+                list(edges),
+                [
+                    (
+                        list(node_labels),
+                        None if edge_labels is None else list(edge_labels),
+                    )
+                ],
+            )[0]
+            for node_labels, edges, edge_labels in motifs
+        ]
+        interned_seconds += time.perf_counter() - start
+        assert interned_hashes == wl_hashes
+        start = time.perf_counter()
+        canonical_hashes = [
+            canonical_hash_from_edges(
+                list(node_labels),
+                list(edges),
+                None if edge_labels is None else list(edge_labels),
+            )
+            for node_labels, edges, edge_labels in motifs
+        ]
+        canonical_seconds += time.perf_counter() - start
+
+        classes: dict[str, set[str]] = defaultdict(set)
+        wl_occurrences: Counter = Counter()
+        for motif, wl_hash, canonical_hash in zip(motifs, wl_hashes, canonical_hashes):
+            classes[wl_hash].add(canonical_hash)
+            wl_occurrences[wl_hash] += occurrences[motif]
+        colliding = [wl_hash for wl_hash, forms in classes.items() if len(forms) > 1]
+        # WL is isomorphism invariant, so no canonical form may get two WL hashes.
+        assert len(set(canonical_hashes)) >= len(classes)
+        print(
+            f"{node_flavor + '/' + edge_flavor:>18} {occurrences.total():>9,} "
+            f"{len(motifs):>9,} {len(classes):>7,} {len(set(canonical_hashes)):>9,} "
+            f"{len(colliding):>9,} "
+            f"{sum(wl_occurrences[wl_hash] for wl_hash in colliding):>11,}"
+        )
+
+    num_motifs = sum(len(occurrences) for occurrences in population.values())
+    print(
+        f"per distinct labeled motif: wl {wl_seconds / num_motifs * 1e6:.0f} us, "
+        f"wl interned {interned_seconds / num_motifs * 1e6:.0f} us, "
+        f"canonical {canonical_seconds / num_motifs * 1e6:.0f} us"
+    )
+    print(
+        f"label cache: {len(wl_label_cache):,} entries, "
+        f"{wl_label_cache.hit_rate:.1%} hits, "
+        f"{wl_label_cache.bytes_hashed / 2**20:.1f} MiB hashed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# pyright: basic
+"""
+Per-session versus disjoint-union batch motif enumeration over many small
+sessions, for pickled (networkx) and compact session graphs.
+
+    python -m benchmarks.bench_motif_batch --sessions 2000 --comments 20 --authors 8
+"""
+
+import argparse
+import time
+
+from src.compact_graph import load_session_graph, serialize_session_graph
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import (
+    SIZES,
+    SessionGraphBatch,
+    compute_motifs_randesu,
+    to_session_igraph,
+)
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=20)
+    parser.add_argument("--authors", type=int, default=8)
+    args = parser.parse_args()
+
+    networkx_graphs = [
+        build_session_graph(session, comments, True)
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    compact_graphs = [
+        load_session_graph(serialize_session_graph(G, "compact"))
+        for G in networkx_graphs
+    ]
+    for name, session_graphs in [
+        ("networkx", networkx_graphs),
+        ("compact", compact_graphs),
+    ]:
+        start = time.perf_counter()
+        per_session = 0
+        for session_G in session_graphs:
+            session_igraph = to_session_igraph(session_G)
+            for size in SIZES:
+                per_session += sum(
+                    len(v)
+                    for v in compute_motifs_randesu(session_igraph, size).values()
+                )
+        session_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = SessionGraphBatch.pack(session_graphs)
+        batched = sum(len(batch.occurrences(size)[0]) for size in SIZES)
+        batch_seconds = time.perf_counter() - start
+
+        assert batched == per_session
+        print(
+            f"{name:>8}: {len(session_graphs):,} sessions, {batched:,} occurrences  "
+            f"per-session {session_seconds:.2f}s  batch {batch_seconds:.2f}s  "
+            f"({session_seconds / batch_seconds:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# pyright: basic
+"""
+Census (native count vector) versus per-occurrence callback motif counting.
+
+Few authors and many comments make dense sessions, the case the callback is
+slowest on.
+
+    python -m benchmarks.bench_motif_census --sessions 20 --comments 400 --authors 40
+"""
+
+import argparse
+import time
+
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import (
+    SIZES,
+    compute_motifs_randesu,
+    motif_census,
+    to_session_igraph,
+)
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--comments", type=int, default=400)
+    parser.add_argument("--authors", type=int, default=40)
+    args = parser.parse_args()
+
+    igraphs = [
+        to_session_igraph(build_session_graph(session, comments, True))
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    edges = sum(g.ecount() for g in igraphs) / len(igraphs)
+    print(f"{edges:,.0f} edges/session")
+    for size in SIZES:
+        start = time.perf_counter()
+        callback_total = sum(
+            sum(len(v) for v in compute_motifs_randesu(g, size).values())
+            for g in igraphs
+        )
+        callback_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        census_total = sum(int(motif_census(g, size).sum()) for g in igraphs)
+        census_seconds = time.perf_counter() - start
+
+        assert census_total == callback_total
+        print(
+            f"size {size}: {census_total / len(igraphs):,.0f} motifs/session  "
+            f"callback {1e3 * callback_seconds / len(igraphs):.1f} ms/session  "
+            f"census {1e3 * census_seconds / len(igraphs):.1f} ms/session  "
+            f"({callback_seconds / census_seconds:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
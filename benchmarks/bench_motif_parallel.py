@@ -0,0 +1,48 @@
+# pyright: basic
+"""
+Motif row throughput of motif_rows for an increasing number of workers.
+
+    python -m benchmarks.bench_motif_parallel --sessions 2000 --workers 1 2 4 8
+"""
+
+import argparse
+import time
+
+from src.compact_graph import serialize_session_graph
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import motif_rows
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=20)
+    parser.add_argument("--authors", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    blobs = [
+        serialize_session_graph(build_session_graph(session, comments, True), "compact")
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        num_rows = sum(
+            len(chunk.plain_rows) + len(chunk.flavored_rows)
+            for chunk in motif_rows(blobs, workers, args.batch_size)
+        )
+        seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        print(
+            f"{workers:>3} workers: {num_rows:,} rows in {seconds:.2f}s  "
+            f"({len(blobs) / seconds:.0f} sessions/s, {baseline / seconds:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# pyright: basic
+"""
+Exact versus sampled aggregate motif counts of one dense session: time, and
+the estimated occurrences per size against the exact ones.
+
+    python -m benchmarks.bench_motif_sampling --comments 200 --authors 40 --max-occurrences 100000
+"""
+
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+from src.compact_graph import CompactSessionGraph
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import (
+    SIZES,
+    MotifSampling,
+    count_confidence_interval,
+    estimate_motif_occurrences,
+    motif_rows,
+)
+from tests.synthetic import synthetic_session
+
+
+def occurrence_totals(chunk) -> tuple[Counter, dict[int, float]]:
+    """
+    Sampled occurrences per size, and the size's sampling probability.
+    """
+    # All six flavors of an occurrence are counted, size totals are 6x.
+    totals: Counter = Counter()
+    for row in chunk.count_rows:
+        totals[row["size"]] += row["hash_count"]
+    for size in totals:
+        totals[size] //= 6
+    probabilities = {size: probability for _, size, probability in chunk.sampled}
+    return totals, probabilities
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--authors", type=int, default=40)
+    parser.add_argument("--max-occurrences", type=int, default=100_000)
+    args = parser.parse_args()
+
+    session, comments = synthetic_session(
+        0, args.comments, args.authors, np.random.default_rng(0)
+    )
+    session_G = CompactSessionGraph.from_session_digraph(
+        build_session_graph(session, comments, True)
+    )
+    blob = session_G.to_bytes()
+    print(f"{session_G.num_nodes} nodes, {session_G.num_edges} edges")
+
+    start = time.perf_counter()
+    (exact,) = motif_rows([blob], aggregate=True, sampling=None)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    (sampled,) = motif_rows(
+        [blob], aggregate=True, sampling=MotifSampling(args.max_occurrences)
+    )
+    sampled_seconds = time.perf_counter() - start
+    print(f"exact {exact_seconds:.1f}s, sampled {sampled_seconds:.1f}s")
+
+    exact_totals, _ = occurrence_totals(exact)
+    sampled_totals, probabilities = occurrence_totals(sampled)
+    for size in SIZES:
+        probability = probabilities.get(size, 1.0)
+        low, high = count_confidence_interval(sampled_totals[size], probability)
+        estimate = estimate_motif_occurrences(
+            session_G.edges, session_G.num_nodes, size
+        )
+        print(
+            f"size {size}: exact {exact_totals[size]:,.0f}, degree bound "
+            f"{estimate:,.0f}, p {probability:.3g}, sampled estimate "
+            f"{sampled_totals[size] / probability:,.0f} [{low:,.0f}, {high:,.0f}]"
+        )
+
+
+if __name__ == "__main__":
+    main()
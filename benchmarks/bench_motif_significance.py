@@ -0,0 +1,58 @@
+# pyright: basic
+"""
+Null-model z-score throughput of significance_rows for an increasing number
+of workers and ensemble sizes, with the peak RSS of the parent process.
+
+    python -m benchmarks.bench_motif_significance --sessions 200 --ensembles 50 200 --workers 1 4
+"""
+
+import argparse
+import time
+
+import psutil
+
+from src.compact_graph import serialize_session_graph
+from src.motif_significance import significance_rows
+from src.pickle_sessions import build_session_graph
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--comments", type=int, default=30)
+    parser.add_argument("--authors", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--ensembles", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    blobs = [
+        serialize_session_graph(build_session_graph(session, comments, True), "compact")
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    process = psutil.Process()
+    for ensemble_size in args.ensembles:
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            num_rows = sum(
+                len(rows)
+                for rows in significance_rows(
+                    blobs, workers, args.batch_size, ensemble_size=ensemble_size
+                )
+            )
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            print(
+                f"ensemble {ensemble_size:>4}, {workers:>2} workers: {num_rows:,} "
+                f"rows in {seconds:.2f}s ({len(blobs) * ensemble_size / seconds:,.0f} "
+                f"randomizations/s, {baseline / seconds:.1f}x), "
+                f"rss {process.memory_info().rss / 2**20:.0f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# pyright: basic
+"""
+Build time, retained memory and igraph export time of the session graph engines.
+
+Memory is what tracemalloc still sees allocated once the graphs are built, so it
+is the per-session footprint held until the rows are written.
+
+    python -m benchmarks.bench_session_graph_engines --sessions 500 --comments 200
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from src.pickle_sessions import GRAPH_ENGINES, build_session_graph
+from src.redo_count_motifs import to_session_igraph
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--authors", type=int, default=80)
+    args = parser.parse_args()
+
+    session_comments = list(
+        synthetic_sessions(args.sessions, args.comments, args.authors)
+    )
+    for engine in GRAPH_ENGINES:
+        tracemalloc.start()
+        start = time.perf_counter()
+        session_graphs = [
+            build_session_graph(session, comments, True, engine=engine)
+            for session, comments in session_comments
+        ]
+        # Statistics are part of every row, include computing them.
+        for session_G in session_graphs:
+            _ = session_G.bully_score_weighted
+        build_seconds = time.perf_counter() - start
+        retained_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for session_G in session_graphs:
+            to_session_igraph(session_G)
+        export_seconds = time.perf_counter() - start
+
+        n = len(session_graphs)
+        print(
+            f"{engine:>8}: build {1e3 * build_seconds / n:.3f} ms/session  "
+            f"memory {retained_bytes / n:>10,.0f} bytes/session  "
+            f"igraph {1e3 * export_seconds / n:.3f} ms/session"
+        )
+        del session_graphs
+
+
+if __name__ == "__main__":
+    main()
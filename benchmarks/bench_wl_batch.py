@@ -0,0 +1,86 @@
+# pyright: basic
+"""
+Per-motif WL hashing versus weisfeiler_lehman_hashes_batch over every motif
+occurrence of a set of session graphs, per flavor.
+
+    python -m benchmarks.bench_wl_batch --sessions 200 --comments 30 --authors 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_hash_backends import labeled_motifs
+from src.graph_hashing import (
+    weisfeiler_lehman_hash_from_edges,
+    weisfeiler_lehman_hashes_batch,
+)
+from src.pickle_sessions import build_session_graph
+from tests.synthetic import synthetic_sessions
+
+
+def batch_arrays(motifs):
+    offsets = np.cumsum([0] + [len(node_labels) for node_labels, _, _ in motifs])
+    edges = np.array(
+        [
+            (u + offset, v + offset)
+            for offset, (_, motif_edges, _) in zip(offsets, motifs)
+            for u, v in motif_edges
+        ]
+    )
+    graph_ids = np.repeat(np.arange(len(motifs)), np.diff(offsets))
+    node_labels = [label for labels, _, _ in motifs for label in labels]
+    edge_labels = (
+        None
+        if motifs[0][2] is None
+        else [label for _, _, labels in motifs for label in labels]
+    )
+    return edges, graph_ids, node_labels, edge_labels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--comments", type=int, default=30)
+    parser.add_argument("--authors", type=int, default=10)
+    args = parser.parse_args()
+
+    session_graphs = [
+        build_session_graph(session, comments, True)
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    population = labeled_motifs(session_graphs)
+
+    print(f"{'flavor':>18} {'motifs':>9} {'single':>8} {'batch':>8} {'batch ids':>9}")
+    for (node_flavor, edge_flavor), occurrences in population.items():
+        motifs = list(occurrences.elements())
+        start = time.perf_counter()
+        expected = [
+            weisfeiler_lehman_hash_from_edges(
+                list(node_labels),
+                list(edges),
+                None if edge_labels is None else list(edge_labels),
+            )
+            for node_labels, edges, edge_labels in motifs
+        ]
+        single_seconds = time.perf_counter() - start
+
+        arrays = batch_arrays(motifs)
+        start = time.perf_counter()
+        graph_hashes = weisfeiler_lehman_hashes_batch(*arrays)
+        batch_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        weisfeiler_lehman_hashes_batch(*arrays, digest=False)
+        ids_seconds = time.perf_counter() - start
+        assert graph_hashes == expected
+        print(
+            f"{node_flavor + '/' + edge_flavor:>18} {len(motifs):>9,} "
+            f"{single_seconds:>7.2f}s {batch_seconds:>7.2f}s {ids_seconds:>8.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# pyright: basic
+"""
+WL kernel on synthetic sessions: feature extraction and blockwise Gram time,
+plus peak RSS.
+
+    python -m benchmarks.bench_wl_kernel --sessions 5000 --comments 30 --authors 10
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import psutil
+
+from src.compact_graph import CompactSessionGraph
+from src.pickle_sessions import build_session_graph
+from src.wl_kernel import GRAM_BLOCK_SIZE, normalized_gram, wl_feature_matrix
+from tests.synthetic import synthetic_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5_000)
+    parser.add_argument("--comments", type=int, default=30)
+    parser.add_argument("--authors", type=int, default=10)
+    parser.add_argument("--block-size", type=int, default=GRAM_BLOCK_SIZE)
+    args = parser.parse_args()
+
+    session_graphs = [
+        CompactSessionGraph.from_session_digraph(
+            build_session_graph(session, comments, True)
+        )
+        for session, comments in synthetic_sessions(
+            args.sessions, args.comments, args.authors
+        )
+    ]
+    process = psutil.Process()
+
+    start = time.perf_counter()
+    _, features = wl_feature_matrix(session_graphs)
+    feature_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        normalized_gram(features, Path(directory) / "gram.npy", args.block_size)
+        gram_seconds = time.perf_counter() - start
+    print(
+        f"{args.sessions:,} sessions, {features.get_shape()[1]:,} WL labels, "
+        f"{features.nnz:,} nonzeros"
+    )
+    print(
+        f"features {feature_seconds:.2f}s, gram {gram_seconds:.2f}s, "
+        f"rss {process.memory_info().rss / 2**20:.0f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
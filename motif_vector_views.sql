@@ -13,3 +13,30 @@ GROUP BY
     flavored.node_flavor,
     flavored.edge_flavor,
     flavored.motif_hash;
+
+
+-- Same counts, written directly by find_and_insert_all_motifs(aggregate=True),
+-- so there is nothing to refresh. Counts of sampled sessions and of color-coded
+-- sizes are estimates, with the variance of the estimate and a 95% normal
+-- confidence interval.
+CREATE VIEW cyberbullying_motifs.aggregated_flavored_motif_counts AS
+SELECT
+    unit_id,
+    node_flavor,
+    edge_flavor,
+    motif_hash,
+    sum(hash_count / sampling_probability) AS hash_count,
+    sum(count_variance) AS count_variance,
+    greatest(
+        sum(hash_count / sampling_probability) - 1.959964 * sqrt(sum(count_variance)),
+        0
+    ) AS hash_count_low,
+    sum(hash_count / sampling_probability)
+        + 1.959964 * sqrt(sum(count_variance)) AS hash_count_high,
+    bool_or(sampling_probability <> 1) AS sampled
+FROM cyberbullying_motifs.motif_counts
+GROUP BY
+    unit_id,
+    node_flavor,
+    edge_flavor,
+    motif_hash;
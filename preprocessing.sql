@@ -196,6 +196,7 @@ CREATE OR REPLACE TABLE yoda_db.cyberbullying_motifs.session_digraphs (
 
     serialized_graph BLOB NOT NULL,
     is_true_graph BOOL NOT NULL,
+    ensemble_index INTEGER NOT NULL DEFAULT 0,
 
     num_nodes INTEGER NOT NULL DEFAULT 0,
     num_edges INTEGER NOT NULL DEFAULT 0,
@@ -255,3 +256,46 @@ CREATE OR REPLACE TABLE yoda_db.cyberbullying_motifs.flavored_motifs (
   motif_hash TEXT NOT NULL,
   serialized_motif BLOB NOT NULL
 );
+
+
+CREATE OR REPLACE TABLE yoda_db.cyberbullying_motifs.motif_counts (
+  unit_id BIGINT NOT NULL,
+  size INTEGER NOT NULL,
+  node_flavor TEXT NOT NULL,
+  edge_flavor TEXT NOT NULL,
+  motif_hash TEXT NOT NULL,
+  hash_count BIGINT NOT NULL,
+  -- 1 unless the session was sampled or color coded, hash_count /
+  -- sampling_probability estimates the occurrences with variance
+  -- count_variance. Color-coded counts sum over several colorings, their
+  -- sampling_probability can exceed 1.
+  sampling_probability DOUBLE PRECISION NOT NULL DEFAULT 1.0,
+  count_variance DOUBLE PRECISION NOT NULL DEFAULT 0.0
+);
+
+
+CREATE OR REPLACE TABLE yoda_db.cyberbullying_motifs.motif_significance (
+  unit_id BIGINT NOT NULL,
+  size INTEGER NOT NULL,
+  iso_class INTEGER NOT NULL,
+  motif_count BIGINT NOT NULL,
+  -- Census moments over ensemble_size degree-preserving rewirings.
+  null_mean DOUBLE PRECISION NOT NULL,
+  null_std DOUBLE PRECISION NOT NULL,
+  -- NaN if the null model never varies but the real count differs.
+  z_score DOUBLE PRECISION NOT NULL,
+  -- z_score over the norm of the session's z-scores of this size.
+  significance DOUBLE PRECISION NOT NULL,
+  ensemble_size INTEGER NOT NULL,
+  PRIMARY KEY (unit_id, size, iso_class)
+);
+
+
+CREATE OR REPLACE TABLE yoda_db.cyberbullying_motifs.motif_catalog (
+  node_flavor TEXT NOT NULL,
+  edge_flavor TEXT NOT NULL,
+  motif_hash TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  serialized_motif BLOB NOT NULL,
+  PRIMARY KEY (node_flavor, edge_flavor, motif_hash)
+);
@@ -0,0 +1,415 @@
+# pyright: basic
+"""
+Estimated flavored motif counts for sizes igraph cannot enumerate:
+motifs_randesu only knows directed iso classes up to size 4, and there are
+tens of millions of 5 vertex and billions of 6 vertex occurrences in the
+big sessions.
+
+Finding the connected vertex sets with ESU takes about a microsecond each,
+flavoring and hashing one takes a few hundred, so only a sample is flavored.
+Each set is kept independently with a probability q chosen from the error
+bound, see ColorCoding.keep_probability, and hash_count / q is unbiased with
+variance hash_count (1 - q) / q^2, like the RAND-ESU sampling of the
+smaller sizes.
+
+Sessions with too many sets to even enumerate, as estimated from the colorful
+sets of a first coloring once there are more than a million, are color coded:
+every vertex gets one of size random colors and only colorful sets, whose
+vertices all have different colors, are enumerated, the search is cut as soon
+as a color repeats. A set is colorful with probability p = size! / size^size (0.038 for
+size 5, 0.015 for size 6). Summed over R colorings, hash_count / (R p q)
+estimates the occurrences, the spread across colorings gives the variance.
+Colorings are correlated through shared vertices, so they are drawn until the
+spread is within the error bound, see ColorCoding.converged.
+"""
+
+import itertools
+import math
+import random
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from uuid import uuid4
+
+import igraph as ig
+import numpy as np
+
+from src import graph_hashing
+from src.compact_graph import CompactSessionGraph
+from src.flavored_motif_graph import (
+    EDGE_FLAVORS,
+    NODE_FLAVORS,
+    FlavoredMotifGraph,
+    FlavoredMotifLabeler,
+)
+from src.plain_motif_graph import PlainMotifGraph
+
+COLOR_CODING_SIZES = (5,)
+# Connected vertex sets of one size up to which a session is enumerated
+# rather than color coded, about a minute of ESU.
+MAX_ENUMERATED_OCCURRENCES = 50_000_000
+# Connected vertex sets of one size up to which they are counted to choose
+# between enumerating and color coding, about a second of ESU. Beyond it the
+# count is estimated from the colorful sets of one coloring.
+MAX_COUNTED_OCCURRENCES = 1_000_000
+# Two-sided 95% normal quantile, as redo_count_motifs.CONFIDENCE_Z.
+CONFIDENCE_Z = 1.959964
+# igraph has no directed iso classes above size 4.
+NO_ISO_CLASS = -1
+
+
+def colorful_probability(size: int) -> float:
+    """
+    Probability that size vertices get size different colors.
+    """
+    return math.factorial(size) / size**size
+
+
+def undirected_neighbors(edges: np.ndarray, num_nodes: int) -> list[list[int]]:
+    """
+    Sorted neighbor lists of the simple undirected graph under edges.
+    """
+    pairs = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+    arcs = np.concatenate([pairs, pairs[:, ::-1]])
+    arcs = arcs[np.lexsort((arcs[:, 1], arcs[:, 0]))]
+    bounds = np.searchsorted(arcs[:, 0], np.arange(num_nodes + 1))
+    targets = arcs[:, 1].tolist()
+    return [
+        targets[start:stop] for start, stop in zip(bounds[:-1], bounds[1:].tolist())
+    ]
+
+
+def connected_subgraphs(
+    neighbors: list[list[int]], size: int, colors: np.ndarray | None = None
+) -> Iterator[tuple[int, ...]]:
+    """
+    Vertex sets of the connected size vertex subgraphs, each exactly once, by
+    ESU (Wernicke 2006) on undirected neighbor lists. With colors, only the
+    colorful sets, and a branch is cut as soon as it repeats a color.
+
+    ESU extends a set only by vertices above its smallest one that are not
+    adjacent to the set before the last added vertex, marks counts how many
+    set vertices a vertex is in the closed neighborhood of.
+    """
+    num_nodes = len(neighbors)
+    if colors is None:
+        color_bits = [0] * num_nodes
+    else:
+        color_bits = [1 << color for color in colors.tolist()]
+    marks = [0] * num_nodes
+
+    def extend(
+        subgraph: tuple[int, ...], used: int, extension: list[int], root: int
+    ) -> Iterator[tuple[int, ...]]:
+        if len(subgraph) == size - 1:
+            for w in extension:
+                yield (*subgraph, w)
+            return
+        while extension:
+            w = extension.pop()
+            w_used = used | color_bits[w]
+            next_extension = [u for u in extension if not w_used & color_bits[u]]
+            for u in neighbors[w]:
+                if u > root and not marks[u] and not w_used & color_bits[u]:
+                    next_extension.append(u)
+            for u in neighbors[w]:
+                marks[u] += 1
+            yield from extend((*subgraph, w), w_used, next_extension, root)
+            for u in neighbors[w]:
+                marks[u] -= 1
+
+    for root in range(num_nodes):
+        marks[root] += 1
+        for u in neighbors[root]:
+            marks[u] += 1
+        extension = [
+            u
+            for u in neighbors[root]
+            if u > root and not color_bits[root] & color_bits[u]
+        ]
+        yield from extend((root,), color_bits[root], extension, root)
+        marks[root] -= 1
+        for u in neighbors[root]:
+            marks[u] -= 1
+
+
+def _relative_half_width(hash_count: int, squared_count: int, num_colorings: int):
+    """
+    Confidence half-width over the mean of one count across colorings.
+    """
+    if hash_count == 0:
+        return 0.0
+    mean = hash_count / num_colorings
+    variance = (squared_count - hash_count * mean) / (num_colorings - 1)
+    return CONFIDENCE_Z * math.sqrt(max(variance, 0.0) / num_colorings) / mean
+
+
+@dataclass(frozen=True)
+class ColorCoding:
+    """
+    Which motif sizes aggregate mode estimates, and to what precision.
+
+    The error bound is on flavored motifs that make up at least min_share of
+    a session's occurrences: their 95% confidence interval should be within
+    relative_error of the estimate. Sessions estimated to have more than
+    max_enumerated_occurrences connected sets, from the colorful sets of one
+    coloring, are color coded, with at least min_colorings and at most
+    max_colorings colorings. Rarer motifs are
+    counted by the same sample, their count_variance tells how far to trust
+    them. Sampling and colorings are seeded per (seed, unit_id, size).
+    """
+
+    sizes: tuple[int, ...] = COLOR_CODING_SIZES
+    relative_error: float = 0.1
+    min_share: float = 0.01
+    max_enumerated_occurrences: int = MAX_ENUMERATED_OCCURRENCES
+    min_colorings: int = 3
+    max_colorings: int = 16
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.min_colorings < 2:
+            raise ValueError("Color coding needs two colorings for a variance")
+        if self.max_colorings < self.min_colorings:
+            raise ValueError("max_colorings is below min_colorings")
+
+    def keep_probability(self, num_occurrences: int) -> float:
+        """
+        Smallest q with z sqrt((1 - q) / (q n)) <= relative_error for the
+        n = min_share num_occurrences occurrences of a frequent motif. Above
+        one half every occurrence is flavored, sampling would not save enough
+        work to be worth its noise.
+        """
+        target = (
+            self.relative_error**2 * self.min_share * num_occurrences / CONFIDENCE_Z**2
+        )
+        if target <= 1.0:
+            return 1.0
+        return 1.0 / (1.0 + target)
+
+    def converged(self, counts: "ColorCodingCounts") -> bool:
+        num_colorings = counts.num_colorings
+        if num_colorings < self.min_colorings:
+            return False
+        if num_colorings >= self.max_colorings:
+            return True
+        total = counts.total_count
+        if (
+            _relative_half_width(total, counts.total_squared_count, num_colorings)
+            > self.relative_error
+        ):
+            return False
+        # Every flavor splits the same total.
+        min_count = self.min_share * total
+        return all(
+            _relative_half_width(hash_count, counts.squared_counts[key], num_colorings)
+            <= self.relative_error
+            for key, hash_count in counts.hash_counts.items()
+            if hash_count >= min_count
+        )
+
+
+@dataclass
+class ColorCodingCounts:
+    """
+    Sampled flavored motif counts of one session and size.
+
+    Keys are (node_flavor, edge_flavor, motif_hash). Occurrences were kept
+    with keep_probability, in num_colorings colorings or, if 0, among all
+    of them. For colorings, hash_counts and squared_counts hold the sum and
+    the sum of squares of the per-coloring counts, total_count and
+    total_squared_count the same for the number of kept occurrences.
+    """
+
+    unit_id: int
+    size: int
+    keep_probability: float = 1.0
+    num_colorings: int = 0
+    hash_counts: Counter[tuple[str, str, str]] = field(default_factory=Counter)
+    squared_counts: Counter[tuple[str, str, str]] = field(default_factory=Counter)
+    total_count: int = 0
+    total_squared_count: int = 0
+    # One flavored occurrence per key, to serialize into the motif catalog.
+    representatives: dict[tuple[str, str, str], FlavoredMotifGraph] = field(
+        default_factory=dict
+    )
+
+    @property
+    def sampling_probability(self) -> float:
+        """
+        Expected number of times an occurrence is counted, so that
+        hash_count / sampling_probability estimates the occurrences. Above 1
+        for many colorings.
+        """
+        if self.num_colorings == 0:
+            return self.keep_probability
+        return (
+            self.num_colorings * colorful_probability(self.size) * self.keep_probability
+        )
+
+    def count_variance(self, key: tuple[str, str, str]) -> float:
+        """
+        Variance of hash_counts[key] / sampling_probability. Binomial without
+        colorings, from the spread of the per-coloring estimates with them.
+        """
+        hash_count = self.hash_counts[key]
+        num_colorings = self.num_colorings
+        if num_colorings == 0:
+            probability = self.keep_probability
+            return hash_count * (1 - probability) / probability**2
+        variance = (self.squared_counts[key] - hash_count**2 / num_colorings) / (
+            num_colorings - 1
+        )
+        probability = colorful_probability(self.size) * self.keep_probability
+        return max(variance, 0.0) / (num_colorings * probability**2)
+
+    def add_coloring(self, coloring_counts: Counter[tuple[str, str, str]]) -> None:
+        self.num_colorings += 1
+        for key, hash_count in coloring_counts.items():
+            self.hash_counts[key] += hash_count
+            self.squared_counts[key] += hash_count**2
+        # Every occurrence is counted once per flavor.
+        occurrences = sum(coloring_counts.values()) // (
+            len(NODE_FLAVORS) * len(EDGE_FLAVORS)
+        )
+        self.total_count += occurrences
+        self.total_squared_count += occurrences**2
+
+
+def _kept(
+    vertex_sets: Iterable[tuple[int, ...]],
+    keep_probability: float,
+    draw: Callable[[], float],
+) -> Iterable[tuple[int, ...]]:
+    if keep_probability >= 1.0:
+        return vertex_sets
+    return (vertices for vertices in vertex_sets if draw() < keep_probability)
+
+
+def count_flavored_motifs(
+    session_igraph: ig.Graph,
+    labeler: FlavoredMotifLabeler,
+    unit_id: int,
+    size: int,
+    vertex_sets: Iterable[tuple[int, ...]],
+    representatives: dict[tuple[str, str, str], FlavoredMotifGraph] | None = None,
+) -> Counter[tuple[str, str, str]]:
+    """
+    (node_flavor, edge_flavor, motif_hash) counts of the motif occurrences on
+    vertex_sets, storing the first occurrence of every key in representatives.
+    Only those get a motif graph.
+    """
+    counts: Counter[tuple[str, str, str]] = Counter()
+    for vertices in vertex_sets:
+        graph_hashes, _, _, _ = labeler.flavor_hashes(vertices)
+        keys = [(*flavors, graph_hash) for flavors, graph_hash in graph_hashes.items()]
+        counts.update(keys)
+        if representatives is None or all(key in representatives for key in keys):
+            continue
+        motif_sub_graph = session_igraph.induced_subgraph(vertices)
+        plain_graph_hash = graph_hashing.motif_hash_cache.get(
+            ("plain", size, tuple(motif_sub_graph.get_edgelist())),
+            lambda motif_sub_graph=motif_sub_graph: graph_hashing.motif_graph_hash(
+                motif_sub_graph
+            ),
+        )
+        plain_motif = PlainMotifGraph(
+            uuid4(),
+            unit_id,
+            size,
+            NO_ISO_CLASS,
+            motif_sub_graph,
+            plain_graph_hash,
+            vertices,
+        )
+        for flavored_motif in labeler.flavor(plain_motif):
+            key = (
+                flavored_motif.node_flavor,
+                flavored_motif.edge_flavor,
+                flavored_motif.graph_hash,
+            )
+            representatives.setdefault(key, flavored_motif)
+    return counts
+
+
+def exact_flavored_counts(
+    session_G: CompactSessionGraph, size: int
+) -> Counter[tuple[str, str, str]]:
+    """
+    Flavored motif counts of every connected size vertex set, for checking
+    estimates on sessions small enough to flavor completely.
+    """
+    session_igraph = session_G.to_igraph()
+    return count_flavored_motifs(
+        session_igraph,
+        FlavoredMotifLabeler(session_igraph),
+        session_G.unit_id,
+        size,
+        connected_subgraphs(
+            undirected_neighbors(session_G.edges, session_G.num_nodes), size
+        ),
+    )
+
+
+def color_coding_counts(
+    session_G: CompactSessionGraph, size: int, color_coding: ColorCoding
+) -> ColorCodingCounts:
+    """
+    Flavored size motif counts of one session, sampled within the error bound
+    of color_coding, and color coded if there are too many to enumerate.
+    """
+    session_igraph = session_G.to_igraph()
+    labeler = FlavoredMotifLabeler(session_igraph)
+    neighbors = undirected_neighbors(session_G.edges, session_G.num_nodes)
+    unit_id = session_G.unit_id
+    draw = random.Random(f"{color_coding.seed}-{unit_id}-{size}").random
+    counts = ColorCodingCounts(unit_id, size)
+
+    # Up to MAX_COUNTED_OCCURRENCES the sets are counted, beyond that they
+    # are estimated from the colorful sets of the first coloring, at a
+    # fraction of the cost of counting them all.
+    rng = np.random.default_rng([color_coding.seed, unit_id, size])
+    colors = rng.integers(size, size=session_G.num_nodes)
+    num_colorful = sum(1 for _ in connected_subgraphs(neighbors, size, colors))
+    num_occurrences = sum(
+        1
+        for _ in itertools.islice(
+            connected_subgraphs(neighbors, size), MAX_COUNTED_OCCURRENCES + 1
+        )
+    )
+    if num_occurrences > MAX_COUNTED_OCCURRENCES:
+        num_occurrences = round(num_colorful / colorful_probability(size))
+    if num_occurrences <= color_coding.max_enumerated_occurrences:
+        counts.keep_probability = color_coding.keep_probability(num_occurrences)
+        counts.hash_counts = count_flavored_motifs(
+            session_igraph,
+            labeler,
+            unit_id,
+            size,
+            _kept(connected_subgraphs(neighbors, size), counts.keep_probability, draw),
+            counts.representatives,
+        )
+        counts.total_count = sum(counts.hash_counts.values()) // (
+            len(NODE_FLAVORS) * len(EDGE_FLAVORS)
+        )
+        return counts
+
+    counts.keep_probability = color_coding.keep_probability(num_colorful)
+    while not color_coding.converged(counts):
+        counts.add_coloring(
+            count_flavored_motifs(
+                session_igraph,
+                labeler,
+                unit_id,
+                size,
+                _kept(
+                    connected_subgraphs(neighbors, size, colors),
+                    counts.keep_probability,
+                    draw,
+                ),
+                counts.representatives,
+            )
+        )
+        colors = rng.integers(size, size=session_G.num_nodes)
+    return counts
@@ -0,0 +1,234 @@
+# pyright: basic
+import pickle
+import struct
+from dataclasses import dataclass
+
+import igraph as ig
+import numpy as np
+
+ROLES = (
+    "main_victim",
+    "non_aggressive_victim",
+    "aggressive_victim",
+    "aggressive_defender",
+    "non_aggressive_defender:support_of_the_victim",
+    "non_aggressive_defender:direct_to_the_bully",
+    "bully",
+    "bully_assistant",
+)
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+# Same layers GraphBuilder assigns to each role.
+ROLE_LAYERS = (0.0, 0.5, 0.5, -1.0, -1.0, -1.0, 1.0, 1.0)
+
+EDGE_TYPES = (
+    "aggressive_victim->bully",
+    "non_aggressive_defender:direct_to_the_bully->bully",
+    "bully->victim",
+    "bully_assistant->victim",
+    "non_aggressive_defender:support_of_the_victim->victim",
+    "aggressive_defender->victim",
+    "victim->aggressive_defender",
+)
+EDGE_TYPE_CODES = {type_: code for code, type_ in enumerate(EDGE_TYPES)}
+NO_EDGE_TYPE = -1
+
+SERIALIZATION_FORMATS = ["pickle", "compact"]
+
+MAGIC = b"SDGC"
+FORMAT_VERSION = 1
+# magic, version, unit_id, is_true_graph, num_likes, num_bullying_comments,
+# num_comments, num_nodes, num_edges, main_victim, topic vector length
+_HEADER = struct.Struct("<4sBq?qqqIIiI")
+
+
+@dataclass
+class CompactSessionGraph:
+    """
+    Columnar layout of a session digraph.
+
+    Nodes are integer ids into role_codes, edges are (source, target) rows of
+    edges with matching weights and edge_types entries. Author names, comment
+    ids and the owner comment are not kept, the motif pipeline never reads them.
+    """
+
+    unit_id: int
+    is_true_graph: bool
+    num_likes: int
+    num_bullying_comments: int
+    num_comments: int
+    topic_vector: np.ndarray
+    role_codes: np.ndarray
+    edges: np.ndarray
+    weights: np.ndarray
+    edge_types: np.ndarray
+    main_victim: int = -1
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.role_codes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.weights)
+
+    @classmethod
+    def from_session_digraph(cls, session_G) -> "CompactSessionGraph":
+        node_ids = {node: i for i, node in enumerate(session_G.nodes)}
+        role_codes = np.array(
+            [ROLE_CODES[type_] for _, type_ in session_G.nodes(data="type")],
+            dtype=np.uint8,
+        )
+        edge_data = list(session_G.edges(data=True))
+        edges = np.array(
+            [(node_ids[u], node_ids[v]) for u, v, _ in edge_data], dtype=np.int32
+        ).reshape(-1, 2)
+        weights = np.array(
+            [data["weight"] for _, _, data in edge_data], dtype=np.float64
+        )
+        edge_types = np.array(
+            [
+                EDGE_TYPE_CODES.get(data.get("type"), NO_EDGE_TYPE)
+                for _, _, data in edge_data
+            ],
+            dtype=np.int8,
+        )
+        main_victim = getattr(session_G, "_main_victim", None)
+        return cls(
+            unit_id=session_G.unit_id,
+            is_true_graph=session_G.is_true_graph,
+            num_likes=session_G.num_likes,
+            num_bullying_comments=session_G.num_bullying_comments,
+            num_comments=session_G.num_comments,
+            topic_vector=np.asarray(session_G.topic_vector, dtype=np.int32),
+            role_codes=role_codes,
+            edges=edges,
+            weights=weights,
+            edge_types=edge_types,
+            main_victim=node_ids.get(main_victim, -1),
+        )
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            self.unit_id,
+            self.is_true_graph,
+            self.num_likes,
+            self.num_bullying_comments,
+            self.num_comments,
+            self.num_nodes,
+            self.num_edges,
+            self.main_victim,
+            len(self.topic_vector),
+        )
+        return b"".join(
+            [
+                header,
+                np.ascontiguousarray(self.topic_vector, dtype="<i4").tobytes(),
+                np.ascontiguousarray(self.role_codes, dtype=np.uint8).tobytes(),
+                np.ascontiguousarray(self.edges, dtype="<i4").tobytes(),
+                np.ascontiguousarray(self.weights, dtype="<f8").tobytes(),
+                np.ascontiguousarray(self.edge_types, dtype=np.int8).tobytes(),
+            ]
+        )
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "CompactSessionGraph":
+        (
+            magic,
+            version,
+            unit_id,
+            is_true_graph,
+            num_likes,
+            num_bullying_comments,
+            num_comments,
+            num_nodes,
+            num_edges,
+            main_victim,
+            topic_length,
+        ) = _HEADER.unpack_from(blob)
+        if magic != MAGIC:
+            raise ValueError("Blob is not a compact session graph.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact graph version {version}")
+        offset = _HEADER.size
+
+        def take(dtype: str, count: int) -> np.ndarray:
+            nonlocal offset
+            array = np.frombuffer(blob, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        topic_vector = take("<i4", topic_length)
+        role_codes = take("u1", num_nodes)
+        edges = take("<i4", 2 * num_edges).reshape(-1, 2)
+        weights = take("<f8", num_edges)
+        edge_types = take("i1", num_edges)
+        return cls(
+            unit_id=unit_id,
+            is_true_graph=is_true_graph,
+            num_likes=num_likes,
+            num_bullying_comments=num_bullying_comments,
+            num_comments=num_comments,
+            topic_vector=topic_vector,
+            role_codes=role_codes,
+            edges=edges,
+            weights=weights,
+            edge_types=edge_types,
+            main_victim=main_victim,
+        )
+
+    def to_igraph(self) -> ig.Graph:
+        """
+        Build the igraph graph straight from the arrays.
+
+        Vertex and edge order, plus the type/layer/weight attributes, match
+        ig.Graph.from_networkx on the original SessionDiGraph.
+        """
+        return igraph_from_arrays(
+            self.role_codes, self.edges, self.weights, self.edge_types
+        )
+
+
+def igraph_from_arrays(
+    role_codes: np.ndarray,
+    edges: np.ndarray,
+    weights: np.ndarray,
+    edge_types: np.ndarray,
+) -> ig.Graph:
+    return ig.Graph(
+        n=len(role_codes),
+        edges=edges.tolist(),
+        directed=True,
+        vertex_attrs={
+            "type": [ROLES[code] for code in role_codes],
+            "layer": [ROLE_LAYERS[code] for code in role_codes],
+        },
+        edge_attrs={
+            "weight": weights.tolist(),
+            "type": [
+                EDGE_TYPES[code] if code != NO_EDGE_TYPE else None
+                for code in edge_types
+            ],
+        },
+    )
+
+
+def serialize_session_graph(session_G, serialization: str = "pickle") -> bytes:
+    if serialization == "pickle":
+        return pickle.dumps(session_G, protocol=pickle.HIGHEST_PROTOCOL)
+    elif serialization == "compact":
+        if hasattr(session_G, "to_compact"):
+            return session_G.to_compact().to_bytes()
+        return CompactSessionGraph.from_session_digraph(session_G).to_bytes()
+    else:
+        raise ValueError(f"Unknown serialization {serialization}")
+
+
+def load_session_graph(blob: bytes):
+    """
+    Load a serialized_graph blob in either format, keyed off the magic prefix.
+    """
+    if blob[: len(MAGIC)] == MAGIC:
+        return CompactSessionGraph.from_bytes(blob)
+    return pickle.loads(blob)
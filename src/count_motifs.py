@@ -9,6 +9,7 @@ from loguru import logger
 
 from src import database
 from src import graph_hashing
+from src.compact_graph import CompactSessionGraph
 from src.plain_motif_graph import PlainMotifGraph
 from src.flavored_motif_graph import FlavoredMotifGraph
 from src.session_digraph import SessionDiGraph
@@ -28,13 +29,16 @@ def compute_motifs_randesu(
 
 
 def find_session_graph_plain_motifs(
-    session_G: SessionDiGraph,
+    session_G: SessionDiGraph | CompactSessionGraph,
     size: int,
 ) -> list[PlainMotifGraph]:
     """
     Transform and store the found motifs for the associated unit_id session digraph.
     """
-    session_igraph = ig.Graph.from_networkx(session_G)
+    if isinstance(session_G, SessionDiGraph):
+        session_igraph = ig.Graph.from_networkx(session_G)
+    else:
+        session_igraph = session_G.to_igraph()
     unit_id = session_G.unit_id
     motifies_vertices = compute_motifs_randesu(session_igraph, size)
     motifs: dict[int, PlainMotifGraph] = {}
@@ -52,7 +56,7 @@ def find_session_graph_plain_motifs(
                     iso_class,
                     motif_sub_graph,
                     motif_graph_hash,
-                    1,
+                    count=1,
                 )
                 motifs[iso_class] = motif
             else:
@@ -63,7 +67,9 @@ def find_session_graph_plain_motifs(
     return [motif for _, motif in motifs.items()]
 
 
-def find_plain_motifs(session_graphs: list[SessionDiGraph]) -> list[PlainMotifGraph]:
+def find_plain_motifs(
+    session_graphs: list[SessionDiGraph | CompactSessionGraph],
+) -> list[PlainMotifGraph]:
     SIZES = [3, 4]
     plain_motifs: list[PlainMotifGraph] = []
     for session_G in session_graphs:
@@ -1,13 +1,22 @@
-import pickle
+import itertools
 import os
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import Any, cast
+from operator import attrgetter
+from typing import Any, LiteralString, cast
+from uuid import UUID
 
 import psycopg
+from loguru import logger
 from psycopg import sql
 from psycopg.rows import class_row
+from psycopg_pool import ConnectionPool
 
 from src.author_role import AuthorRole
+from src.compact_graph import CompactSessionGraph, load_session_graph
 from src.session import Session
 from src.session_digraph import SessionDiGraph
 from src.flavored_motif_graph import FlavoredMotifGraph
@@ -26,12 +35,181 @@ PASSWORD = "Fame4-Hangup9-Reconfirm1-Utter5-Zoom4"
 
 URI = f"postgresql://{USER}:{PASSWORD}@{HOST}:{PORT}/{DATABASE}"
 
+COPY_CHUNK_SIZE = 10_000
+COMMENT_ITERSIZE = 10_000
+GRAPH_ITERSIZE = 1_000
+
+SESSION_DIGRAPHS_TABLE = "cyberbullying_motifs.session_digraphs"
+PLAIN_MOTIFS_TABLE = "cyberbullying_motifs.plain_motifs"
+FLAVORED_MOTIFS_TABLE = "cyberbullying_motifs.flavored_motifs"
+MOTIF_COUNTS_TABLE = "cyberbullying_motifs.motif_counts"
+MOTIF_SIGNIFICANCE_TABLE = "cyberbullying_motifs.motif_significance"
+
+# (column, postgres type) pairs, binary COPY needs the exact column types.
+SESSION_DIGRAPH_COLUMNS = [
+    ("unit_id", "int4"),
+    ("serialized_graph", "bytea"),
+    ("is_true_graph", "bool"),
+    ("ensemble_index", "int4"),
+    ("num_nodes", "int4"),
+    ("num_edges", "int4"),
+    ("num_bullies", "int4"),
+    ("num_victims", "int4"),
+    ("num_non_agg_victims", "int4"),
+    ("num_agg_victims", "int4"),
+    ("num_defenders", "int4"),
+    ("num_non_agg_defenders", "int4"),
+    ("num_agg_defenders", "int4"),
+    ("main_victim_in_deg", "float8"),
+    ("main_victim_weighted_in_deg", "float8"),
+    ("main_victim_out_deg", "float8"),
+    ("main_victim_weighted_out_deg", "float8"),
+    ("victim_avg_in_deg", "float8"),
+    ("victim_avg_weighted_in_deg", "float8"),
+    ("victim_avg_out_deg", "float8"),
+    ("victim_avg_weighted_out_deg", "float8"),
+    ("victim_score", "float8"),
+    ("victim_score_weighted", "float8"),
+    ("bully_avg_in_deg", "float8"),
+    ("bully_avg_weighted_in_deg", "float8"),
+    ("bully_avg_out_deg", "float8"),
+    ("bully_avg_weighted_out_deg", "float8"),
+    ("bully_score", "float8"),
+    ("bully_score_weighted", "float8"),
+    ("main_victim_score", "float8"),
+    ("main_victim_score_weighted", "float8"),
+]
+PLAIN_MOTIF_COLUMNS = [
+    ("plain_motif_id", "uuid"),
+    ("unit_id", "int8"),
+    ("size", "int4"),
+    ("iso_class", "int4"),
+    ("motif_hash", "text"),
+    ("serialized_motif", "bytea"),
+]
+FLAVORED_MOTIF_COLUMNS = [
+    ("flavored_motif_id", "uuid"),
+    ("plain_motif_id", "uuid"),
+    ("node_flavor", "text"),
+    ("edge_flavor", "text"),
+    ("motif_hash", "text"),
+    ("serialized_motif", "bytea"),
+]
+MOTIF_COUNT_COLUMNS = [
+    ("unit_id", "int8"),
+    ("size", "int4"),
+    ("node_flavor", "text"),
+    ("edge_flavor", "text"),
+    ("motif_hash", "text"),
+    ("hash_count", "int8"),
+    ("sampling_probability", "float8"),
+    ("count_variance", "float8"),
+]
+MOTIF_SIGNIFICANCE_COLUMNS = [
+    ("unit_id", "int8"),
+    ("size", "int4"),
+    ("iso_class", "int4"),
+    ("motif_count", "int8"),
+    ("null_mean", "float8"),
+    ("null_std", "float8"),
+    ("z_score", "float8"),
+    ("significance", "float8"),
+    ("ensemble_size", "int4"),
+]
+
+POOL_MIN_SIZE = int(os.environ.get("PGPOOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.environ.get("PGPOOL_MAX_SIZE", "4"))
+
+_pool: ConnectionPool | None = None
+_stage_connection: ContextVar[psycopg.Connection | None] = ContextVar(
+    "_stage_connection", default=None
+)
+_connections_opened = 0
+_connections_lock = threading.Lock()
+
+
+def _count_new_connection(con: psycopg.Connection) -> None:
+    global _connections_opened
+    with _connections_lock:
+        _connections_opened += 1
+
+
+def connections_opened() -> int:
+    """
+    Number of server connections opened since the current pipeline run started.
+    """
+    return _connections_opened
+
+
+@contextmanager
+def pipeline_run(
+    min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE
+) -> Iterator[ConnectionPool]:
+    """
+    Share one connection pool across every query and insert of a pipeline run.
+
+    Outside of a pipeline run each call falls back to opening its own connection.
+    """
+    global _pool, _connections_opened
+    if _pool is not None:
+        raise RuntimeError("A pipeline run is already in progress.")
+    _connections_opened = 0
+    pool = ConnectionPool(
+        URI,
+        connection_class=psycopg.Connection,
+        min_size=min_size,
+        max_size=max_size,
+        check=ConnectionPool.check_connection,
+        configure=_count_new_connection,
+        open=False,
+    )
+    pool.open(wait=True)
+    _pool = pool
+    try:
+        yield pool
+    finally:
+        _pool = None
+        pool.close()
+        logger.info(
+            f"Pipeline run opened {_connections_opened} connections "
+            f"(pool min_size={min_size}, max_size={max_size})."
+        )
+
+
+@contextmanager
+def _connection(shared: bool = True) -> Iterator[psycopg.Connection]:
+    stage_con = _stage_connection.get() if shared else None
+    if stage_con is not None:
+        yield stage_con
+    elif _pool is not None:
+        with _pool.connection() as con:
+            yield con
+    else:
+        with psycopg.connect(URI) as con:
+            _count_new_connection(con)
+            yield con
+
+
+@contextmanager
+def stage() -> Iterator[psycopg.Connection]:
+    """
+    Pin a single connection for every database call made within a pipeline stage.
+    """
+    with _connection() as con:
+        token = _stage_connection.set(con)
+        try:
+            yield con
+        finally:
+            _stage_connection.reset(token)
+
 
 def _query_postgres[T](query_statement: str, cls: type[T]) -> list[T]:
-    with psycopg.connect(URI) as con:
-        with con.pipeline():
-            with con.cursor(row_factory=class_row(cls)) as cur:
-                rows = cur.execute(query_statement).fetchall()
+    with (
+        _connection() as con,
+        con.pipeline(),
+        con.cursor(row_factory=class_row(cls)) as cur,
+    ):
+        rows = cur.execute(query_statement).fetchall()
     return rows
 
 
@@ -42,41 +220,96 @@ def _insert_or_update_postgres(
     if len(rows) == 0:
         raise ValueError("No records were passed for an insertion.")
     sql_insert = sql.SQL(insert_statement)
-    with psycopg.connect(URI) as con:
-        with con.cursor() as cur:
-            cur.executemany(sql_insert, rows)
-            con.commit()
+    with _connection() as con, con.cursor() as cur:
+        cur.executemany(sql_insert, rows)
+        con.commit()
+
+
+def _copy_value(value: Any, type_: str) -> Any:  # pyright: ignore[reportExplicitAny]
+    # The to_dict producers stringify UUIDs, the binary uuid dumper needs the object.
+    if type_ == "uuid" and isinstance(value, str):
+        return UUID(value)
+    return value
+
+
+def _copy_postgres(
+    table: str,
+    columns: list[tuple[str, str]],
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+    chunk_size: int = COPY_CHUNK_SIZE,
+) -> int:
+    """
+    Bulk load rows with COPY ... FROM STDIN (FORMAT BINARY).
+
+    Rows are pulled from the iterable in chunks, so producers can stay lazy.
+    Everything is committed once at the end.
+    """
+    names = [name for name, _ in columns]
+    types = [type_ for _, type_ in columns]
+    copy_statement = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+        sql.Identifier(*table.split(".")),
+        sql.SQL(", ").join(sql.Identifier(name) for name in names),
+    )
+    num_rows = 0
+    with _connection() as con, con.cursor() as cur:
+        for chunk in itertools.batched(rows, chunk_size):
+            with cur.copy(copy_statement) as copy:
+                copy.set_types(types)
+                for row in chunk:
+                    copy.write_row(
+                        [_copy_value(row[name], type_) for name, type_ in columns]
+                    )
+            num_rows += len(chunk)
+        if num_rows == 0:
+            raise ValueError("No records were passed for an insertion.")
+        con.commit()
+    return num_rows
+
+
+def _comment_query(shuffle_comments: bool) -> LiteralString:
+    order = "random()" if shuffle_comments else "comment_created_at"
+    return f"""
+    SELECT 
+        unit_id,
+        comment_id,
+        comment_author AS author_name,
+        comment_created_at AS timestamp,
+        role,
+        severity
+    FROM cyberbullying_motifs.comments
+    ORDER BY unit_id, {order};
+    """
 
 
 def query_comments(shuffle_comments: bool = False) -> list[AuthorRole]:
-    if shuffle_comments:
-        comment_query = """
-        SELECT 
-            unit_id,
-            comment_id,
-            comment_author,
-            comment_created_at,
-            role,
-            severity
-        FROM cyberbullying_motifs.comments
-        ORDER BY unit_id, random();
-        """
-    else:
-        comment_query = """
-        SELECT 
-            unit_id,
-            comment_id,
-            comment_author AS author_name,
-            comment_created_at AS timestamp,
-            role,
-            severity
-        FROM cyberbullying_motifs.comments
-        ORDER BY unit_id, comment_created_at;
-        """
-    rows = _query_postgres(comment_query, AuthorRole)
+    rows = _query_postgres(_comment_query(shuffle_comments), AuthorRole)
     return rows
 
 
+def iter_session_comments(
+    shuffle_comments: bool = False,
+) -> Iterator[tuple[Session, list[AuthorRole]]]:
+    """
+    Stream (session, comments) pairs in unit_id order.
+
+    Comments are read through a server-side cursor and grouped on the fly,
+    so only one session's comments are held in memory at a time.
+    The cursor gets its own connection, so a pool needs room for it next to
+    any stage connection.
+    """
+    sessions = {session.unit_id: session for session in query_sessions()}
+    with (
+        _connection(shared=False) as con,
+        con.cursor(name="session_comments", row_factory=class_row(AuthorRole)) as cur,
+    ):
+        cur.itersize = COMMENT_ITERSIZE
+        cur.execute(_comment_query(shuffle_comments))
+        for unit_id, comments in itertools.groupby(cur, key=attrgetter("unit_id")):
+            session = sessions.get(unit_id)
+            if session is not None:
+                yield session, list(comments)
+
+
 def query_sessions() -> list[Session]:
     SESSION_QUERY = """
     WITH count_comments AS (
@@ -108,7 +341,16 @@ def query_sessions() -> list[Session]:
     return rows
 
 
-def insert_plain_motifs(motifs: list[PlainMotifGraph]) -> None:
+def insert_plain_motifs(
+    motifs: Iterable[PlainMotifGraph], use_copy: bool = True
+) -> None:
+    insert_plain_motif_rows((motif.to_dict() for motif in motifs), use_copy)
+
+
+def insert_plain_motif_rows(
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+    use_copy: bool = True,
+) -> None:
     INSERT_MOTIFS = """
     INSERT INTO cyberbullying_motifs.plain_motifs(
         plain_motif_id,
@@ -126,11 +368,22 @@ def insert_plain_motifs(motifs: list[PlainMotifGraph]) -> None:
         %(serialized_motif)s
     );
     """
-    seralized_motifs = [motif.to_dict() for motif in motifs]
-    _insert_or_update_postgres(INSERT_MOTIFS, seralized_motifs)
+    if use_copy:
+        _copy_postgres(PLAIN_MOTIFS_TABLE, PLAIN_MOTIF_COLUMNS, rows)
+    else:
+        _insert_or_update_postgres(INSERT_MOTIFS, list(rows))
+
+
+def insert_flavored_motifs(
+    motifs: Iterable[FlavoredMotifGraph], use_copy: bool = True
+) -> None:
+    insert_flavored_motif_rows((motif.to_dict() for motif in motifs), use_copy)
 
 
-def insert_flavored_motifs(motifs: list[FlavoredMotifGraph]) -> None:
+def insert_flavored_motif_rows(
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+    use_copy: bool = True,
+) -> None:
     INSERT_MOTIFS = """
     INSERT INTO cyberbullying_motifs.flavored_motifs(
         flavored_motif_id,
@@ -148,11 +401,55 @@ def insert_flavored_motifs(motifs: list[FlavoredMotifGraph]) -> None:
         %(serialized_motif)s
     );
     """
-    seralized_motifs = [motif.to_dict() for motif in motifs]
-    _insert_or_update_postgres(INSERT_MOTIFS, seralized_motifs)
+    if use_copy:
+        _copy_postgres(FLAVORED_MOTIFS_TABLE, FLAVORED_MOTIF_COLUMNS, rows)
+    else:
+        _insert_or_update_postgres(INSERT_MOTIFS, list(rows))
 
 
-def query_session_graphs() -> list[SessionDiGraph]:
+def insert_motif_count_rows(
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+) -> None:
+    _copy_postgres(MOTIF_COUNTS_TABLE, MOTIF_COUNT_COLUMNS, rows)
+
+
+def insert_motif_significance_rows(
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+) -> None:
+    _copy_postgres(MOTIF_SIGNIFICANCE_TABLE, MOTIF_SIGNIFICANCE_COLUMNS, rows)
+
+
+def insert_motif_catalog_rows(
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+) -> None:
+    """
+    Add representative motifs to the catalog, keeping the existing one when a
+    (node_flavor, edge_flavor, motif_hash) is already catalogued.
+    """
+    INSERT_CATALOG = """
+    INSERT INTO cyberbullying_motifs.motif_catalog(
+        node_flavor,
+        edge_flavor,
+        motif_hash,
+        size,
+        serialized_motif
+    ) VALUES (
+        %(node_flavor)s,
+        %(edge_flavor)s,
+        %(motif_hash)s,
+        %(size)s,
+        %(serialized_motif)s
+    )
+    ON CONFLICT (node_flavor, edge_flavor, motif_hash) DO NOTHING;
+    """
+    _insert_or_update_postgres(INSERT_CATALOG, list(rows))
+
+
+def query_session_graph_blobs() -> list[bytes]:
+    """
+    serialized_graph of every true session graph, in either serialization.
+    """
+
     @dataclass
     class SerializedGraph:
         serialized_graph: bytes
@@ -163,20 +460,70 @@ def query_session_graphs() -> list[SessionDiGraph]:
     WHERE is_true_graph;
     """
     serialized_graphs = _query_postgres(QUERY_GRAPHS, SerializedGraph)
-    graphs: list[SessionDiGraph] = []
-    for graph_bytes in serialized_graphs:
-        graph = cast(SessionDiGraph, pickle.loads(graph_bytes.serialized_graph))
+    assert len(serialized_graphs) > 0, "Query should return at least one graph."
+    return [graph_bytes.serialized_graph for graph_bytes in serialized_graphs]
+
+
+def iter_session_graph_blobs() -> Iterator[bytes]:
+    """
+    Stream the serialized_graph of every true session graph in unit_id order.
+
+    Like iter_session_comments the blobs come from a server-side cursor on a
+    connection of their own, GRAPH_ITERSIZE rows at a time.
+    """
+    QUERY_GRAPHS = """
+    SELECT serialized_graph
+    FROM cyberbullying_motifs.session_digraphs
+    WHERE is_true_graph
+    ORDER BY unit_id;
+    """
+    num_graphs = 0
+    with (
+        _connection(shared=False) as con,
+        con.cursor(name="session_graph_blobs") as cur,
+    ):
+        cur.itersize = GRAPH_ITERSIZE
+        cur.execute(QUERY_GRAPHS)
+        for (serialized_graph,) in cur:
+            num_graphs += 1
+            yield serialized_graph
+    assert num_graphs > 0, "Query should return at least one graph."
+
+
+def query_session_graphs() -> list[SessionDiGraph | CompactSessionGraph]:
+    """
+    Load every true session graph, pickled ones as SessionDiGraph and compact
+    ones as CompactSessionGraph.
+    """
+    graphs: list[SessionDiGraph | CompactSessionGraph] = []
+    for graph_bytes in query_session_graph_blobs():
+        graph = cast(
+            SessionDiGraph | CompactSessionGraph,
+            load_session_graph(graph_bytes),
+        )
         graphs.append(graph)
-    assert len(graphs) > 0, "Query should return at least one graph."
     return graphs
 
 
-def insert_session_digraph(session_graphs: list[SessionDiGraph]):
+def insert_session_digraph(
+    session_graphs: Iterable[SessionDiGraph],
+    use_copy: bool = True,
+    serialization: str = "pickle",
+) -> None:
+    rows = (graph.to_dict(serialization) for graph in session_graphs)
+    insert_session_digraph_rows(rows, use_copy)
+
+
+def insert_session_digraph_rows(
+    rows: Iterable[dict[str, Any]],  # pyright: ignore[reportExplicitAny]
+    use_copy: bool = True,
+) -> None:
     INSERT_DIAGRAPH = """ 
     INSERT INTO cyberbullying_motifs.session_digraphs (
     unit_id,
     serialized_graph,
     is_true_graph,
+    ensemble_index,
     num_nodes,
     num_edges,
     num_bullies,
@@ -208,6 +555,7 @@ def insert_session_digraph(session_graphs: list[SessionDiGraph]):
     %(unit_id)s,
     %(serialized_graph)s,
     %(is_true_graph)s,
+    %(ensemble_index)s,
     %(num_nodes)s,
     %(num_edges)s,
     %(num_bullies)s,
@@ -236,5 +584,7 @@ def insert_session_digraph(session_graphs: list[SessionDiGraph]):
     %(main_victim_score)s,
     %(main_victim_score_weighted)s
     );"""
-    rows = [graph.to_dict() for graph in session_graphs]
-    return _insert_or_update_postgres(INSERT_DIAGRAPH, rows)
+    if use_copy:
+        _copy_postgres(SESSION_DIGRAPHS_TABLE, SESSION_DIGRAPH_COLUMNS, rows)
+    else:
+        _insert_or_update_postgres(INSERT_DIAGRAPH, list(rows))
@@ -1,13 +1,29 @@
+import itertools
 import pickle
+from collections.abc import Callable, Iterable
 from uuid import UUID, uuid4
-from typing import override
+from typing import TYPE_CHECKING, override
 
 import igraph as ig
 import numpy as np
 
-from src.graph_hashing import weisfeiler_lehman_graph_hash
+from src.compact_graph import ROLE_CODES, ROLES
+from src.graph_hashing import (
+    WL_HASH_BACKENDS,
+    hash_backend,
+    labeled_motif_signature,
+    motif_graph_hash,
+    motif_hash_cache,
+    motif_hashes_from_edges,
+)
 from src.plain_motif_graph import PlainMotifGraph
 
+if TYPE_CHECKING:
+    from src.motif_catalog import MotifCatalog
+
+NODE_FLAVORS = ["fine", "coarse"]
+EDGE_FLAVORS = ["fine", "coarse", "unweighted"]
+
 
 def _remap_role_flavor_fine(role: str) -> int:
     """
@@ -58,7 +74,7 @@ def _remap_node_roles(role: str, node_flavor: str) -> int:
         raise ValueError(f"Unknown node flavor {node_flavor}")
 
 
-def _remap_edge_weights(edge_flavor: str) -> list[int]:
+def remap_edge_weights(edge_flavor: str) -> list[int]:
     if edge_flavor == "fine":
         return [
             1,
@@ -84,7 +100,7 @@ def _transform_motif(
 
     By default, igraph randesu returns motifys without consideration to their properties.
     """
-    edgewt_bins = _remap_edge_weights(edge_flavor)
+    edgewt_bins = remap_edge_weights(edge_flavor)
     motif_graph.vs["mapped_type"] = [
         _remap_node_roles(role, node_flavor) for role in motif_graph.vs["type"]
     ]
@@ -95,6 +111,62 @@ def _transform_motif(
     return motif_graph
 
 
+# Role code (compact_graph.ROLES order) -> mapped_type, per node flavor.
+MAPPED_TYPE_TABLES = {
+    node_flavor: np.array(
+        [_remap_node_roles(role, node_flavor) for role in ROLES], dtype=int
+    )
+    for node_flavor in NODE_FLAVORS
+}
+
+
+def _hash_all_flavors(
+    node_labels: dict[str, tuple[str, ...]],
+    edges: tuple[tuple[int, int], ...],
+    edge_labels: dict[str, tuple[str, ...]],
+    catalog_lookup: (
+        Callable[[], dict[tuple[str, str], tuple[int, str]] | None] | None
+    ) = None,
+) -> dict[tuple[str, str], str]:
+    """
+    Flavored hash of every (node_flavor, edge_flavor) labeling of one motif,
+    computing the cache misses in a single pass over the shared edges.
+    catalog_lookup, a bound MotifCatalog.lookup, is tried for the misses first.
+    """
+    graph_hashes: dict[tuple[str, str], str] = {}
+    misses = []
+    for flavors in itertools.product(NODE_FLAVORS, EDGE_FLAVORS):
+        node_flavor, edge_flavor = flavors
+        signature = (
+            "flavored",
+            (node_labels[node_flavor], edges, edge_labels[edge_flavor]),
+        )
+        graph_hash = motif_hash_cache.lookup(signature)
+        if graph_hash is None:
+            misses.append((flavors, signature))
+        else:
+            graph_hashes[flavors] = graph_hash
+    if misses:
+        found = catalog_lookup() if catalog_lookup is not None else None
+        if found is not None:
+            computed = [found[flavors][1] for flavors, _ in misses]
+        else:
+            computed = motif_hashes_from_edges(
+                list(edges),
+                [
+                    (list(node_labels[node_flavor]), list(edge_labels[edge_flavor]))
+                    for (node_flavor, edge_flavor), _ in misses
+                ],
+            )
+        for (flavors, signature), graph_hash in zip(misses, computed):
+            motif_hash_cache.add(signature, graph_hash)
+            graph_hashes[flavors] = graph_hash
+    return {
+        flavors: graph_hashes[flavors]
+        for flavors in itertools.product(NODE_FLAVORS, EDGE_FLAVORS)
+    }
+
+
 class FlavoredMotifGraph:
     def __init__(
         self,
@@ -102,16 +174,29 @@ class FlavoredMotifGraph:
         plain_motif_id: UUID,
         node_flavor: str,
         edge_flavor: str,
-        graph: ig.Graph,
+        graph: ig.Graph | None,
         graph_hash: str,
+        materialize: Callable[[], ig.Graph] | None = None,
     ) -> None:
+        """
+        Without a graph, materialize builds it the first time it is needed.
+        """
         self.flavored_motif_id: UUID = flavored_motif_id
         self.plain_motif_id: UUID = plain_motif_id
         self.node_flavor: str = node_flavor
         self.edge_flavor: str = edge_flavor
-        self.graph: ig.Graph = graph
+        self._graph: ig.Graph | None = graph
+        self._materialize: Callable[[], ig.Graph] | None = materialize
         self.graph_hash: str = graph_hash
 
+    @property
+    def graph(self) -> ig.Graph:
+        if self._graph is None:
+            assert self._materialize is not None
+            self._graph = self._materialize()
+            self._materialize = None
+        return self._graph
+
     @override
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, FlavoredMotifGraph):
@@ -141,8 +226,14 @@ class FlavoredMotifGraph:
         transformed_graph = _transform_motif(
             plain_motif.graph, node_flavor, edge_flavor
         )
-        transformed_graph_hash = weisfeiler_lehman_graph_hash(
-            transformed_graph, "binned_weight", "mapped_type"
+        transformed_graph_hash = motif_hash_cache.get(
+            (
+                "flavored",
+                labeled_motif_signature(
+                    transformed_graph, "binned_weight", "mapped_type"
+                ),
+            ),
+            lambda: motif_graph_hash(transformed_graph, "binned_weight", "mapped_type"),
         )
         flavored_motif_id = uuid4()
         return cls(
@@ -154,6 +245,64 @@ class FlavoredMotifGraph:
             transformed_graph_hash,
         )
 
+    @classmethod
+    def from_plain_motif_all_flavors(
+        cls, plain_motif: PlainMotifGraph
+    ) -> list["FlavoredMotifGraph"]:
+        """
+        All six (node_flavor, edge_flavor) flavors of a plain motif in one pass.
+
+        Unlike from_plain_motif, the plain motif graph is left untouched and
+        every flavored motif gets its own graph, built when first needed.
+        """
+        plain_graph = plain_motif.graph
+        role_codes = [ROLE_CODES[type_] for type_ in plain_graph.vs["type"]]
+        mapped_types = {
+            node_flavor: table[role_codes]
+            for node_flavor, table in MAPPED_TYPE_TABLES.items()
+        }
+        weights = np.asarray(plain_graph.es["weight"], dtype=np.float64)
+        binned_weights = {
+            edge_flavor: np.digitize(
+                weights, bins=remap_edge_weights(edge_flavor), right=False
+            )
+            + 1
+            for edge_flavor in EDGE_FLAVORS
+        }
+        graph_hashes = _hash_all_flavors(
+            {
+                flavor: tuple(str(label) for label in labels)
+                for flavor, labels in mapped_types.items()
+            },
+            tuple(plain_graph.get_edgelist()),
+            {
+                flavor: tuple(str(label) for label in labels)
+                for flavor, labels in binned_weights.items()
+            },
+        )
+        vertices = list(range(plain_graph.vcount()))
+        edges = plain_graph.get_edgelist()
+        eids = list(range(plain_graph.ecount()))
+        return [
+            cls(
+                uuid4(),
+                plain_motif.plain_motif_id,
+                node_flavor,
+                edge_flavor,
+                None,
+                graph_hash,
+                materialize=_flavored_graph_factory(
+                    plain_graph,
+                    mapped_types[node_flavor],
+                    binned_weights[edge_flavor],
+                    vertices,
+                    edges,
+                    eids,
+                ),
+            )
+            for (node_flavor, edge_flavor), graph_hash in graph_hashes.items()
+        ]
+
     def to_dict(self) -> dict[str, UUID | str | bytes]:
         # Per the igraph source code, there are no issues pickling igraph objects as they are.
         # That's what the library authors do as well.
@@ -167,3 +316,163 @@ class FlavoredMotifGraph:
             "serialized_motif": serialized_motif,
         }
         return record
+
+
+class FlavoredMotifLabeler:
+    """
+    Flavors motif occurrences of one session without building motif graphs.
+
+    Node labels and edge weight bins are looked up once per flavor for the
+    whole session, so labeling an occurrence only needs its vertex tuple.
+    Hashes match FlavoredMotifGraph.from_plain_motif, and the motif graph
+    itself is only built if the flavored motif gets serialized. With a
+    MotifCatalog, motif_hash_cache misses are looked up in the catalog and
+    only occurrences it does not cover are WL hashed.
+    """
+
+    def __init__(
+        self, session_igraph: ig.Graph, catalog: "MotifCatalog | None" = None
+    ) -> None:
+        self.catalog: MotifCatalog | None = catalog
+        self.edge_ids: dict[tuple[int, int], int] = {
+            edge: eid for eid, edge in enumerate(session_igraph.get_edgelist())
+        }
+        role_codes = np.array(
+            [ROLE_CODES[type_] for type_ in session_igraph.vs["type"]], dtype=np.intp
+        )
+        self.mapped_types: dict[str, np.ndarray] = {
+            node_flavor: table[role_codes]
+            for node_flavor, table in MAPPED_TYPE_TABLES.items()
+        }
+        # from_networkx leaves out the attribute on graphs without edges.
+        weights = np.asarray(
+            session_igraph.es["weight"] if session_igraph.ecount() else [],
+            dtype=np.float64,
+        )
+        self.binned_weights: dict[str, np.ndarray] = {
+            edge_flavor: np.digitize(
+                weights, bins=remap_edge_weights(edge_flavor), right=False
+            )
+            + 1
+            for edge_flavor in EDGE_FLAVORS
+        }
+        # One row per flavor, in NODE_FLAVORS / EDGE_FLAVORS order.
+        self.node_label_rows: np.ndarray = np.stack(
+            [self.mapped_types[flavor] for flavor in NODE_FLAVORS]
+        ).astype(np.int64)
+        self.edge_label_rows: np.ndarray = (
+            np.stack([self.binned_weights[flavor] for flavor in EDGE_FLAVORS])
+            .astype(np.int64)
+            .reshape(len(EDGE_FLAVORS), -1)
+        )
+        # The string labels the WL hash starts from.
+        self.node_labels: dict[str, list[str]] = {
+            flavor: [str(label) for label in labels]
+            for flavor, labels in self.mapped_types.items()
+        }
+        self.edge_labels: dict[str, list[str]] = {
+            flavor: [str(label) for label in labels]
+            for flavor, labels in self.binned_weights.items()
+        }
+
+    def _induced_edges(
+        self, vertices: list[int]
+    ) -> tuple[list[tuple[int, int]], list[int]]:
+        # Same vertex order as ig.Graph.induced_subgraph, but edges come in
+        # (i, j) order rather than in the session's edge order.
+        edges, eids = [], []
+        for (i, u), (j, v) in itertools.product(enumerate(vertices), repeat=2):
+            eid = self.edge_ids.get((u, v))
+            if eid is not None:
+                edges.append((i, j))
+                eids.append(eid)
+        return edges, eids
+
+    def flavor_hashes(
+        self, motif_vertices: Iterable[int]
+    ) -> tuple[dict[tuple[str, str], str], list[int], list[tuple[int, int]], list[int]]:
+        """
+        Hash of every (node_flavor, edge_flavor) combination of the motif
+        induced by motif_vertices, plus its sorted vertices, its edges in
+        motif vertex ids and their session edge ids.
+        """
+        vertices = sorted(motif_vertices)
+        edges, eids = self._induced_edges(vertices)
+        node_labels = {
+            flavor: tuple(labels[v] for v in vertices)
+            for flavor, labels in self.node_labels.items()
+        }
+        edge_labels = {
+            flavor: tuple(labels[eid] for eid in eids)
+            for flavor, labels in self.edge_labels.items()
+        }
+        catalog_lookup = None
+        catalog = self.catalog
+        # The catalog holds WL hashes.
+        if catalog is not None and hash_backend() in WL_HASH_BACKENDS:
+
+            def lookup_catalog() -> dict[tuple[str, str], tuple[int, str]] | None:
+                return catalog.lookup(
+                    tuple(edges),
+                    self.node_label_rows[:, vertices],
+                    self.edge_label_rows[:, eids],
+                )
+
+            catalog_lookup = lookup_catalog
+        graph_hashes = _hash_all_flavors(
+            node_labels, tuple(edges), edge_labels, catalog_lookup
+        )
+        return graph_hashes, vertices, edges, eids
+
+    def flavor(self, plain_motif: PlainMotifGraph) -> list[FlavoredMotifGraph]:
+        """
+        Every (node_flavor, edge_flavor) combination of a plain motif found by
+        find_session_graph_motifs on this session.
+        """
+        assert plain_motif.vertices is not None, "Plain motif has no vertices."
+        graph_hashes, vertices, edges, eids = self.flavor_hashes(plain_motif.vertices)
+        return [
+            FlavoredMotifGraph(
+                uuid4(),
+                plain_motif.plain_motif_id,
+                node_flavor,
+                edge_flavor,
+                None,
+                graph_hash,
+                materialize=_flavored_graph_factory(
+                    plain_motif.graph,
+                    self.mapped_types[node_flavor],
+                    self.binned_weights[edge_flavor],
+                    vertices,
+                    edges,
+                    eids,
+                ),
+            )
+            for (node_flavor, edge_flavor), graph_hash in graph_hashes.items()
+        ]
+
+
+def _flavored_graph_factory(
+    plain_graph: ig.Graph,
+    mapped_types: np.ndarray,
+    binned_weights: np.ndarray,
+    vertices: list[int],
+    edges: list[tuple[int, int]],
+    eids: list[int],
+) -> Callable[[], ig.Graph]:
+    """
+    Copies plain_graph with the labels of its vertices and of the session
+    edges eids, matched to its own edges by endpoints since induced_subgraph
+    may keep the session's edge order.
+    """
+
+    def materialize() -> ig.Graph:
+        motif_graph = plain_graph.copy()
+        motif_graph.vs["mapped_type"] = mapped_types[vertices].tolist()
+        edge_ids = dict(zip(edges, eids))
+        motif_graph.es["binned_weight"] = binned_weights[
+            [edge_ids[edge] for edge in motif_graph.get_edgelist()]
+        ]
+        return motif_graph
+
+    return materialize
@@ -1,33 +1,91 @@
+from dataclasses import dataclass, field
 from pathlib import Path
 from src.session_digraph import SessionDiGraph
+from src.session_array_graph import SessionArrayGraph
 
 from src.draw import save_graph_snapshot
 from src.author_role import AuthorRole
 
 
+@dataclass
+class _PendingEdges:
+    """
+    Edges one author's comments imply towards a growing set of nodes.
+
+    targets is the builder's arrival-ordered bully or victim list. Each cohort
+    covers the targets that arrived between two of the author's comments, and
+    its weight sums the severities of the comment that opened it and every
+    later one. total is the running severity sum and opened_at its value when
+    each cohort opened, so a comment costs O(1) and a cohort's weight is the
+    eager builder's sum up to rounding.
+    """
+
+    author_role: AuthorRole
+    type_: str
+    targets: list[AuthorRole]
+    reverse: bool
+    covered: int = 0
+    total: float = 0.0
+    opened_at: list[float] = field(default_factory=list)
+
+    def add_comment(self, severity: float) -> tuple[int, int, int] | None:
+        cohort = None
+        if len(self.targets) > self.covered:
+            cohort = (len(self.opened_at), self.covered, len(self.targets))
+            self.covered = len(self.targets)
+            self.opened_at.append(self.total)
+        self.total += severity
+        return cohort
+
+    def weight(self, cohort: int) -> float:
+        return self.total - self.opened_at[cohort]
+
+
 class GraphBuilder:
     def __init__(
         self,
-        session_G: SessionDiGraph,
+        session_G: SessionDiGraph | SessionArrayGraph,
         snapshot_directory: Path | None = None,
+        lazy_edges: bool = False,
     ) -> None:
+        """
+        With lazy_edges, add_edge only records running severity sums per
+        author and the edges are resolved in a single pass by finalize().
+        The graph is the same as the eager builder's, up to the rounding of
+        edge weights, but a comment costs O(1) instead of O(current bullies
+        or victims). Lazy mode relies on AuthorRole.should_add_edge accepting
+        every pair.
+        """
         self.snapshot_directory: Path | None = snapshot_directory
         self.current_bullies: set[AuthorRole] = set()
         self.current_defenders: set[AuthorRole] = set()
         self.current_victims: set[AuthorRole] = set()
-        self.session_G: SessionDiGraph = session_G
+        if snapshot_directory is not None and not isinstance(session_G, SessionDiGraph):
+            raise ValueError("Graph snapshots need the networkx SessionDiGraph.")
+        if snapshot_directory is not None and lazy_edges:
+            raise ValueError("Graph snapshots need the eager edge builder.")
+        self.session_G: SessionDiGraph | SessionArrayGraph = session_G
         self.snapshot_step: int = 0
         self.existing_author_roles: set[AuthorRole] = set()
 
+        self.lazy_edges: bool = lazy_edges
+        # Arrival order of current_bullies / current_victims, for lazy edges.
+        self.bully_order: list[AuthorRole] = []
+        self.victim_order: list[AuthorRole] = []
+        self._pending_edges: dict[tuple[AuthorRole, str], _PendingEdges] = {}
+        self._cohorts: list[tuple[_PendingEdges, int, int, int]] = []
+
     def add_node(self, author_role: AuthorRole) -> None:
         if author_role.role == "main_victim":
-            self.current_victims.add(author_role)
+            self._add_victim(author_role)
             layer = 0.0
         elif author_role.role in ["aggressive_victim", "non_aggressive_victim"]:
-            self.current_victims.add(author_role)
+            self._add_victim(author_role)
             layer = 0.5
         elif author_role.role in ["bully", "bully_assistant"]:
-            self.current_bullies.add(author_role)
+            if author_role not in self.current_bullies:
+                self.current_bullies.add(author_role)
+                self.bully_order.append(author_role)
             layer = 1.0
         elif author_role.role in [
             "non_aggressive_defender:support_of_the_victim",
@@ -50,6 +108,11 @@ class GraphBuilder:
             self.existing_author_roles.add(author_role)
             self.take_graph_snapshot()
 
+    def _add_victim(self, author_role: AuthorRole) -> None:
+        if author_role not in self.current_victims:
+            self.current_victims.add(author_role)
+            self.victim_order.append(author_role)
+
     def add_edge(
         self,
         author_role: AuthorRole,
@@ -66,6 +129,8 @@ class GraphBuilder:
         Aggressive Defenders attack the bully but also pacifies victim, that is, agg_defender -> bullies (currently)
         Aggressive Victim attacks the bullies, that is, victim -> bully
         """
+        if self.lazy_edges:
+            return self._add_lazy_edges(author_role)
         if author_role.role in [
             "non_aggressive_defender:direct_to_the_bully",
             "aggressive_victim",
@@ -123,8 +188,56 @@ class GraphBuilder:
         else:
             raise ValueError(f"Unknown role: {author_role.role}")
 
+    def _add_lazy_edges(self, author_role: AuthorRole) -> None:
+        if author_role.role in [
+            "non_aggressive_defender:direct_to_the_bully",
+            "aggressive_victim",
+        ]:
+            rules = [(f"{author_role.role}->bully", self.bully_order, False)]
+        elif author_role.role in [
+            "non_aggressive_defender:support_of_the_victim",
+            "bully",
+            "bully_assistant",
+        ]:
+            rules = [(f"{author_role.role}->victim", self.victim_order, False)]
+        elif author_role.role == "aggressive_defender":
+            rules = [
+                (f"{author_role.role}->victim", self.bully_order, False),
+                (f"victim->{author_role.role}", self.victim_order, True),
+            ]
+        elif author_role.role in ["non_aggressive_victim", "passive_bystander"]:
+            rules = []
+        else:
+            raise ValueError(f"Unknown role: {author_role.role}")
+
+        for type_, targets, reverse in rules:
+            pending = self._pending_edges.get((author_role, type_))
+            if pending is None:
+                pending = _PendingEdges(author_role, type_, targets, reverse)
+                self._pending_edges[(author_role, type_)] = pending
+            cohort = pending.add_comment(author_role.severity)
+            if cohort is not None:
+                self._cohorts.append((pending, *cohort))
+
+    def finalize(self) -> None:
+        """
+        Add the edges recorded in lazy mode, in the order they were created.
+        """
+        for pending, index, start, end in self._cohorts:
+            self.session_G.add_star_edges(
+                pending.author_role,
+                pending.targets[start:end],
+                weight=pending.weight(index),
+                type_=pending.type_,
+                inbound=pending.reverse,
+            )
+        self._pending_edges.clear()
+        self._cohorts.clear()
+
     def take_graph_snapshot(self) -> None:
         if self.snapshot_directory is not None:
+            # __init__ only allows snapshots of a SessionDiGraph.
+            assert isinstance(self.session_G, SessionDiGraph)
             save_graph_snapshot(
                 self.session_G, self.snapshot_directory, step=self.snapshot_step
             )
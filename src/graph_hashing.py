@@ -1,14 +1,22 @@
 # pyright: basic
-from collections import Counter
+from collections import Counter, OrderedDict
+import os
+from collections.abc import Callable, Hashable, Iterable
 from hashlib import blake2b
 import igraph as ig
+import numpy as np
+from scipy import sparse
+
+HASH_BACKENDS = ["wl", "wl_interned", "canonical"]
+# Backends that give weisfeiler_lehman_graph_hash's hashes.
+WL_HASH_BACKENDS = ("wl", "wl_interned")
 
 
 def _hash_label(label, digest_size):
     return blake2b(label.encode("ascii"), digest_size=digest_size).hexdigest()
 
 
-def _init_node_labels_ig(ig_G: ig.Graph, edge_attr: str, node_attr: str):
+def _init_node_labels_ig(ig_G: ig.Graph, edge_attr: str | None, node_attr: str | None):
     """
     iGraph version of _init_node_labels in nx
     turn node attributes into strings
@@ -99,3 +107,628 @@ def weisfeiler_lehman_graph_hash(
         str(tuple(subgraph_hash_counts)),
         digest_size=digest_size,
     )
+
+
+def weisfeiler_lehman_hash_from_edges(
+    node_labels: list[str],
+    edges: list[tuple[int, int]],
+    edge_labels: list[str] | None = None,
+    iterations=3,
+    digest_size=16,
+):
+    """
+    weisfeiler_lehman_graph_hash for a graph given as vertex labels plus a
+    directed edge list, with optional per-edge labels. Returns the same hash
+    as the igraph version on the equivalent graph, without building one.
+    """
+    return weisfeiler_lehman_hashes_from_edges(
+        edges, [(node_labels, edge_labels)], iterations, digest_size
+    )[0]
+
+
+def weisfeiler_lehman_hashes_from_edges(
+    edges: list[tuple[int, int]],
+    labelings: list[tuple[list[str], list[str] | None]],
+    iterations=3,
+    digest_size=16,
+) -> list[str]:
+    """
+    One hash per (node_labels, edge_labels) labeling of the same edge list,
+    sharing the successor lists between them.
+    """
+    num_nodes = len(labelings[0][0])
+    successors: list[list[tuple[int, int]]] = [[] for _ in range(num_nodes)]
+    for i, (u, v) in enumerate(edges):
+        successors[u].append((i, v))
+
+    graph_hashes = []
+    for node_labels, edge_labels in labelings:
+        labels = list(node_labels)
+        subgraph_hash_counts = []
+        for _ in range(iterations):
+            labels = [
+                _hash_label(
+                    labels[node]
+                    + "".join(
+                        sorted(
+                            ("" if edge_labels is None else edge_labels[i])
+                            + labels[nbr]
+                            for i, nbr in nbrs
+                        )
+                    ),
+                    digest_size,
+                )
+                for node, nbrs in enumerate(successors)
+            ]
+            subgraph_hash_counts.extend(sorted(Counter(labels).items()))
+        graph_hashes.append(
+            _hash_label(str(tuple(subgraph_hash_counts)), digest_size=digest_size)
+        )
+    return graph_hashes
+
+
+class WLLabelCache:
+    """
+    Bounded LRU memo for WL hashing on small integer labels.
+
+    Node and edge labels get ids on first sight, keyed by their string, and
+    refined labels by the (label, sorted (edge label, neighbor label)) tuple
+    they aggregate. Each entry keeps the id together with the string the WL
+    hash uses in its place, the initial label or the hex digest. Ids are
+    never handed out twice, so after an eviction a label may come back under
+    a new id, which only costs misses. At most maxsize entries are kept,
+    shared by every call.
+
+    hits and misses count lookups, bytes_hashed the blake2b input, all since
+    the last clear.
+    """
+
+    def __init__(self, maxsize: int = 1_000_000) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, tuple[int, str]] = OrderedDict()
+        self._next_label = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.bytes_hashed: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, key: Hashable) -> tuple[int, str] | None:
+        """
+        (label, name) of key or None, for callers that spell out their misses.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def add(self, key: Hashable, name: str) -> tuple[int, str]:
+        entry = self._entries[key] = (self._next_label, name)
+        self._next_label += 1
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def add_hashed(
+        self, key: Hashable, label: str, digest_size: int
+    ) -> tuple[int, str]:
+        encoded = label.encode("ascii")
+        self.bytes_hashed += len(encoded)
+        return self.add(key, blake2b(encoded, digest_size=digest_size).hexdigest())
+
+    def initial(self, key: Hashable, name: str) -> int:
+        entry = self.lookup(key)
+        return (entry or self.add(key, name))[0]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_hashed = 0
+
+
+# Shared by every interned WL hash in this process.
+wl_label_cache = WLLabelCache()
+
+
+def weisfeiler_lehman_hashes_interned(
+    edges: list[tuple[int, int]],
+    labelings: list[tuple[list[str], list[str] | None]],
+    iterations=3,
+    digest_size=16,
+    cache: WLLabelCache | None = None,
+) -> list[str]:
+    """
+    weisfeiler_lehman_hashes_from_edges on integer labels.
+
+    Neighborhoods are aggregated as sorted tuples of label ids and only
+    spelled out as hex strings, and hashed, when the cache has no entry for
+    them. The hashes are the same as weisfeiler_lehman_hashes_from_edges.
+    """
+    if cache is None:
+        cache = wl_label_cache
+    num_nodes = len(labelings[0][0])
+    successors: list[list[tuple[int, int]]] = [[] for _ in range(num_nodes)]
+    for i, (u, v) in enumerate(edges):
+        successors[u].append((i, v))
+
+    # The per-node lookup is inlined, it is the hot loop.
+    entries = cache._entries
+    hits = 0
+    graph_hashes = []
+    for node_labels, edge_labels in labelings:
+        node_names = [str(label) for label in node_labels]
+        edge_names = (
+            [""] * len(edges)
+            if edge_labels is None
+            else [str(label) for label in edge_labels]
+        )
+        edge_ids = [cache.initial(("edge", name), name) for name in edge_names]
+        labels = [cache.initial(("node", name), name) for name in node_names]
+        # Names of this graph's labels, which its misses are spelled out from.
+        names = dict(zip(labels, node_names))
+        iteration_labels = []
+        for _ in range(iterations):
+            new_labels = []
+            for node, nbrs in enumerate(successors):
+                key = (
+                    digest_size,
+                    labels[node],
+                    tuple(sorted((edge_ids[i], labels[nbr]) for i, nbr in nbrs)),
+                )
+                entry = entries.get(key)
+                if entry is None:
+                    cache.misses += 1
+                    entry = cache.add_hashed(
+                        key,
+                        names[labels[node]]
+                        + "".join(
+                            sorted(
+                                edge_names[i] + names[labels[nbr]] for i, nbr in nbrs
+                            )
+                        ),
+                        digest_size,
+                    )
+                else:
+                    hits += 1
+                    entries.move_to_end(key)
+                label, names[label] = entry
+                new_labels.append(label)
+            labels = new_labels
+            iteration_labels.append(tuple(sorted(labels)))
+
+        key = (digest_size, "graph", tuple(iteration_labels))
+        entry = cache.lookup(key)
+        if entry is None:
+            entry = cache.add_hashed(
+                key,
+                str(
+                    tuple(
+                        hash_count
+                        for labels in iteration_labels
+                        for hash_count in sorted(
+                            Counter(names[label] for label in labels).items()
+                        )
+                    )
+                ),
+                digest_size,
+            )
+        graph_hashes.append(entry[1])
+    cache.hits += hits
+    return graph_hashes
+
+
+def _compress_labels(labels) -> tuple[np.ndarray, list[str]]:
+    names, ids = np.unique(np.asarray(labels).astype(str), return_inverse=True)
+    return ids.astype(np.int64).reshape(-1), names.tolist()
+
+
+def _row_ids(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Index of the first occurrence of each distinct row, and the distinct row
+    id of every row, like np.unique(rows, axis=0) but through one packed int64
+    key per row. Keys are re-ranked before a column would overflow them.
+    """
+    keys = np.zeros(len(rows), dtype=np.int64)
+    if not len(rows):
+        return keys, keys
+    bound = 1
+    for column in rows.T:
+        column = column - column.min()
+        radix = int(column.max()) + 1
+        if bound * radix >= 2**62:
+            _, keys = np.unique(keys, return_inverse=True)
+            bound = int(keys.max()) + 1
+        keys = keys * radix + column
+        bound *= radix
+    _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return index, inverse.reshape(-1)
+
+
+def _slot_rows(
+    groups: np.ndarray, values: np.ndarray, num_groups: int, fill=-1
+) -> np.ndarray:
+    """
+    One row per group holding its values in ascending order, padded with fill.
+    """
+    order = np.lexsort((values, groups))
+    sizes = np.bincount(groups, minlength=num_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rows = np.full((num_groups, int(sizes.max(initial=0))), fill, dtype=np.int64)
+    rows[groups[order], np.arange(len(order)) - starts[groups[order]]] = values[order]
+    return rows
+
+
+def _wl_refinements(
+    edges: np.ndarray, labels: np.ndarray, edge_ids: np.ndarray, iterations: int
+) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Integer WL refinement: per iteration the distinct node rows, the distinct
+    (edge label, label) pairs they index and the new label of every node.
+    Rows are the previous label followed by the sorted pair ids of the
+    successors, padded with -1.
+    """
+    sources, targets = edges[:, 0], edges[:, 1]
+    refinements = []
+    for _ in range(iterations):
+        pairs = np.stack([edge_ids, labels[targets]], axis=1)
+        pair_index, pair_ids = _row_ids(pairs)
+        # Neighbor multisets, not their edge order, define the new label.
+        rows = np.hstack([labels[:, None], _slot_rows(sources, pair_ids, len(labels))])
+        row_index, labels = _row_ids(rows)
+        refinements.append((rows[row_index], pairs[pair_index], labels))
+    return refinements
+
+
+def weisfeiler_lehman_hashes_batch(
+    edges: np.ndarray,
+    graph_ids: np.ndarray,
+    node_labels,
+    edge_labels=None,
+    iterations=3,
+    digest_size=16,
+    digest=True,
+):
+    """
+    WL hashes of many small graphs at once.
+
+    The graphs are given as one concatenated directed edge array over global
+    node ids, the graph id of every node and per-node / per-edge labels, as
+    str() is applied to them. Refinement works on integer labels: a node's
+    label and the sorted (edge label, neighbor label) ids of its successors
+    form a fixed-width row, and the distinct rows relabel every node of every
+    graph at once. A graph is then one row of its sorted labels per iteration.
+
+    Without digest the result is an int array where two graphs share an id
+    exactly when their WL hashes are equal. With it, the list of hex hashes,
+    equal to weisfeiler_lehman_hash_from_edges graph by graph; label strings
+    and digests are only built once per distinct node row and graph row.
+    Rows are as wide as the largest out-degree and graph, so keep large
+    graphs out of the batch.
+    """
+    graph_ids = np.asarray(graph_ids, dtype=np.int64)
+    num_nodes = len(graph_ids)
+    num_graphs = int(graph_ids.max()) + 1 if num_nodes else 0
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    labels, names = _compress_labels(node_labels)
+    if edge_labels is None:
+        edge_ids, edge_names = np.zeros(len(edges), dtype=np.int64), [""]
+    else:
+        edge_ids, edge_names = _compress_labels(edge_labels)
+
+    refinements = _wl_refinements(edges, labels, edge_ids, iterations)
+    graph_rows = np.hstack(
+        [np.zeros((num_graphs, 0), dtype=np.int64)]
+        + [_slot_rows(graph_ids, labels, num_graphs) for _, _, labels in refinements]
+    )
+    graph_index, graph_classes = _row_ids(graph_rows)
+    if not digest:
+        return graph_classes
+
+    # A node row only refers to nodes of its own graph, so naming the labels
+    # of one representative graph per class is closed under dependencies.
+    width = graph_rows.shape[1] // iterations if iterations else 0
+    representatives = graph_rows[graph_index].reshape(
+        len(graph_index), iterations, width
+    )
+    label_names: list[dict[int, str]] = []
+    previous = dict(enumerate(names))
+    for iteration, (node_rows, pairs, _) in enumerate(refinements):
+        pair_names = [
+            edge_names[edge_label] + previous[label] if label in previous else ""
+            for edge_label, label in pairs.tolist()
+        ]
+        needed = np.unique(representatives[:, iteration])
+        previous = {
+            label: _hash_label(
+                previous[row[0]]
+                + "".join(sorted(pair_names[pair] for pair in row[1:] if pair >= 0)),
+                digest_size,
+            )
+            for label, row in zip(
+                needed[needed >= 0].tolist(), node_rows[needed[needed >= 0]].tolist()
+            )
+        }
+        label_names.append(previous)
+
+    class_hashes = []
+    for graph_rows_ in representatives.tolist():
+        graph_hash_counts: list[tuple[str, int]] = []
+        for names_, graph_labels in zip(label_names, graph_rows_):
+            graph_hash_counts.extend(
+                sorted(
+                    Counter(
+                        names_[label] for label in graph_labels if label >= 0
+                    ).items()
+                )
+            )
+        class_hashes.append(
+            _hash_label(str(tuple(graph_hash_counts)), digest_size=digest_size)
+        )
+    return [class_hashes[graph_class] for graph_class in graph_classes.tolist()]
+
+
+class WLFeatureDictionary:
+    """
+    Shared label dictionary of the WL subtree kernel.
+
+    Every label a node takes, its initial one and one per refinement, is a
+    feature column. Columns are assigned on first sight and kept across
+    transform calls, so the feature matrices of consecutive batches of graphs
+    line up and only ever get wider.
+    """
+
+    def __init__(self, iterations: int = 3) -> None:
+        self.iterations = iterations
+        self.columns: dict[tuple, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def _columns(self, keys: Iterable[tuple]) -> np.ndarray:
+        return np.fromiter(
+            (self.columns.setdefault(key, len(self.columns)) for key in keys),
+            dtype=np.int64,
+        )
+
+    def transform(
+        self,
+        edges: np.ndarray,
+        graph_ids: np.ndarray,
+        node_labels,
+        edge_labels=None,
+        num_graphs: int | None = None,
+    ) -> sparse.csr_matrix:
+        """
+        WL label counts of a batch of graphs, given as for
+        weisfeiler_lehman_hashes_batch, one row per graph and one column per
+        dictionary entry so far.
+        """
+        graph_ids = np.asarray(graph_ids, dtype=np.int64)
+        if num_graphs is None:
+            num_graphs = int(graph_ids.max()) + 1 if len(graph_ids) else 0
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        labels, names = _compress_labels(node_labels)
+        if edge_labels is None:
+            edge_ids, edge_names = np.zeros(len(edges), dtype=np.int64), [""]
+        else:
+            edge_ids, edge_names = _compress_labels(edge_labels)
+
+        # Batch-local label ids are translated to columns one distinct node
+        # row at a time, keyed by the columns of the labels they refer to.
+        columns = self._columns((0, name) for name in names)
+        node_columns = [columns[labels]]
+        refinements = _wl_refinements(edges, labels, edge_ids, self.iterations)
+        for iteration, (node_rows, pairs, labels) in enumerate(refinements, start=1):
+            previous = columns.tolist()
+            pair_keys = [
+                (edge_names[edge_label], previous[label])
+                for edge_label, label in pairs.tolist()
+            ]
+            columns = self._columns(
+                (
+                    iteration,
+                    previous[row[0]],
+                    tuple(sorted(pair_keys[pair] for pair in row[1:] if pair >= 0)),
+                )
+                for row in node_rows.tolist()
+            )
+            node_columns.append(columns[labels])
+
+        return sparse.csr_matrix(
+            (
+                np.ones(len(graph_ids) * len(node_columns), dtype=np.int64),
+                (np.tile(graph_ids, len(node_columns)), np.concatenate(node_columns)),
+            ),
+            shape=(num_graphs, len(self)),
+        )
+
+
+class MotifHashCache:
+    """
+    Memoized motif hashes, keyed by a cheap structural signature.
+
+    The signature must pin down everything the hash depends on, e.g. the size
+    and iso class for an unlabeled motif, so a hit returns exactly the hash the
+    computation would have. hits and misses count lookups since the last clear.
+    """
+
+    def __init__(self) -> None:
+        self._hashes: dict[Hashable, str] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def get(self, signature: Hashable, compute: Callable[[], str]) -> str:
+        graph_hash = self.lookup(signature)
+        if graph_hash is None:
+            graph_hash = self._hashes[signature] = compute()
+        return graph_hash
+
+    def lookup(self, signature: Hashable) -> str | None:
+        """
+        Cached hash or None, for callers that batch their misses into add().
+        """
+        graph_hash = self._hashes.get(signature)
+        if graph_hash is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return graph_hash
+
+    def add(self, signature: Hashable, graph_hash: str) -> None:
+        self._hashes[signature] = graph_hash
+
+    def clear(self) -> None:
+        self._hashes.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared by every motif hashed in this process.
+motif_hash_cache = MotifHashCache()
+
+
+def labeled_motif_signature(
+    ig_G: ig.Graph, edge_attr: str, node_attr: str
+) -> tuple[tuple, tuple, tuple]:
+    """
+    Node labels in vertex order plus the labeled edge list, which is all
+    weisfeiler_lehman_graph_hash(ig_G, edge_attr, node_attr) looks at.
+    """
+    return (
+        tuple(str(label) for label in ig_G.vs[node_attr]),
+        tuple(ig_G.get_edgelist()),
+        tuple(str(label) for label in ig_G.es[edge_attr]),
+    )
+
+
+def canonical_form(
+    node_labels: list[str],
+    edges: list[tuple[int, int]],
+    edge_labels: list[str] | None = None,
+) -> tuple[tuple[str, ...], tuple[tuple[int, int], ...]]:
+    """
+    Exact canonical form of a labeled digraph: the vertex labels and the
+    sorted edge list after BLISS's canonical permutation.
+
+    Edge labels are encoded by subdividing every edge u -> v into u -> w -> v,
+    with w labeled by the edge label. Labels become BLISS vertex colors by
+    rank, which only depends on the label multiset, so isomorphic graphs get
+    the same coloring.
+    """
+    num_nodes = len(node_labels)
+    labels = [f"n{label}" for label in node_labels]
+    colored_edges = list(edges)
+    if edge_labels is not None:
+        labels += [f"e{label}" for label in edge_labels]
+        colored_edges = [
+            edge
+            for i, (u, v) in enumerate(edges)
+            for edge in ((u, num_nodes + i), (num_nodes + i, v))
+        ]
+    ranks = {label: rank for rank, label in enumerate(sorted(set(labels)))}
+    graph = ig.Graph(n=len(labels), edges=colored_edges, directed=True)
+    graph.vs["label"] = labels
+    permutation = graph.canonical_permutation(color=[ranks[label] for label in labels])
+    # igraph has flipped which direction the permutation maps, so it is only
+    # ever applied by permute_vertices, which stays consistent with it.
+    canonical = graph.permute_vertices(permutation)
+    return tuple(canonical.vs["label"]), tuple(sorted(canonical.get_edgelist()))
+
+
+def canonical_hash_from_edges(
+    node_labels: list[str],
+    edges: list[tuple[int, int]],
+    edge_labels: list[str] | None = None,
+    digest_size=16,
+) -> str:
+    """
+    Compact key of canonical_form, a digest the size of a WL hash.
+    """
+    return _hash_label(
+        str(canonical_form(node_labels, edges, edge_labels)), digest_size
+    )
+
+
+def canonical_graph_hash(
+    ig_G: ig.Graph, edge_attr=None, node_attr=None, digest_size=16
+) -> str:
+    """
+    canonical_hash_from_edges of an igraph graph. Without node_attr every
+    vertex gets the same label, unlike the WL hash's degree labels.
+    """
+    if node_attr:
+        node_labels = [str(label) for label in ig_G.vs[node_attr]]
+    else:
+        node_labels = [""] * ig_G.vcount()
+    edge_labels = [str(label) for label in ig_G.es[edge_attr]] if edge_attr else None
+    return canonical_hash_from_edges(
+        node_labels, ig_G.get_edgelist(), edge_labels, digest_size
+    )
+
+
+_hash_backend = os.environ.get("MOTIF_HASH_BACKEND", "wl")
+
+
+def hash_backend() -> str:
+    return _hash_backend
+
+
+def use_hash_backend(backend: str) -> None:
+    """
+    Hash motifs with backend from now on, in this process. Switching
+    clears motif_hash_cache, whose entries belong to the old backend.
+    """
+    global _hash_backend
+    if backend not in HASH_BACKENDS:
+        raise ValueError(f"Unknown hash backend {backend}")
+    if backend != _hash_backend:
+        motif_hash_cache.clear()
+        _hash_backend = backend
+
+
+def motif_graph_hash(ig_G: ig.Graph, edge_attr=None, node_attr=None) -> str:
+    """
+    Hash of a motif graph with the selected backend.
+    """
+    if _hash_backend == "canonical":
+        return canonical_graph_hash(ig_G, edge_attr, node_attr)
+    if _hash_backend == "wl_interned":
+        node_labels = _init_node_labels_ig(ig_G, edge_attr, node_attr)
+        edge_labels = (
+            [str(label) for label in ig_G.es[edge_attr]] if edge_attr else None
+        )
+        return weisfeiler_lehman_hashes_interned(
+            ig_G.get_edgelist(),
+            [([node_labels[v] for v in range(ig_G.vcount())], edge_labels)],
+        )[0]
+    return weisfeiler_lehman_graph_hash(ig_G, edge_attr, node_attr)
+
+
+def motif_hashes_from_edges(
+    edges: list[tuple[int, int]],
+    labelings: list[tuple[list[str], list[str] | None]],
+) -> list[str]:
+    """
+    weisfeiler_lehman_hashes_from_edges with the selected backend.
+    """
+    if _hash_backend == "canonical":
+        return [
+            canonical_hash_from_edges(node_labels, edges, edge_labels)
+            for node_labels, edge_labels in labelings
+        ]
+    if _hash_backend == "wl_interned":
+        return weisfeiler_lehman_hashes_interned(edges, labelings)
+    return weisfeiler_lehman_hashes_from_edges(edges, labelings)
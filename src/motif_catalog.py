@@ -0,0 +1,388 @@
+# pyright: basic
+"""
+Catalog of every colored size 3 and 4 motif the session graphs can contain.
+
+A colored motif is a connected directed iso class with a node flavor label on
+every vertex and an edge flavor label on every edge. GraphBuilder only draws
+edges between a few role pairs, see ALLOWED_ROLE_PAIRS, which keeps the
+reachable colorings finite and small enough to enumerate once:
+
+    python -m src.motif_catalog [path]
+
+Each colored motif is encoded as an integer key, the smallest encoding over the
+automorphisms of its iso class representative. Motif ids are positions in the
+sorted keys, so they are stable and give a fixed-width vector layout per
+(node_flavor, edge_flavor). Edge weights are not constrained, every edge label
+combination is assumed reachable.
+"""
+
+import itertools
+import sys
+from collections.abc import Sequence
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+import igraph as ig
+import numpy as np
+from loguru import logger
+
+from src.compact_graph import ROLE_CODES, ROLES
+from src.flavored_motif_graph import (
+    EDGE_FLAVORS,
+    MAPPED_TYPE_TABLES,
+    NODE_FLAVORS,
+    remap_edge_weights,
+)
+from src.graph_hashing import weisfeiler_lehman_hashes_batch
+
+CATALOG_PATH = Path(__file__).resolve().parent.parent / "motif_catalog.npz"
+CATALOG_SIZES = (3, 4)
+
+
+def _role_pairs(sources: list[str], targets: list[str]) -> set[tuple[int, int]]:
+    return {
+        (ROLE_CODES[source], ROLE_CODES[target])
+        for source in sources
+        for target in targets
+    }
+
+
+_VICTIMS = ["main_victim", "non_aggressive_victim", "aggressive_victim"]
+_BULLIES = ["bully", "bully_assistant"]
+# (source, target) role codes of every edge GraphBuilder.add_edge can add.
+ALLOWED_ROLE_PAIRS = (
+    _role_pairs(
+        [
+            "aggressive_victim",
+            "non_aggressive_defender:direct_to_the_bully",
+            "aggressive_defender",
+        ],
+        _BULLIES,
+    )
+    | _role_pairs(
+        ["non_aggressive_defender:support_of_the_victim", *_BULLIES], _VICTIMS
+    )
+    | _role_pairs(_VICTIMS, ["aggressive_defender"])
+)
+
+FLAVORS = list(itertools.product(NODE_FLAVORS, EDGE_FLAVORS))
+
+# Key layout, high to low bits: size - 3 (1), iso class (8), four node labels
+# (3 each, from bit 36) and twelve edge labels (3 each, from bit 0). Lookups
+# put the flavor index above the size bit.
+_FLAVOR_SHIFT = 57
+_SIZE_SHIFT = 56
+_ISO_SHIFT = 48
+_NODE_SHIFT = 36
+_LABEL_BITS = 3
+_MAX_SIZE = 4
+_MAX_EDGES = _MAX_SIZE * (_MAX_SIZE - 1)
+
+
+def _node_shifts(size: int) -> np.ndarray:
+    return _NODE_SHIFT + _LABEL_BITS * (_MAX_SIZE - 1 - np.arange(size))
+
+
+def _edge_shifts(num_edges: int) -> np.ndarray:
+    return _LABEL_BITS * (_MAX_EDGES - 1 - np.arange(num_edges))
+
+
+def _key_base(size: int, iso_class: int) -> int:
+    return (size - 3) << _SIZE_SHIFT | iso_class << _ISO_SHIFT
+
+
+def _edge_labels(edge_flavor: str) -> range:
+    # Same labels as np.digitize(..., bins) + 1 in FlavoredMotifLabeler.
+    return range(1, len(remap_edge_weights(edge_flavor)) + 2)
+
+
+def _num_iso_classes(size: int) -> int:
+    return len(ig.Graph(n=size, directed=True).motifs_randesu(size=size))
+
+
+class _IsoClass:
+    """
+    Representative of a connected iso class, with its automorphisms as
+    vertex and edge index permutations.
+    """
+
+    def __init__(self, size: int, iso_class: int) -> None:
+        self.size = size
+        self.iso_class = iso_class
+        self.graph = ig.Graph.Isoclass(size, iso_class, directed=True)
+        self.edges: list[tuple[int, int]] = self.graph.get_edgelist()
+        self.edge_index = {edge: i for i, edge in enumerate(self.edges)}
+        self.automorphisms: list[tuple[list[int], list[int]]] = [
+            self.permutations(phi, self.edges)
+            for phi in self.graph.get_isomorphisms_vf2(self.graph)
+        ]
+
+    def permutations(
+        self, phi: Sequence[int], edges: Sequence[tuple[int, int]]
+    ) -> tuple[list[int], list[int]]:
+        """
+        (node_order, edge_order) such that labels[node_order] and
+        labels[edge_order] are in representative order, for a graph with the
+        given edges and an isomorphism from get_isomorphisms_vf2, which maps
+        representative vertex j to phi[j].
+        """
+        edge_index = {edge: i for i, edge in enumerate(edges)}
+        edge_order = [
+            edge_index[(phi[source], phi[target])] for source, target in self.edges
+        ]
+        return list(phi), edge_order
+
+    def role_colorings(self) -> np.ndarray:
+        """
+        Role codes per vertex that only use allowed edges, with at most one
+        main victim.
+        """
+        colorings = [
+            roles
+            for roles in itertools.product(range(len(ROLES)), repeat=self.size)
+            if roles.count(ROLE_CODES["main_victim"]) <= 1
+            and all(
+                (roles[source], roles[target]) in ALLOWED_ROLE_PAIRS
+                for source, target in self.edges
+            )
+        ]
+        return np.array(colorings, dtype=np.int64).reshape(-1, self.size)
+
+    def canonical_keys(
+        self, node_labels: np.ndarray, edge_labels: np.ndarray
+    ) -> np.ndarray:
+        """
+        Canonical key of every (node labeling, edge labeling) combination.
+        """
+        node_shifts = _node_shifts(self.size)
+        edge_shifts = _edge_shifts(len(self.edges))
+        keys = None
+        for node_order, edge_order in self.automorphisms:
+            node_codes = (node_labels[:, node_order] << node_shifts).sum(axis=1)
+            edge_codes = (edge_labels[:, edge_order] << edge_shifts).sum(axis=1)
+            permuted = node_codes[:, None] + edge_codes[None, :]
+            keys = permuted if keys is None else np.minimum(keys, permuted)
+        assert keys is not None
+        return _key_base(self.size, self.iso_class) + keys.ravel()
+
+
+def _decode(
+    keys: np.ndarray, size: int, num_edges: int
+) -> tuple[np.ndarray, np.ndarray]:
+    node_labels = keys[:, None] >> _node_shifts(size) & 0b111
+    edge_labels = keys[:, None] >> _edge_shifts(num_edges) & 0b111
+    return node_labels, edge_labels
+
+
+def _wl_hashes(keys: np.ndarray, size: int, edges: list[tuple[int, int]]) -> np.ndarray:
+    """
+    WL hashes of the colored motifs with the given keys, as 16 byte rows.
+    """
+    node_labels, edge_labels = _decode(keys, size, len(edges))
+    offsets = size * np.arange(len(keys))
+    graph_hashes = weisfeiler_lehman_hashes_batch(
+        (np.array(edges)[None, :, :] + offsets[:, None, None]).reshape(-1, 2),
+        np.repeat(np.arange(len(keys)), size),
+        node_labels.ravel(),
+        edge_labels.ravel(),
+    )
+    return np.frombuffer(bytes.fromhex("".join(graph_hashes)), dtype=np.uint8).reshape(
+        -1, 16
+    )
+
+
+class MotifCatalog:
+    """
+    Sorted canonical keys and WL hashes of every reachable colored motif, per
+    (node_flavor, edge_flavor).
+    """
+
+    def __init__(
+        self,
+        keys: dict[tuple[str, str], np.ndarray],
+        hashes: dict[tuple[str, str], np.ndarray],
+        sizes: Sequence[int] = CATALOG_SIZES,
+    ) -> None:
+        self.keys = keys
+        # Raw 16 byte digests, one row per motif id.
+        self.hashes = hashes
+        self.sizes = tuple(sizes)
+        # Every flavor's keys behind its flavor index, still sorted, so one
+        # searchsorted resolves all flavors of an occurrence.
+        self._all_keys = np.concatenate(
+            [
+                flavor_index << _FLAVOR_SHIFT | self.keys[flavors]
+                for flavor_index, flavors in enumerate(FLAVORS)
+            ]
+        )
+        self._all_hashes = np.concatenate([self.hashes[flavors] for flavors in FLAVORS])
+        self._offsets = np.cumsum(
+            [0] + [len(self.keys[flavors]) for flavors in FLAVORS]
+        )
+        self._flavor_prefix = (np.arange(len(FLAVORS)) << _FLAVOR_SHIFT).reshape(
+            len(NODE_FLAVORS), len(EDGE_FLAVORS)
+        )
+        self._iso_classes = {
+            (size, iso_class): _IsoClass(size, iso_class)
+            for size in self.sizes
+            for iso_class in range(_num_iso_classes(size))
+        }
+        # (size, edge mask) -> key base, node orders and weighted edge orders of
+        # every isomorphism onto the iso class representative.
+        self._patterns: dict[
+            tuple[int, int], tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        ] = {}
+
+    @classmethod
+    def build(cls, sizes: Sequence[int] = CATALOG_SIZES) -> "MotifCatalog":
+        keys: dict[tuple[str, str], list[np.ndarray]] = {
+            flavors: [] for flavors in FLAVORS
+        }
+        hashes: dict[tuple[str, str], list[np.ndarray]] = {
+            flavors: [] for flavors in keys
+        }
+        for size in sizes:
+            for iso_class in range(_num_iso_classes(size)):
+                iso = _IsoClass(size, iso_class)
+                if not iso.graph.is_connected(mode="weak"):
+                    continue
+                roles = iso.role_colorings()
+                if len(roles) == 0:
+                    continue
+                for (node_flavor, edge_flavor), flavor_keys in keys.items():
+                    node_labels = np.unique(
+                        MAPPED_TYPE_TABLES[node_flavor][roles], axis=0
+                    )
+                    edge_labels = np.array(
+                        list(
+                            itertools.product(
+                                _edge_labels(edge_flavor), repeat=len(iso.edges)
+                            )
+                        ),
+                        dtype=np.int64,
+                    ).reshape(-1, len(iso.edges))
+                    iso_keys = np.unique(iso.canonical_keys(node_labels, edge_labels))
+                    flavor_keys.append(iso_keys)
+                    hashes[(node_flavor, edge_flavor)].append(
+                        _wl_hashes(iso_keys, size, iso.edges)
+                    )
+            logger.info(f"Catalogued size {size} motifs")
+        # Sizes and iso classes are visited in key order, so the keys stay sorted.
+        return cls(
+            {flavors: np.concatenate(arrays) for flavors, arrays in keys.items()},
+            {flavors: np.concatenate(arrays) for flavors, arrays in hashes.items()},
+            sizes,
+        )
+
+    def save(self, path: Path = CATALOG_PATH) -> None:
+        # Any, savez_compressed types its **kwds like its allow_pickle flag.
+        arrays: dict[str, Any] = {"sizes": np.array(self.sizes)}
+        for (node_flavor, edge_flavor), flavor_keys in self.keys.items():
+            name = f"{node_flavor}_{edge_flavor}"
+            arrays[f"keys_{name}"] = flavor_keys
+            arrays[f"hashes_{name}"] = self.hashes[(node_flavor, edge_flavor)]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: Path = CATALOG_PATH) -> "MotifCatalog":
+        with np.load(path) as arrays:
+            return cls(
+                {(nf, ef): arrays[f"keys_{nf}_{ef}"] for nf, ef in FLAVORS},
+                {(nf, ef): arrays[f"hashes_{nf}_{ef}"] for nf, ef in FLAVORS},
+                arrays["sizes"].tolist(),
+            )
+
+    def num_motifs(self, node_flavor: str, edge_flavor: str) -> int:
+        """
+        Width of the (node_flavor, edge_flavor) motif vector.
+        """
+        return len(self.keys[(node_flavor, edge_flavor)])
+
+    def motif_hash(self, node_flavor: str, edge_flavor: str, motif_id: int) -> str:
+        return self.hashes[(node_flavor, edge_flavor)][motif_id].tobytes().hex()
+
+    def _pattern(
+        self, size: int, edges: tuple[tuple[int, int], ...]
+    ) -> tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        mask = sum(1 << (source * size + target) for source, target in edges)
+        pattern = self._patterns.get((size, mask))
+        if pattern is None:
+            graph = ig.Graph(n=size, edges=list(edges), directed=True)
+            iso = self._iso_classes[(size, graph.isoclass())]
+            node_orders, edge_orders = zip(
+                *(
+                    iso.permutations(phi, edges)
+                    for phi in graph.get_isomorphisms_vf2(iso.graph)
+                )
+            )
+            pattern = self._patterns[(size, mask)] = (
+                _key_base(size, iso.iso_class),
+                np.array(node_orders, dtype=np.intp),
+                np.int64(1) << _node_shifts(size),
+                np.array(edge_orders, dtype=np.intp).reshape(len(node_orders), -1),
+                np.int64(1) << _edge_shifts(len(edges)),
+            )
+        return pattern
+
+    def lookup(
+        self,
+        edges: tuple[tuple[int, int], ...],
+        node_labels: np.ndarray,
+        edge_labels: np.ndarray,
+    ) -> dict[tuple[str, str], tuple[int, str]] | None:
+        """
+        (motif id, hash) of every flavor of one occurrence, or None if it is not
+        in the catalog.
+
+        edges are the induced edges over vertex positions, node_labels and
+        edge_labels hold one row of integer labels per NODE_FLAVORS and
+        EDGE_FLAVORS entry, in vertex and edge order.
+        """
+        size = node_labels.shape[1]
+        if size not in self.sizes:
+            return None
+        base, node_orders, node_weights, edge_orders, edge_weights = self._pattern(
+            size, edges
+        )
+        # (flavor, isomorphism) codes, the key is the smallest over isomorphisms.
+        node_codes = node_labels[:, node_orders] @ node_weights
+        edge_codes = edge_labels[:, edge_orders] @ edge_weights
+        keys = (
+            base
+            + self._flavor_prefix
+            + (node_codes[:, None, :] + edge_codes[None, :, :]).min(axis=2)
+        ).ravel()
+        positions = np.searchsorted(self._all_keys, keys)
+        clipped = np.minimum(positions, len(self._all_keys) - 1)
+        if not np.array_equal(self._all_keys[clipped], keys):
+            return None
+        motif_ids = (positions - self._offsets[:-1]).tolist()
+        return {
+            flavors: (motif_id, self._all_hashes[position].tobytes().hex())
+            for flavors, motif_id, position in zip(
+                FLAVORS, motif_ids, positions.tolist()
+            )
+        }
+
+
+@cache
+def default_catalog() -> MotifCatalog | None:
+    """
+    The catalog at CATALOG_PATH, loaded once per process, or None if it has
+    not been generated.
+    """
+    if not CATALOG_PATH.exists():
+        return None
+    return MotifCatalog.load(CATALOG_PATH)
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else CATALOG_PATH
+    catalog = MotifCatalog.build()
+    catalog.save(path)
+    for node_flavor, edge_flavor in catalog.keys:
+        logger.info(
+            f"{node_flavor}/{edge_flavor}: "
+            f"{catalog.num_motifs(node_flavor, edge_flavor)} motifs"
+        )
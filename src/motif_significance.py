@@ -0,0 +1,296 @@
+# pyright: basic
+"""
+Motif significance of the true session graphs against a degree-preserving
+null model.
+
+Every session is rewired ensemble_size times with igraph's rewire, which
+swaps edge endpoints so that every vertex keeps its in and out degree, and
+its role label since vertices never move. Each randomization is counted
+with the native motif census and folded into running Welford moments, so an
+ensemble never has to be held in memory. The z-score of iso class i is
+
+    z_i = (N_real_i - mean(N_rand_i)) / std(N_rand_i)
+
+and the significance profile of a size is z normalized to unit length
+(Milo et al. 2004), which makes sessions of different sizes comparable.
+"""
+
+import itertools
+import multiprocessing
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import cache, partial
+from typing import Any
+
+import igraph as ig
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+
+from src import database
+from src.compact_graph import CompactSessionGraph
+from src.redo_count_motifs import (
+    SIZES,
+    compact_blob,
+    motif_census,
+    seeded_igraph,
+)
+
+ENSEMBLE_SIZE = 100
+# igraph's default number of rewiring trials is 10 per edge.
+SWAPS_PER_EDGE = 10
+# Sessions per worker task, each costs ensemble_size censuses per size.
+SIGNIFICANCE_BATCH_SIZE = 50
+# Rows buffered before they are inserted.
+SIGNIFICANCE_INSERT_ROWS = 100_000
+
+
+@cache
+def connected_classes(size: int) -> np.ndarray:
+    """
+    Iso classes of weakly connected size vertex digraphs, igraph reports the
+    others as NaN.
+    """
+    counts = ig.Graph(n=size, directed=True).motifs_randesu(size=size)
+    return np.flatnonzero(~np.isnan(np.asarray(counts, dtype=np.float64)))
+
+
+@dataclass
+class CensusMoments:
+    """
+    Running mean and sum of squared deviations of censuses, Welford's update.
+    """
+
+    num_classes: int
+    count: int = 0
+    mean: np.ndarray = field(init=False)
+    m2: np.ndarray = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.mean = np.zeros(self.num_classes, dtype=np.float64)
+        self.m2 = np.zeros(self.num_classes, dtype=np.float64)
+
+    def add(self, census: np.ndarray) -> None:
+        self.count += 1
+        delta = census - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (census - self.mean)
+
+    @property
+    def std(self) -> np.ndarray:
+        """
+        Sample standard deviation, 0 before there are two censuses.
+        """
+        if self.count < 2:
+            return np.zeros(self.num_classes, dtype=np.float64)
+        return np.sqrt(self.m2 / (self.count - 1))
+
+
+def z_scores(census: np.ndarray, moments: CensusMoments) -> np.ndarray:
+    """
+    Standardized census. Classes the null model never varies on get 0 if the
+    real count matches it and NaN otherwise.
+    """
+    std = moments.std
+    deviation = census - moments.mean
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = deviation / std
+    z[std == 0] = np.where(deviation[std == 0] == 0, 0.0, np.nan)
+    return z
+
+
+def significance_profile(z: np.ndarray) -> np.ndarray:
+    """
+    z over its Euclidean norm, NaN entries left out of the norm.
+    """
+    norm = np.sqrt(np.nansum(z**2))
+    if norm == 0:
+        return np.zeros_like(z)
+    return z / norm
+
+
+def rewired_igraphs(
+    session_igraph: ig.Graph, ensemble_size: int, swaps_per_edge: int
+) -> Iterator[ig.Graph]:
+    """
+    ensemble_size independent degree-preserving randomizations, one at a time.
+    """
+    for _ in range(ensemble_size):
+        randomized = session_igraph.copy()
+        randomized.rewire(n=swaps_per_edge * randomized.ecount())
+        yield randomized
+
+
+def null_model_moments(
+    session_igraph: ig.Graph,
+    sizes: Iterable[int],
+    ensemble_size: int = ENSEMBLE_SIZE,
+    swaps_per_edge: int = SWAPS_PER_EDGE,
+) -> dict[int, CensusMoments]:
+    """
+    Census moments per motif size over the rewired ensemble of a session.
+    """
+    sizes = list(sizes)
+    moments: dict[int, CensusMoments] = {}
+    for randomized in rewired_igraphs(session_igraph, ensemble_size, swaps_per_edge):
+        for size in sizes:
+            census = motif_census(randomized, size)
+            if size not in moments:
+                moments[size] = CensusMoments(len(census))
+            moments[size].add(census)
+    return moments
+
+
+def session_significance_rows(
+    session_G: CompactSessionGraph,
+    sizes: Iterable[int] = SIZES,
+    ensemble_size: int = ENSEMBLE_SIZE,
+    swaps_per_edge: int = SWAPS_PER_EDGE,
+    seed: int = 0,
+) -> list[dict[str, Any]]:
+    """
+    One row per size and connected iso class that occurs in the session or
+    its null model. Rewiring is seeded per (seed, unit_id).
+    """
+    sizes = list(sizes)
+    # The census only needs the structure, attribute-free copies are cheaper.
+    session_igraph = ig.Graph(
+        n=session_G.num_nodes,
+        edges=session_G.edges.reshape(-1, 2).tolist(),
+        directed=True,
+    )
+    with seeded_igraph(f"{seed}-{session_G.unit_id}"):
+        moments = null_model_moments(
+            session_igraph, sizes, ensemble_size, swaps_per_edge
+        )
+    rows = []
+    for size in sizes:
+        census = motif_census(session_igraph, size)
+        size_moments = moments.get(size, CensusMoments(len(census)))
+        classes = connected_classes(size)
+        mean, std = size_moments.mean[classes], size_moments.std[classes]
+        z = z_scores(census, size_moments)[classes]
+        profile = significance_profile(z)
+        for iso_class, count, null_mean, null_std, z_score, significance in zip(
+            classes.tolist(),
+            census[classes].tolist(),
+            mean.tolist(),
+            std.tolist(),
+            z.tolist(),
+            profile.tolist(),
+        ):
+            if count == 0 and null_mean == 0:
+                continue
+            rows.append(
+                {
+                    "unit_id": session_G.unit_id,
+                    "size": size,
+                    "iso_class": iso_class,
+                    "motif_count": count,
+                    "null_mean": null_mean,
+                    "null_std": null_std,
+                    "z_score": z_score,
+                    "significance": significance,
+                    "ensemble_size": size_moments.count,
+                }
+            )
+    return rows
+
+
+def _significance_rows(
+    blobs: tuple[bytes, ...],
+    sizes: tuple[int, ...],
+    ensemble_size: int,
+    swaps_per_edge: int,
+    seed: int,
+) -> list[dict[str, Any]]:
+    rows = []
+    for blob in blobs:
+        rows += session_significance_rows(
+            CompactSessionGraph.from_bytes(blob),
+            sizes,
+            ensemble_size,
+            swaps_per_edge,
+            seed,
+        )
+    return rows
+
+
+def significance_rows(
+    session_blobs: Iterable[bytes],
+    workers: int = 1,
+    batch_size: int = SIGNIFICANCE_BATCH_SIZE,
+    sizes: Iterable[int] = SIZES,
+    ensemble_size: int = ENSEMBLE_SIZE,
+    swaps_per_edge: int = SWAPS_PER_EDGE,
+    seed: int = 0,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    session_significance_rows of serialized session graphs, one list of rows
+    per batch of batch_size sessions, in input order. At most two batches per
+    worker are in flight, and rows do not depend on workers or batch_size.
+    """
+    batches = itertools.batched(map(compact_blob, session_blobs), batch_size)
+    find_rows = partial(
+        _significance_rows,
+        sizes=tuple(sizes),
+        ensemble_size=ensemble_size,
+        swaps_per_edge=swaps_per_edge,
+        seed=seed,
+    )
+    if workers <= 1:
+        yield from map(find_rows, batches)
+        return
+
+    # Forked workers would inherit the connection pool's threads and locks.
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    ) as executor:
+        pending: deque[Future[list[dict[str, Any]]]] = deque()
+        for blobs in batches:
+            pending.append(executor.submit(find_rows, blobs))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def find_and_insert_motif_significance(
+    workers: int = 1,
+    batch_size: int = SIGNIFICANCE_BATCH_SIZE,
+    sizes: Iterable[int] = SIZES,
+    ensemble_size: int = ENSEMBLE_SIZE,
+    swaps_per_edge: int = SWAPS_PER_EDGE,
+    seed: int = 0,
+) -> None:
+    """
+    Stream the true session graphs from the database and insert their motif
+    z-scores and significance profiles into motif_significance, whenever
+    SIGNIFICANCE_INSERT_ROWS rows are buffered.
+    """
+    buffered: list[dict[str, Any]] = []
+    num_rows = 0
+    with database.stage():
+        for rows in significance_rows(
+            tqdm(database.iter_session_graph_blobs()),
+            workers,
+            batch_size,
+            sizes,
+            ensemble_size,
+            swaps_per_edge,
+            seed,
+        ):
+            buffered += rows
+            if len(buffered) >= SIGNIFICANCE_INSERT_ROWS:
+                database.insert_motif_significance_rows(buffered)
+                num_rows += len(buffered)
+                buffered = []
+        if buffered:
+            database.insert_motif_significance_rows(buffered)
+            num_rows += len(buffered)
+    logger.info(
+        f"{num_rows} motif significance rows from {ensemble_size} "
+        f"randomizations per session"
+    )
@@ -1,52 +1,217 @@
+import itertools
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Any
 from uuid import uuid4
 
+import numpy as np
+from loguru import logger
 from tqdm.auto import tqdm
 
 from src import database
 from src.session import Session
 from src.session_digraph import SessionDiGraph
+from src.session_array_graph import SessionArrayGraph
 from src.graph_builder import GraphBuilder
 from src.author_role import AuthorRole
 
+SESSION_CHUNK_SIZE = 64
+GRAPH_ENGINES: dict[str, type[SessionDiGraph] | type[SessionArrayGraph]] = {
+    "networkx": SessionDiGraph,
+    "array": SessionArrayGraph,
+}
 
-def load_sessions_and_comments(
+
+def build_session_graph(
+    session: Session,
+    comments: list[AuthorRole],
+    is_true_graph: bool,
+    snapshot_directory: Path | None = None,
+    engine: str = "networkx",
+    ensemble_index: int = 0,
+) -> SessionDiGraph | SessionArrayGraph:
+    session_G = GRAPH_ENGINES[engine].from_session(
+        session, is_true_graph, ensemble_index
+    )
+    # Snapshots need every intermediate edge, otherwise resolve them in bulk.
+    builder = GraphBuilder(
+        session_G, snapshot_directory, lazy_edges=snapshot_directory is None
+    )
+    MAIN_VICTIM = "main_victim"
+    builder.add_node(
+        AuthorRole(
+            unit_id=session.unit_id,
+            comment_id=uuid4(),
+            author_name=session.owner_user_name,
+            role=MAIN_VICTIM,
+            severity=0.0,
+            timestamp=session.posted_at,
+        )
+    )
+    for author_role in comments:
+        builder.add_node(author_role)
+        builder.add_edge(author_role)
+    builder.finalize()
+    return session_G
+
+
+def null_model_orderings(
+    unit_id: int, comments: list[AuthorRole], ensemble_size: int, seed: int
+) -> Iterator[tuple[int, list[AuthorRole]]]:
+    """
+    Yield ensemble_size (ensemble_index, shuffled comments) pairs.
+
+    The permutations are drawn in one call from a generator seeded by
+    (seed, unit_id), so a session's ensemble does not depend on how the
+    sessions are chunked or which worker builds them.
+    """
+    rng = np.random.default_rng([seed, unit_id])
+    orders = rng.permuted(np.tile(np.arange(len(comments)), (ensemble_size, 1)), axis=1)
+    for ensemble_index, order in enumerate(orders):
+        yield ensemble_index, [comments[i] for i in order]
+
+
+def _session_rows(
+    session: Session,
+    comments: list[AuthorRole],
+    is_true_graph: bool,
+    snapshot_directory: Path | None,
+    serialization: str,
+    engine: str,
+    ensemble_size: int,
+    seed: int,
+) -> list[dict[str, Any]]:
+    if is_true_graph:
+        orderings: Iterable[tuple[int, list[AuthorRole]]] = [(0, comments)]
+    else:
+        orderings = null_model_orderings(session.unit_id, comments, ensemble_size, seed)
+    return [
+        build_session_graph(
+            session,
+            ordered_comments,
+            is_true_graph,
+            snapshot_directory,
+            engine,
+            ensemble_index,
+        ).to_dict(serialization)
+        for ensemble_index, ordered_comments in orderings
+    ]
+
+
+def _build_session_graph_rows(
+    session_rows: Callable[[Session, list[AuthorRole]], list[dict[str, Any]]],
+    chunk: tuple[tuple[Session, list[AuthorRole]], ...],
+) -> tuple[int, float, list[dict[str, Any]]]:
+    start = time.perf_counter()
+    rows = [
+        row for session, comments in chunk for row in session_rows(session, comments)
+    ]
+    return os.getpid(), time.perf_counter() - start, rows
+
+
+def session_graph_rows(
+    session_comments: Iterable[tuple[Session, list[AuthorRole]]],
     is_true_graph: bool,
-) -> tuple[list[Session], dict[int, list[AuthorRole]]]:
-    should_shuffle_comments = False if is_true_graph else True
-    sessions = database.query_sessions()
-    comments = database.query_comments(should_shuffle_comments)
-    session_comments: dict[int, list[AuthorRole]] = {}
-    for comment in comments:
-        if comment.unit_id in session_comments:
-            session_comments[comment.unit_id].append(comment)
-        else:
-            session_comments[comment.unit_id] = [comment]
-    return sessions, session_comments
+    snapshot_directory: Path | None = None,
+    serialization: str = "pickle",
+    workers: int = 1,
+    chunk_size: int = SESSION_CHUNK_SIZE,
+    engine: str = "networkx",
+    ensemble_size: int = 1,
+    seed: int = 0,
+) -> Iterator[dict[str, Any]]:
+    """
+    Build and serialize session graphs, yielding their rows in input order.
+
+    Null-model graphs (is_true_graph=False) are built ensemble_size times per
+    session from seeded permutations of its comments, see null_model_orderings.
+
+    With workers > 1 the sessions are sharded into chunks that are built in a
+    process pool. At most two chunks per worker are in flight, and results are
+    collected in submission order so the output is deterministic.
+    """
+    session_rows = partial(
+        _session_rows,
+        is_true_graph=is_true_graph,
+        snapshot_directory=snapshot_directory,
+        serialization=serialization,
+        engine=engine,
+        ensemble_size=ensemble_size,
+        seed=seed,
+    )
+    if workers <= 1:
+        for session, comments in session_comments:
+            yield from session_rows(session, comments)
+        return
+
+    worker_graphs: dict[int, int] = defaultdict(int)
+    worker_seconds: dict[int, float] = defaultdict(float)
+    # Forked workers would inherit the connection pool's threads and locks.
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    ) as executor:
+        pending: deque[Future[tuple[int, float, list[dict[str, Any]]]]] = deque()
+
+        def collect() -> list[dict[str, Any]]:
+            pid, seconds, rows = pending.popleft().result()
+            worker_graphs[pid] += len(rows)
+            worker_seconds[pid] += seconds
+            return rows
+
+        for chunk in itertools.batched(session_comments, chunk_size):
+            pending.append(
+                executor.submit(_build_session_graph_rows, session_rows, chunk)
+            )
+            if len(pending) >= 2 * workers:
+                yield from collect()
+        while pending:
+            yield from collect()
+
+    for pid, num_graphs in worker_graphs.items():
+        seconds = worker_seconds[pid]
+        rate = num_graphs / seconds if seconds > 0 else float("inf")
+        logger.info(
+            f"Worker {pid}: {num_graphs} graphs in {seconds:.1f}s "
+            f"({rate:.1f} graphs/s)"
+        )
 
 
 def build_session_graphs(
-    snapshot_directory: Path | None, is_true_graph: bool = True
+    snapshot_directory: Path | None,
+    is_true_graph: bool = True,
+    serialization: str = "pickle",
+    workers: int = 1,
+    chunk_size: int = SESSION_CHUNK_SIZE,
+    engine: str = "networkx",
+    ensemble_size: int = 1,
+    seed: int | None = None,
 ) -> None:
-    sessions, session_comments = load_sessions_and_comments(is_true_graph)
-    session_graphs: list[SessionDiGraph] = []
-    for session in tqdm(sessions):
-        session_G = SessionDiGraph.from_session(session, is_true_graph)
-        builder = GraphBuilder(session_G, snapshot_directory)
-        MAIN_VICTIM = "main_victim"
-        builder.add_node(
-            AuthorRole(
-                unit_id=session.unit_id,
-                comment_id=uuid4(),
-                author_name=session.owner_user_name,
-                role=MAIN_VICTIM,
-                severity=0.0,
-                timestamp=session.posted_at,
-            )
+    """
+    Build and insert the true session graphs, or with is_true_graph=False an
+    ensemble of ensemble_size null-model graphs per session. Comments are read
+    once either way, in posted order, and shuffled in process.
+    """
+    if seed is None:
+        seed = int(np.random.default_rng().integers(2**63))
+    if not is_true_graph:
+        logger.info(f"Null-model ensemble of {ensemble_size}, seed {seed}")
+    with database.stage():
+        session_comments = database.iter_session_comments(shuffle_comments=False)
+        rows = session_graph_rows(
+            tqdm(session_comments),
+            is_true_graph,
+            snapshot_directory,
+            serialization,
+            workers,
+            chunk_size,
+            engine,
+            ensemble_size,
+            seed,
         )
-        comments = session_comments[session.unit_id]
-        for author_role in comments:
-            builder.add_node(author_role)
-            builder.add_edge(author_role)
-        session_graphs.append(session_G)
-    database.insert_session_digraph(session_graphs)
+        database.insert_session_digraph_rows(rows)
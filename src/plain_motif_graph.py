@@ -14,6 +14,8 @@ class PlainMotifGraph:
         iso_class: int,
         graph: ig.Graph,
         graph_hash: str,
+        vertices: tuple[int, ...] | None = None,
+        count: int = 1,
     ) -> None:
         self.plain_motif_id: UUID = plain_motif_id
         self.unit_id: int = unit_id
@@ -21,6 +23,10 @@ class PlainMotifGraph:
         self.iso_class: int = iso_class
         self.graph: ig.Graph = graph
         self.graph_hash: str = graph_hash
+        # Session graph vertex ids of the occurrence, not serialized.
+        self.vertices: tuple[int, ...] | None = vertices
+        # Occurrences of the iso class, tallied by count_motifs, not serialized.
+        self.count: int = count
 
     @override
     def __eq__(self, other: object) -> bool:
@@ -1,9 +1,24 @@
 # pyright: basic
-from collections import defaultdict
+import itertools
+import multiprocessing
+import os
+import pickle
+import random
+import time
+from array import array
+from collections import defaultdict, deque
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from queue import Queue
+from typing import Any
 from uuid import uuid4
 
 
 import igraph as ig
+import numpy as np
+import psutil
 from loguru import logger
 from tqdm import tqdm
 import pyarrow as pa
@@ -11,17 +26,43 @@ import pyarrow.parquet as pq
 
 from src import database
 from src import graph_hashing
+from src import motif_catalog
+from src.color_coding import (
+    ColorCoding,
+    color_coding_counts,
+    count_flavored_motifs,
+)
 from src.plain_motif_graph import PlainMotifGraph
-from src.flavored_motif_graph import FlavoredMotifGraph
+from src.flavored_motif_graph import FlavoredMotifGraph, FlavoredMotifLabeler
 from src.session_digraph import SessionDiGraph
+from src.session_array_graph import SessionArrayGraph
+from src.compact_graph import MAGIC, CompactSessionGraph, igraph_from_arrays
 
-NODE_FLAVORS = ["fine", "coarse"]
-EDGE_FLAVORS = ["fine", "coarse", "unweighted"]
 SIZES = [3, 4]
+MOTIF_BATCH_SIZE = 1_000
+MAX_INFLIGHT_BYTES = 256 * 2**20
+# Estimated occurrences of one size in one session above which aggregate mode
+# samples the session instead of enumerating it.
+MAX_EXACT_OCCURRENCES = 2_000_000
+# Seconds it takes to flavor and count one occurrence, see
+# MotifSampling.time_budget. find_and_insert_all_motifs logs the measured rate.
+OCCURRENCE_SECONDS = 20e-6
+# Two-sided 95% normal quantile.
+CONFIDENCE_Z = 1.959964
+
+
+def _cut_prob(size: int, sampling_probability: float) -> list[float] | None:
+    """
+    RAND-ESU cut probabilities that only cut the last level of the search
+    tree, so every occurrence is kept independently with sampling_probability.
+    """
+    if sampling_probability >= 1.0:
+        return None
+    return [0.0] * (size - 1) + [1.0 - sampling_probability]
 
 
 def compute_motifs_randesu(
-    session_igraph: ig.Graph, size: int
+    session_igraph: ig.Graph, size: int, sampling_probability: float = 1.0
 ) -> dict[int, list[tuple[int]]]:
     collected_motify_vertices: dict[int, list[tuple[int]]] = defaultdict(list)
 
@@ -29,25 +70,148 @@ def compute_motifs_randesu(
         # Not fully sure hat vertices contains...
         collected_motify_vertices[iso_class].append(tuple(vertices))
 
-    session_igraph.motifs_randesu(size=size, callback=motifs_callback)
+    session_igraph.motifs_randesu(
+        size=size,
+        cut_prob=_cut_prob(size, sampling_probability),
+        callback=motifs_callback,
+    )
     return collected_motify_vertices
 
 
+def estimate_motif_occurrences(edges: np.ndarray, num_nodes: int, size: int) -> float:
+    """
+    Upper bound on the connected size vertex subgraphs, which is what motif
+    enumeration visits, from the degrees of the simple undirected graph. A
+    connected 3-set has a vertex adjacent to the other two, a connected 4-set
+    spans a 3-star or a path of three edges.
+    """
+    pairs = np.unique(np.sort(np.asarray(edges).reshape(-1, 2), axis=1), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    degrees = np.bincount(pairs.ravel(), minlength=num_nodes).astype(np.float64)
+    if size == 3:
+        return float((degrees * (degrees - 1) / 2).sum())
+    if size == 4:
+        stars = (degrees * (degrees - 1) * (degrees - 2) / 6).sum()
+        paths = ((degrees[pairs[:, 0]] - 1) * (degrees[pairs[:, 1]] - 1)).sum()
+        return float(stars + paths)
+    raise ValueError(f"No occurrence estimate for size {size} motifs")
+
+
+def count_confidence_interval(
+    hash_count: int, sampling_probability: float, z: float = CONFIDENCE_Z
+) -> tuple[float, float]:
+    """
+    Normal confidence interval of the occurrences behind hash_count sampled
+    ones, hash_count / p plus or minus z standard deviations, floored at 0.
+    """
+    estimate = hash_count / sampling_probability
+    half_width = (
+        z * np.sqrt(hash_count * (1 - sampling_probability)) / (sampling_probability)
+    )
+    return max(0.0, estimate - half_width), estimate + half_width
+
+
+@dataclass(frozen=True)
+class MotifSampling:
+    """
+    When aggregate mode samples a session instead of enumerating it.
+
+    A session is sampled for a motif size if its estimated occurrences,
+    see estimate_motif_occurrences, exceed max_occurrences, or would take
+    longer than time_budget seconds to flavor and count at
+    seconds_per_occurrence. The sampling probability brings it back under
+    both. It only depends on the session's degrees and these settings, not
+    on timings, so sampled counts do not depend on workers, batch order or
+    machine speed. RAND-ESU then only cuts the last
+    level of the search tree, so each occurrence is kept independently:
+    hash_count / p is unbiased with variance hash_count (1 - p) / p^2.
+    Sampling is seeded per (seed, unit_id, size).
+    """
+
+    max_occurrences: int = MAX_EXACT_OCCURRENCES
+    time_budget: float | None = None
+    seconds_per_occurrence: float = OCCURRENCE_SECONDS
+    seed: int = 0
+
+    def sampling_probability(self, estimated_occurrences: float) -> float:
+        budget = float(self.max_occurrences)
+        if self.time_budget is not None:
+            budget = min(budget, self.time_budget / self.seconds_per_occurrence)
+        if estimated_occurrences <= budget:
+            return 1.0
+        return budget / estimated_occurrences
+
+    def sampling_probabilities(
+        self, session_G: CompactSessionGraph
+    ) -> dict[int, float]:
+        return {
+            size: self.sampling_probability(
+                estimate_motif_occurrences(session_G.edges, session_G.num_nodes, size)
+            )
+            for size in SIZES
+        }
+
+
+# Aggregate runs sample sessions past the default budget unless told not to.
+DEFAULT_SAMPLING = MotifSampling()
+
+
+@contextmanager
+def seeded_igraph(seed: str) -> Iterator[None]:
+    """
+    Run igraph's random draws, e.g. RAND-ESU cuts, from a generator seeded
+    with seed, and hand igraph back the random module afterwards.
+    """
+    ig.set_random_number_generator(random.Random(seed))
+    try:
+        yield
+    finally:
+        ig.set_random_number_generator(random)
+
+
+def motif_census(session_igraph: ig.Graph, size: int) -> np.ndarray:
+    """
+    Occurrences per iso class, straight from igraph's native count vector.
+
+    Skips the per-occurrence Python callback of compute_motifs_randesu, use
+    that only when the motif vertices are needed to flavor them. Classes that
+    are not connected come back as NaN from igraph and are counted as 0.
+    """
+    counts = np.asarray(session_igraph.motifs_randesu(size=size), dtype=np.float64)
+    return np.nan_to_num(counts, nan=0.0).astype(np.int64)
+
+
+def to_session_igraph(
+    session_G: SessionDiGraph | SessionArrayGraph | CompactSessionGraph,
+) -> ig.Graph:
+    if isinstance(session_G, SessionDiGraph):
+        return ig.Graph.from_networkx(session_G)
+    return session_G.to_igraph()
+
+
 def find_session_graph_motifs(
-    session_G: SessionDiGraph, size: int
+    session_G: SessionDiGraph | SessionArrayGraph | CompactSessionGraph,
+    size: int,
+    session_igraph: ig.Graph | None = None,
 ) -> list[PlainMotifGraph]:
     """
     Transform and store the found motifs for the associated unit_id session digraph.
     """
-    session_igraph = ig.Graph.from_networkx(session_G)
+    if session_igraph is None:
+        session_igraph = to_session_igraph(session_G)
     unit_id = session_G.unit_id
     motifies_vertices = compute_motifs_randesu(session_igraph, size)
     plain_motifs: list[PlainMotifGraph] = []
     for iso_class, subgraphs_vertices in tqdm(motifies_vertices.items()):
         for motif_vertices in subgraphs_vertices:
             motif_sub_graph = session_igraph.induced_subgraph(motif_vertices)
-            plain_graph_hash = graph_hashing.weisfeiler_lehman_graph_hash(
-                motif_sub_graph
+            # The unlabeled hash is isomorphism invariant, so the iso class
+            # determines it.
+            plain_graph_hash = graph_hashing.motif_hash_cache.get(
+                ("plain", size, iso_class),
+                lambda motif_sub_graph=motif_sub_graph: graph_hashing.motif_graph_hash(
+                    motif_sub_graph
+                ),
             )
             plain_motif_id = uuid4()
             plain_motif = PlainMotifGraph(
@@ -57,6 +221,7 @@ def find_session_graph_motifs(
                 iso_class,
                 motif_sub_graph,
                 plain_graph_hash,
+                motif_vertices,
             )
             plain_motifs.append(plain_motif)
 
@@ -69,19 +234,14 @@ def find_session_graph_motifs(
 def flavor_plain_motifs(
     plain_motifs: list[PlainMotifGraph],
 ):
-    for node_flavor in NODE_FLAVORS:
-        for edge_flavor in EDGE_FLAVORS:
-            flavored_motifs: list[FlavoredMotifGraph] = []
-            for plain_motif in tqdm(plain_motifs):
-                flavored_motif = FlavoredMotifGraph.from_plain_motif(
-                    plain_motif, node_flavor, edge_flavor
-                )
-                flavored_motifs.append(flavored_motif)
-            database.insert_flavored_motifs(flavored_motifs)
+    flavored_motifs: list[FlavoredMotifGraph] = []
+    for plain_motif in tqdm(plain_motifs):
+        flavored_motifs += FlavoredMotifGraph.from_plain_motif_all_flavors(plain_motif)
+    database.insert_flavored_motifs(flavored_motifs)
 
 
 def find_plain_motifs(
-    session_graphs: list[SessionDiGraph],
+    session_graphs: list[SessionDiGraph | CompactSessionGraph],
 ) -> list[PlainMotifGraph]:
     plain_motifs: list[PlainMotifGraph] = []
     for session_G in session_graphs:
@@ -90,8 +250,801 @@ def find_plain_motifs(
     return plain_motifs
 
 
-def find_and_insert_all_motifs():
-    session_graphs = database.query_session_graphs()
-    plain_motifs = find_plain_motifs(session_graphs)
-    database.insert_plain_motifs(plain_motifs)
-    flavor_plain_motifs(plain_motifs)
+def find_session_motifs(
+    session_G: SessionDiGraph | SessionArrayGraph | CompactSessionGraph,
+) -> tuple[list[PlainMotifGraph], list[FlavoredMotifGraph]]:
+    """
+    Plain motifs of every size plus all their flavors, labeled straight from
+    the session graph by a FlavoredMotifLabeler.
+    """
+    session_igraph = to_session_igraph(session_G)
+    labeler = FlavoredMotifLabeler(session_igraph, motif_catalog.default_catalog())
+    plain_motifs: list[PlainMotifGraph] = []
+    flavored_motifs: list[FlavoredMotifGraph] = []
+    for size in SIZES:
+        for plain_motif in find_session_graph_motifs(session_G, size, session_igraph):
+            plain_motifs.append(plain_motif)
+            flavored_motifs += labeler.flavor(plain_motif)
+    return plain_motifs, flavored_motifs
+
+
+def session_motif_census(
+    session_G: SessionDiGraph | SessionArrayGraph | CompactSessionGraph,
+    sizes: list[int] = SIZES,
+) -> dict[int, np.ndarray]:
+    session_igraph = to_session_igraph(session_G)
+    return {size: motif_census(session_igraph, size) for size in sizes}
+
+
+def count_all_motifs() -> dict[int, dict[int, np.ndarray]]:
+    """
+    Per-session iso class counts for every motif size, keyed by unit_id.
+    """
+    with database.stage():
+        session_graphs = database.query_session_graphs()
+    return {
+        session_G.unit_id: session_motif_census(session_G)
+        for session_G in tqdm(session_graphs)
+    }
+
+
+def as_compact(
+    session_G: SessionDiGraph | SessionArrayGraph | CompactSessionGraph,
+) -> CompactSessionGraph:
+    """
+    The compact form of a session graph in any of the repo's representations.
+    """
+    if isinstance(session_G, CompactSessionGraph):
+        return session_G
+    if isinstance(session_G, SessionArrayGraph):
+        return session_G.to_compact()
+    return CompactSessionGraph.from_session_digraph(session_G)
+
+
+@dataclass
+class SessionGraphBatch:
+    """
+    Session graphs packed into one disjoint-union igraph.
+
+    Session i owns vertices offsets[i]:offsets[i + 1], in its own vertex
+    order. Motifs never span weakly connected components, so every
+    occurrence found on the union belongs to exactly one session.
+    """
+
+    igraph: ig.Graph
+    unit_ids: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def pack(
+        cls,
+        session_graphs: Sequence[
+            SessionDiGraph | SessionArrayGraph | CompactSessionGraph
+        ],
+    ) -> "SessionGraphBatch":
+        compact_graphs = [as_compact(session_G) for session_G in session_graphs]
+        offsets = np.zeros(len(compact_graphs) + 1, dtype=np.int64)
+        np.cumsum([G.num_nodes for G in compact_graphs], out=offsets[1:])
+        session_igraph = igraph_from_arrays(
+            np.concatenate([G.role_codes for G in compact_graphs]),
+            np.concatenate(
+                [
+                    G.edges.reshape(-1, 2) + offset
+                    for G, offset in zip(compact_graphs, offsets)
+                ]
+            ),
+            np.concatenate([G.weights for G in compact_graphs]),
+            np.concatenate([G.edge_types for G in compact_graphs]),
+        )
+        unit_ids = np.array([G.unit_id for G in compact_graphs], dtype=np.int64)
+        return cls(session_igraph, unit_ids, offsets)
+
+    def session_index(self, vertices: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.offsets, vertices, side="right") - 1
+
+    def occurrences(
+        self, size: int, sampling_probability: float = 1.0
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (iso_classes, vertices) of every motif occurrence, one motifs_randesu
+        run for the whole batch. vertices has one row per occurrence. With
+        sampling_probability < 1 each occurrence is only kept with that
+        probability.
+        """
+        # Flat int64 arrays, per-occurrence containers would keep the garbage
+        # collector busy on batches with millions of occurrences.
+        iso_classes = array("q")
+        vertices = array("q")
+
+        def motifs_callback(graph, motif_vertices, iso_class):
+            iso_classes.append(iso_class)
+            vertices.extend(motif_vertices)
+
+        self.igraph.motifs_randesu(
+            size=size,
+            cut_prob=_cut_prob(size, sampling_probability),
+            callback=motifs_callback,
+        )
+        return (
+            np.frombuffer(iso_classes, dtype=np.int64),
+            np.frombuffer(vertices, dtype=np.int64).reshape(-1, size),
+        )
+
+    def session_occurrences(
+        self, size: int, sampling_probability: float = 1.0
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        occurrences split by session, one (iso_classes, vertices) pair per
+        session in batch order.
+        """
+        iso_classes, vertices = self.occurrences(size, sampling_probability)
+        sessions = self.session_index(vertices[:, 0])
+        order = np.argsort(sessions, kind="stable")
+        iso_classes, vertices = iso_classes[order], vertices[order]
+        bounds = np.searchsorted(sessions[order], np.arange(len(self.unit_ids) + 1))
+        return [
+            (iso_classes[start:end], vertices[start:end])
+            for start, end in itertools.pairwise(bounds.tolist())
+        ]
+
+    def session_motifs(
+        self, session: int, size: int, iso_classes: np.ndarray, vertices: np.ndarray
+    ) -> Iterator[PlainMotifGraph]:
+        """
+        Plain motifs of the occurrences of session, one at a time. Motif
+        vertices are batch vertex ids.
+        """
+        unit_id = int(self.unit_ids[session])
+        for i in range(len(iso_classes)):
+            motif_vertices = tuple(vertices[i].tolist())
+            iso_class = int(iso_classes[i])
+            motif_sub_graph = self.igraph.induced_subgraph(motif_vertices)
+            plain_graph_hash = graph_hashing.motif_hash_cache.get(
+                ("plain", size, iso_class),
+                lambda motif_sub_graph=motif_sub_graph: graph_hashing.motif_graph_hash(
+                    motif_sub_graph
+                ),
+            )
+            yield PlainMotifGraph(
+                uuid4(),
+                unit_id,
+                size,
+                iso_class,
+                motif_sub_graph,
+                plain_graph_hash,
+                motif_vertices,
+            )
+
+    def motif_census(self, size: int) -> np.ndarray:
+        """
+        Per-session iso class counts, one row per session.
+        """
+        iso_classes, vertices = self.occurrences(size)
+        num_classes = len(ig.Graph(n=size, directed=True).motifs_randesu(size=size))
+        census = np.zeros((len(self.unit_ids), num_classes), dtype=np.int64)
+        np.add.at(census, (self.session_index(vertices[:, 0]), iso_classes), 1)
+        return census
+
+
+def find_batch_motifs(
+    batch: SessionGraphBatch, size: int, sampling_probability: float = 1.0
+) -> list[PlainMotifGraph]:
+    """
+    find_session_graph_motifs for every session of a batch, grouped by
+    session. Motif vertices are batch vertex ids.
+    """
+    plain_motifs: list[PlainMotifGraph] = []
+    for session, (iso_classes, vertices) in enumerate(
+        batch.session_occurrences(size, sampling_probability)
+    ):
+        if len(iso_classes) == 0:
+            logger.warning(f"Failed to find any motifs for {batch.unit_ids[session]}")
+        plain_motifs += batch.session_motifs(session, size, iso_classes, vertices)
+    return plain_motifs
+
+
+def compact_blob(blob: bytes) -> bytes:
+    """
+    A pickled or compact session graph blob, as compact bytes.
+    """
+    if blob.startswith(MAGIC):
+        return blob
+    return as_compact(pickle.loads(blob)).to_bytes()
+
+
+ROW_KINDS = ("plain_rows", "flavored_rows", "count_rows", "catalog_rows")
+# Rough size of a row without its serialized_motif, for the memory budget.
+ROW_OVERHEAD_BYTES = 256
+
+
+@dataclass
+class MotifRowChunk:
+    """
+    Motif rows of one batch, or of part of it, with worker statistics.
+
+    Occurrence mode fills plain_rows and flavored_rows, aggregate mode fills
+    count_rows and catalog_rows instead. sampled lists the (unit_id, size,
+    sampling_probability) of every session aggregate mode sampled, colorings
+    the (unit_id, size, number of colorings) of every color-coded one.
+    occurrence_seconds is the time spent finding and flavoring the
+    num_occurrences RAND-ESU occurrences, num_sessions counts the sessions
+    the chunk finishes and num_bytes estimates the size of its rows.
+    """
+
+    pid: int = 0
+    seconds: float = 0.0
+    num_sessions: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    rss: int = 0
+    num_occurrences: int = 0
+    occurrence_seconds: float = 0.0
+    num_bytes: int = 0
+    plain_rows: list[dict[str, Any]] = field(default_factory=list)
+    flavored_rows: list[dict[str, Any]] = field(default_factory=list)
+    count_rows: list[dict[str, Any]] = field(default_factory=list)
+    catalog_rows: list[dict[str, Any]] = field(default_factory=list)
+    sampled: list[tuple[int, int, float]] = field(default_factory=list)
+    colorings: list[tuple[int, int, int]] = field(default_factory=list)
+
+    def add(self, kind: str, rows: list[dict[str, Any]]) -> None:
+        """
+        Append rows to the kind rows, sized by their serialized_motif blobs,
+        which dominate a row, plus ROW_OVERHEAD_BYTES per row.
+        """
+        getattr(self, kind).extend(rows)
+        self.num_bytes += sum(
+            len(row.get("serialized_motif", b"")) + ROW_OVERHEAD_BYTES for row in rows
+        )
+
+
+class _MotifChunker:
+    """
+    Collects the rows of a worker into MotifRowChunks of about max_bytes,
+    adding the worker statistics when a chunk is flushed.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self._reset()
+
+    def _reset(self) -> None:
+        cache = graph_hashing.motif_hash_cache
+        self.chunk: MotifRowChunk = MotifRowChunk()
+        self.start: float = time.perf_counter()
+        self.hits, self.misses = cache.hits, cache.misses
+
+    @property
+    def full(self) -> bool:
+        return self.chunk.num_bytes >= self.max_bytes
+
+    def flush(self) -> Iterator[MotifRowChunk]:
+        cache = graph_hashing.motif_hash_cache
+        chunk = self.chunk
+        chunk.pid = os.getpid()
+        chunk.seconds = time.perf_counter() - self.start
+        chunk.cache_hits = cache.hits - self.hits
+        chunk.cache_misses = cache.misses - self.misses
+        chunk.rss = psutil.Process().memory_info().rss
+        yield chunk
+        # After the consumer is done with it, its time is not ours.
+        self._reset()
+
+
+def _catalog_row(
+    key: tuple[str, str, str], size: int, flavored_motif: FlavoredMotifGraph
+) -> dict[str, Any]:
+    return {
+        "node_flavor": key[0],
+        "edge_flavor": key[1],
+        "motif_hash": key[2],
+        "size": size,
+        "serialized_motif": flavored_motif.to_dict()["serialized_motif"],
+    }
+
+
+def _count_row(
+    unit_id: int,
+    size: int,
+    key: tuple[str, str, str],
+    hash_count: int,
+    sampling_probability: float,
+    count_variance: float,
+) -> dict[str, Any]:
+    return {
+        "unit_id": unit_id,
+        "size": size,
+        "node_flavor": key[0],
+        "edge_flavor": key[1],
+        "motif_hash": key[2],
+        "hash_count": hash_count,
+        "sampling_probability": sampling_probability,
+        "count_variance": count_variance,
+    }
+
+
+def _occurrence_bytes(session_G: CompactSessionGraph) -> float:
+    """
+    Upper bound on the bytes the occurrence arrays of session_G take for its
+    largest size while SessionGraphBatch.session_occurrences sorts them:
+    int64 iso classes and vertices, found and in session order, plus the
+    session index and the sort order.
+    """
+    return max(
+        16
+        * (size + 2)
+        * estimate_motif_occurrences(session_G.edges, session_G.num_nodes, size)
+        for size in SIZES
+    )
+
+
+def _occurrence_groups(
+    session_graphs: list[CompactSessionGraph], max_bytes: int
+) -> Iterator[list[CompactSessionGraph]]:
+    """
+    Consecutive runs of session_graphs whose occurrence arrays, see
+    _occurrence_bytes, fit max_bytes together. A session over max_bytes gets
+    a run of its own.
+    """
+    group: list[CompactSessionGraph] = []
+    group_bytes = 0.0
+    for session_G in session_graphs:
+        num_bytes = _occurrence_bytes(session_G)
+        if group and group_bytes + num_bytes > max_bytes:
+            yield group
+            group, group_bytes = [], 0.0
+        group.append(session_G)
+        group_bytes += num_bytes
+    if group:
+        yield group
+
+
+def _size_motif_rows(
+    chunker: _MotifChunker,
+    batch: SessionGraphBatch,
+    labeler: FlavoredMotifLabeler,
+    size: int,
+    sampling_probability: float,
+    seed: int,
+    aggregate: bool,
+    representatives: dict[tuple[str, str, str], FlavoredMotifGraph],
+) -> Iterator[MotifRowChunk]:
+    """
+    Rows of the size motifs of every session of batch, added to chunker,
+    which is flushed whenever it is full. The occurrence arrays are dropped
+    when the rows are done.
+    """
+    occurrence_start = time.perf_counter()
+    if sampling_probability < 1.0:
+        with seeded_igraph(f"{seed}-{int(batch.unit_ids[0])}-{size}"):
+            occurrences = batch.session_occurrences(size, sampling_probability)
+    else:
+        occurrences = batch.session_occurrences(size)
+    chunker.chunk.occurrence_seconds += time.perf_counter() - occurrence_start
+
+    for session, (iso_classes, vertices) in enumerate(occurrences):
+        unit_id = int(batch.unit_ids[session])
+        if len(iso_classes) == 0:
+            logger.warning(f"Failed to find any motifs for {unit_id}")
+        if aggregate:
+            # Counted from the vertex sets, only the first occurrence of a
+            # hash gets a motif graph, to be serialized.
+            occurrence_start = time.perf_counter()
+            num_representatives = len(representatives)
+            counts = count_flavored_motifs(
+                batch.igraph,
+                labeler,
+                unit_id,
+                size,
+                (tuple(row.tolist()) for row in vertices),
+                representatives,
+            )
+            if sampling_probability < 1.0:
+                chunker.chunk.sampled.append((unit_id, size, sampling_probability))
+            chunker.chunk.add(
+                "count_rows",
+                [
+                    _count_row(
+                        unit_id,
+                        size,
+                        key,
+                        hash_count,
+                        sampling_probability,
+                        hash_count
+                        * (1 - sampling_probability)
+                        / sampling_probability**2,
+                    )
+                    for key, hash_count in counts.items()
+                ],
+            )
+            for key, flavored_motif in itertools.islice(
+                representatives.items(), num_representatives, None
+            ):
+                chunker.chunk.add(
+                    "catalog_rows", [_catalog_row(key, size, flavored_motif)]
+                )
+            chunker.chunk.num_occurrences += len(iso_classes)
+            chunker.chunk.occurrence_seconds += time.perf_counter() - occurrence_start
+            if chunker.full:
+                yield from chunker.flush()
+            continue
+
+        for plain_motif in batch.session_motifs(session, size, iso_classes, vertices):
+            occurrence_start = time.perf_counter()
+            chunker.chunk.add("plain_rows", [plain_motif.to_dict()])
+            chunker.chunk.add(
+                "flavored_rows",
+                [
+                    flavored_motif.to_dict()
+                    for flavored_motif in labeler.flavor(plain_motif)
+                ],
+            )
+            chunker.chunk.num_occurrences += 1
+            chunker.chunk.occurrence_seconds += time.perf_counter() - occurrence_start
+            if chunker.full:
+                yield from chunker.flush()
+
+
+def _find_batch_motif_rows(
+    blobs: tuple[bytes, ...],
+    aggregate: bool = False,
+    hash_backend: str = "wl",
+    sampling: MotifSampling | None = None,
+    color_coding: ColorCoding | None = None,
+    max_chunk_bytes: int = MAX_INFLIGHT_BYTES,
+) -> Iterator[MotifRowChunk]:
+    """
+    Motif rows of a batch of compact graph blobs, one occurrence at a time.
+
+    Sessions are enumerated in runs whose occurrence arrays fit
+    max_chunk_bytes, see _occurrence_groups, one motif size at a time, and
+    the arrays of a size are dropped before the next one is enumerated. A
+    session over the budget on its own is the floor. A chunk is split off
+    whenever its rows reach max_chunk_bytes, so the rows held never exceed
+    that by more than one occurrence's rows, or one session's count rows.
+    """
+    graph_hashing.use_hash_backend(hash_backend)
+    chunker = _MotifChunker(max_chunk_bytes)
+    session_graphs = [CompactSessionGraph.from_bytes(blob) for blob in blobs]
+    # Sessions to sample are enumerated on their own, the rest in runs.
+    exact_graphs = session_graphs
+    sampled_graphs: list[tuple[CompactSessionGraph, dict[int, float]]] = []
+    seed = 0 if sampling is None else sampling.seed
+    if aggregate and sampling is not None:
+        exact_graphs = []
+        for session_G in session_graphs:
+            probabilities = sampling.sampling_probabilities(session_G)
+            if min(probabilities.values()) < 1.0:
+                sampled_graphs.append((session_G, probabilities))
+            else:
+                exact_graphs.append(session_G)
+    groups = [
+        (group, dict.fromkeys(SIZES, 1.0))
+        for group in _occurrence_groups(exact_graphs, max_chunk_bytes)
+    ]
+    groups += [
+        ([session_G], probabilities) for session_G, probabilities in sampled_graphs
+    ]
+
+    # The flavored motif this worker sent to the catalog for every hash.
+    representatives: dict[tuple[str, str, str], FlavoredMotifGraph] = {}
+    for graphs, probabilities in groups:
+        batch = SessionGraphBatch.pack(graphs)
+        labeler = FlavoredMotifLabeler(batch.igraph, motif_catalog.default_catalog())
+        for size in SIZES:
+            yield from _size_motif_rows(
+                chunker,
+                batch,
+                labeler,
+                size,
+                probabilities[size],
+                seed,
+                aggregate,
+                representatives,
+            )
+
+        for session_G in graphs:
+            if aggregate and color_coding is not None:
+                for size in color_coding.sizes:
+                    estimate = color_coding_counts(session_G, size, color_coding)
+                    if estimate.num_colorings:
+                        chunker.chunk.colorings.append(
+                            (session_G.unit_id, size, estimate.num_colorings)
+                        )
+                    elif estimate.keep_probability < 1.0:
+                        chunker.chunk.sampled.append(
+                            (session_G.unit_id, size, estimate.keep_probability)
+                        )
+                    chunker.chunk.add(
+                        "count_rows",
+                        [
+                            _count_row(
+                                session_G.unit_id,
+                                size,
+                                key,
+                                hash_count,
+                                estimate.sampling_probability,
+                                estimate.count_variance(key),
+                            )
+                            for key, hash_count in estimate.hash_counts.items()
+                        ],
+                    )
+                    for key, flavored_motif in estimate.representatives.items():
+                        if key not in representatives:
+                            representatives[key] = flavored_motif
+                            chunker.chunk.add(
+                                "catalog_rows",
+                                [_catalog_row(key, size, flavored_motif)],
+                            )
+            chunker.chunk.num_sessions += 1
+            if chunker.full:
+                yield from chunker.flush()
+    yield from chunker.flush()
+
+
+# The chunk queues of a worker process, see _batch_motif_rows.
+_chunk_queues: "list[Queue[MotifRowChunk | None]]" = []
+
+
+def _init_motif_worker(chunk_queues: "list[Queue[MotifRowChunk | None]]") -> None:
+    global _chunk_queues
+    _chunk_queues = chunk_queues
+
+
+def _put_batch_motif_rows(slot: int, blobs: tuple[bytes, ...], **kwargs: Any) -> None:
+    """
+    Worker side of _batch_motif_rows, hands every chunk to the parent through
+    queue slot and ends with None.
+    """
+    chunks = _chunk_queues[slot]
+    try:
+        for chunk in _find_batch_motif_rows(blobs, **kwargs):
+            chunks.put(chunk)
+    finally:
+        chunks.put(None)
+
+
+def _batch_motif_rows(
+    session_blobs: Iterable[bytes],
+    workers: int,
+    batch_size: int,
+    aggregate: bool,
+    hash_backend: str,
+    sampling: MotifSampling | None,
+    color_coding: ColorCoding | None,
+    max_chunk_bytes: int,
+) -> Iterator[MotifRowChunk]:
+    batches = itertools.batched(map(compact_blob, session_blobs), batch_size)
+    kwargs: dict[str, Any] = {
+        "aggregate": aggregate,
+        "hash_backend": hash_backend,
+        "sampling": sampling,
+        "color_coding": color_coding,
+        "max_chunk_bytes": max_chunk_bytes,
+    }
+    if workers <= 1:
+        for blobs in batches:
+            yield from _find_batch_motif_rows(blobs, **kwargs)
+        return
+
+    # Each batch in flight streams its chunks through a queue of one, so a
+    # worker ahead of the batch being read blocks instead of piling up rows.
+    # A batch reuses the queue of the batch 2 * workers before it, which has
+    # been read to its end by then.
+    num_slots = 2 * workers
+    # Forked workers would inherit the connection pool's threads and locks.
+    context = multiprocessing.get_context("forkserver")
+    with context.Manager() as manager:
+        chunk_queues = [manager.Queue(maxsize=1) for _ in range(num_slots)]
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_motif_worker,
+            initargs=(chunk_queues,),
+        )
+        pending: deque[tuple[Future[None], int]] = deque()
+
+        def drain(future: Future[None], slot: int) -> Iterator[MotifRowChunk]:
+            while (chunk := chunk_queues[slot].get()) is not None:
+                yield chunk
+            future.result()
+
+        try:
+            for index, blobs in enumerate(batches):
+                slot = index % num_slots
+                future = executor.submit(_put_batch_motif_rows, slot, blobs, **kwargs)
+                pending.append((future, slot))
+                if len(pending) >= num_slots:
+                    yield from drain(*pending.popleft())
+            while pending:
+                yield from drain(*pending.popleft())
+        finally:
+            # Workers still putting chunks nobody reads would block forever,
+            # so unread batches are cancelled and the queues shut down first.
+            executor.shutdown(wait=not pending, cancel_futures=True)
+    executor.shutdown()
+
+
+def motif_rows(
+    session_blobs: Iterable[bytes],
+    workers: int = 1,
+    batch_size: int = MOTIF_BATCH_SIZE,
+    aggregate: bool = False,
+    hash_backend: str | None = None,
+    sampling: MotifSampling | None = DEFAULT_SAMPLING,
+    color_coding: ColorCoding | None = None,
+    max_chunk_bytes: int = MAX_INFLIGHT_BYTES,
+) -> Iterator[MotifRowChunk]:
+    """
+    Find and flavor the motifs of serialized session graphs, one chunk of rows
+    per batch of batch_size sessions, in input order. A batch whose rows
+    reach max_chunk_bytes is split into several chunks, even within a
+    session, and its occurrences are enumerated in runs of sessions that fit
+    max_chunk_bytes, see _find_batch_motif_rows.
+
+    With aggregate=True the occurrences are not kept. Each chunk holds the
+    per-session count of every (size, node_flavor, edge_flavor, motif_hash)
+    and one serialized representative per flavored hash not seen in an
+    earlier chunk. Huge sessions are sampled rather than enumerated, see
+    MotifSampling, their count rows carry the sampling_probability and the
+    count_variance of hash_count / sampling_probability. sampling=None
+    enumerates every session. Occurrence mode always enumerates.
+
+    Aggregate mode also estimates the color_coding.sizes motifs, which igraph
+    cannot enumerate, see color_coding.ColorCoding. Their count rows carry
+    the expected number of times an occurrence is counted as
+    sampling_probability, which can exceed 1 for color-coded sessions,
+    hash_count / sampling_probability is again the estimate and
+    count_variance its variance.
+
+    Motifs are hashed with hash_backend, by default the backend selected in
+    this process, see graph_hashing.use_hash_backend.
+
+    Workers get compact graph blobs, pickled graphs are converted first. At
+    most two batches per worker are in flight, and a worker blocks once it
+    has a chunk ready that has not been read yet. With many workers, lower
+    batch_size so that there are several batches per worker.
+    """
+    if color_coding is not None:
+        if not aggregate:
+            raise ValueError("Color coding only estimates aggregate motif counts")
+        if set(color_coding.sizes) & set(SIZES):
+            raise ValueError(f"Size {SIZES} motifs are counted by RAND-ESU")
+    if hash_backend is None:
+        hash_backend = graph_hashing.hash_backend()
+    catalogued: set[tuple[str, str, str]] = set()
+    for chunk in _batch_motif_rows(
+        session_blobs,
+        workers,
+        batch_size,
+        aggregate,
+        hash_backend,
+        sampling,
+        color_coding,
+        max_chunk_bytes,
+    ):
+        catalog_rows = []
+        for row in chunk.catalog_rows:
+            key = (row["node_flavor"], row["edge_flavor"], row["motif_hash"])
+            if key not in catalogued:
+                catalogued.add(key)
+                catalog_rows.append(row)
+        chunk.catalog_rows = catalog_rows
+        yield chunk
+
+
+@dataclass
+class StageMemory:
+    """
+    Peak resident set size seen per pipeline stage, sampled between steps.
+    """
+
+    peaks: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    def sample(self, stage: str, rss: int | None = None) -> None:
+        if rss is None:
+            rss = psutil.Process().memory_info().rss
+        self.peaks[stage] = max(self.peaks[stage], rss)
+
+    def sampled(self, stage: str, items: Iterable[Any]) -> Iterator[Any]:
+        for item in items:
+            self.sample(stage)
+            yield item
+
+    def log(self) -> None:
+        for stage, peak in self.peaks.items():
+            logger.info(f"Peak RSS {stage}: {peak / 2**20:.1f} MiB")
+
+
+def find_and_insert_all_motifs(
+    batch_size: int = MOTIF_BATCH_SIZE,
+    workers: int = 1,
+    max_inflight_bytes: int = MAX_INFLIGHT_BYTES,
+    aggregate: bool = False,
+    hash_backend: str | None = None,
+    sampling: MotifSampling | None = DEFAULT_SAMPLING,
+    color_coding: ColorCoding | None = None,
+) -> None:
+    """
+    Stream the session graphs from the database, find and flavor their
+    motifs session by session, and insert every chunk of rows motif_rows
+    produces. max_inflight_bytes is shared by every chunk that can be alive
+    at once and by the occurrence arrays the chunks are enumerated from, so
+    memory stays around it however many occurrences a batch has. A single
+    session's occurrence arrays of one size are never split.
+
+    With aggregate=True only the motif_counts and motif_catalog tables are
+    written, see motif_rows, instead of one plain_motifs and six
+    flavored_motifs rows per occurrence. hash_backend, sampling and
+    color_coding are passed on to motif_rows.
+    """
+    insert_rows = {
+        "plain_rows": database.insert_plain_motif_rows,
+        "flavored_rows": database.insert_flavored_motif_rows,
+        "count_rows": database.insert_motif_count_rows,
+        "catalog_rows": database.insert_motif_catalog_rows,
+    }
+    worker_sessions: dict[int, int] = defaultdict(int)
+    worker_seconds: dict[int, float] = defaultdict(float)
+    cache_hits = cache_misses = 0
+    num_occurrences, occurrence_seconds = 0, 0.0
+    memory = StageMemory()
+    # The chunk being inserted and the next one, plus per batch in flight the
+    # one its worker builds, the one it is putting and the one queued, and
+    # per worker the occurrence arrays it enumerates rows from.
+    inflight_chunks = 3 if workers <= 1 else 2 + 3 * 2 * workers + workers
+    max_chunk_bytes = max(1, max_inflight_bytes // inflight_chunks)
+
+    with database.stage():
+        session_blobs = memory.sampled(
+            "read", tqdm(database.iter_session_graph_blobs())
+        )
+        chunks = motif_rows(
+            session_blobs,
+            workers,
+            batch_size,
+            aggregate,
+            hash_backend,
+            sampling,
+            color_coding,
+            max_chunk_bytes,
+        )
+        for chunk in chunks:
+            for unit_id, size, probability in chunk.sampled:
+                logger.info(
+                    f"Sampled size {size} motifs of session {unit_id} "
+                    f"with probability {probability:.3g}"
+                )
+            for unit_id, size, num_colorings in chunk.colorings:
+                logger.info(
+                    f"Estimated size {size} motifs of session {unit_id} "
+                    f"from {num_colorings} colorings"
+                )
+            worker_sessions[chunk.pid] += chunk.num_sessions
+            worker_seconds[chunk.pid] += chunk.seconds
+            cache_hits += chunk.cache_hits
+            cache_misses += chunk.cache_misses
+            num_occurrences += chunk.num_occurrences
+            occurrence_seconds += chunk.occurrence_seconds
+            memory.sample("motifs", chunk.rss)
+            for kind, insert in insert_rows.items():
+                rows = getattr(chunk, kind)
+                if rows:
+                    insert(rows)
+            memory.sample("insert")
+
+    for pid, num_sessions in worker_sessions.items():
+        seconds = worker_seconds[pid]
+        rate = num_sessions / seconds if seconds > 0 else float("inf")
+        logger.info(
+            f"Worker {pid}: {num_sessions} sessions in {seconds:.1f}s "
+            f"({rate:.1f} sessions/s)"
+        )
+    logger.info(f"Motif hash cache: {cache_hits} hits, {cache_misses} misses")
+    if num_occurrences:
+        # What MotifSampling.seconds_per_occurrence should be on this machine.
+        logger.info(
+            f"{num_occurrences} occurrences, "
+            f"{occurrence_seconds / num_occurrences * 1e6:.1f}us per occurrence"
+        )
+    memory.log()
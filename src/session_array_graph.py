@@ -0,0 +1,460 @@
+# pyright: basic
+from typing import Any
+
+import igraph as ig
+import numpy as np
+
+from src.author_role import AuthorRole
+from src.compact_graph import (
+    EDGE_TYPE_CODES,
+    NO_EDGE_TYPE,
+    ROLE_CODES,
+    ROLES,
+    CompactSessionGraph,
+    serialize_session_graph,
+)
+from src.session import Session
+from src.session_digraph import BULLY_TYPES, DEFENDER_TYPES, VICTIM_TYPES
+
+VICTIM_CODES = [ROLE_CODES[role] for role in VICTIM_TYPES]
+BULLY_CODES = [ROLE_CODES[role] for role in BULLY_TYPES]
+DEFENDER_CODES = [ROLE_CODES[role] for role in DEFENDER_TYPES]
+_INITIAL_CAPACITY = 16
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    if size < len(array):
+        return array
+    grown = np.zeros(max(size + 1, 2 * len(array)), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class SessionArrayGraph:
+    """
+    Array backed alternative to SessionDiGraph with the same statistics API.
+
+    Nodes are interned to integer ids on insertion, roles are kept as small
+    integer codes and edges accumulate in growable arrays, with a (u, v) -> slot
+    index to merge the weights of repeated edges. Exports to igraph without
+    going through networkx.
+    """
+
+    def __init__(
+        self,
+        unit_id: int,
+        owner_username: str,
+        owner_comment: str,
+        num_likes: int,
+        num_bullying_comments: int,
+        num_comments: int,
+        topic_vector: list[int],
+        is_true_graph: bool,
+        ensemble_index: int = 0,
+    ) -> None:
+        self.unit_id: int = unit_id
+        self.owner_username: str = owner_username
+        self.owner_comment: str = owner_comment
+        self.num_likes: int = num_likes
+        self.num_bullying_comments: int = num_bullying_comments
+        self.num_comments: int = num_comments
+        self.topic_vector: np.ndarray = np.array(topic_vector)
+        self.is_true_graph: bool = is_true_graph
+        # Which member of a null-model ensemble this is, 0 for true graphs.
+        self.ensemble_index: int = ensemble_index
+
+        self._node_ids: dict[AuthorRole, int] = {}
+        self._nodes: list[AuthorRole] = []
+        self._role_codes = np.zeros(_INITIAL_CAPACITY, dtype=np.uint8)
+        self._layers = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        self._main_victim_id: int = -1
+
+        self._edge_slots: dict[tuple[int, int], int] = {}
+        self._sources = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        self._targets = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        self._weights = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        self._edge_types = np.zeros(_INITIAL_CAPACITY, dtype=np.int8)
+        self._num_edges: int = 0
+        self._statistics: dict[str, float] | None = None
+
+    @classmethod
+    def from_session(
+        cls, session: Session, is_true_graph: bool, ensemble_index: int = 0
+    ) -> "SessionArrayGraph":
+        return cls(
+            unit_id=session.unit_id,
+            owner_username=session.owner_user_name,
+            owner_comment=session.owner_comment,
+            num_likes=session.num_likes,
+            num_bullying_comments=session.num_bullying_comments,
+            num_comments=session.num_comments,
+            topic_vector=session.topic_vector,
+            is_true_graph=is_true_graph,
+            ensemble_index=ensemble_index,
+        )
+
+    @property
+    def main_victim(self) -> AuthorRole:
+        if self._main_victim_id < 0:
+            raise AttributeError("Main victim was never added.")
+        return self._nodes[self._main_victim_id]
+
+    def most_frequent_topic(self) -> str:
+        topics = [
+            "Disability",
+            "Gender",
+            "Intellectual",
+            "Physical",
+            "Political",
+            "Race",
+            "Religious",
+            "Sexual",
+            "Social_status",
+            "Other",
+        ]
+        most_freq_topic_index = int(np.argmax(self.topic_vector))
+        return topics[most_freq_topic_index]
+
+    def has_node(self, node: AuthorRole) -> bool:
+        return node in self._node_ids
+
+    def has_edge(self, u: AuthorRole, v: AuthorRole) -> bool:
+        u_id, v_id = self._node_ids.get(u), self._node_ids.get(v)
+        return (u_id, v_id) in self._edge_slots
+
+    def add_node(self, value: AuthorRole, type: str, layer: float) -> None:
+        if value.role == "main_victim" and self.has_node(value):
+            raise AssertionError(
+                "Main Victim is already set. Did you mean to add it twice?"
+            )
+        node_id = self._node_ids.get(value)
+        if node_id is None:
+            node_id = len(self._nodes)
+            self._node_ids[value] = node_id
+            self._nodes.append(value)
+            self._role_codes = _grow(self._role_codes, node_id)
+            self._layers = _grow(self._layers, node_id)
+            self._statistics = None
+        elif self._role_codes[node_id] != ROLE_CODES[type]:
+            raise ValueError(f"{value} was already added as another type.")
+        self._role_codes[node_id] = ROLE_CODES[type]
+        self._layers[node_id] = layer
+        if value.role == "main_victim":
+            self._main_victim_id = node_id
+
+    def add_edge(self, u_of_edge: AuthorRole, v_of_edge: AuthorRole, **attrs) -> None:
+        u = self._node_ids.get(u_of_edge)
+        v = self._node_ids.get(v_of_edge)
+        if u is None or v is None:
+            raise ValueError("Either u or v was not added to the graph.")
+        slot = self._edge_slots.get((u, v))
+        if slot is not None:  # existing edge, update the weight
+            self._weights[slot] += attrs["weight"]
+        else:
+            slot = self._num_edges
+            self._edge_slots[(u, v)] = slot
+            self._sources = _grow(self._sources, slot)
+            self._targets = _grow(self._targets, slot)
+            self._weights = _grow(self._weights, slot)
+            self._edge_types = _grow(self._edge_types, slot)
+            self._sources[slot] = u
+            self._targets[slot] = v
+            self._weights[slot] = attrs.get("weight", 1)
+            self._edge_types[slot] = EDGE_TYPE_CODES.get(
+                attrs.get("type", ""), NO_EDGE_TYPE
+            )
+            self._num_edges += 1
+        self._statistics = None
+
+    def add_star_edges(
+        self,
+        center: AuthorRole,
+        others: list[AuthorRole],
+        weight: float,
+        type_: str,
+        inbound: bool = False,
+    ) -> None:
+        """
+        Same as add_edge(center, other, weight=weight, type=type_) for every
+        other (other -> center when inbound), hashing center only once.
+        """
+        c = self._node_ids.get(center)
+        if c is None:
+            raise ValueError("Either u or v was not added to the graph.")
+        for other in others:
+            o = self._node_ids.get(other)
+            if o is None:
+                raise ValueError("Either u or v was not added to the graph.")
+            u, v = (o, c) if inbound else (c, o)
+            slot = self._edge_slots.get((u, v))
+            if slot is not None:
+                self._weights[slot] += weight
+                continue
+            slot = self._num_edges
+            self._edge_slots[(u, v)] = slot
+            self._sources = _grow(self._sources, slot)
+            self._targets = _grow(self._targets, slot)
+            self._weights = _grow(self._weights, slot)
+            self._edge_types = _grow(self._edge_types, slot)
+            self._sources[slot] = u
+            self._targets[slot] = v
+            self._weights[slot] = weight
+            self._edge_types[slot] = EDGE_TYPE_CODES.get(type_, NO_EDGE_TYPE)
+            self._num_edges += 1
+        self._statistics = None
+
+    @property
+    def role_codes(self) -> np.ndarray:
+        return self._role_codes[: self.num_nodes]
+
+    @property
+    def edges(self) -> np.ndarray:
+        m = self._num_edges
+        return np.column_stack([self._sources[:m], self._targets[:m]])
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self._weights[: self._num_edges]
+
+    @property
+    def percent_comments_bullying(self) -> float:
+        return float(self.num_bullying_comments) / float(self.num_comments)
+
+    @property
+    def node_types(self) -> dict[AuthorRole, str]:
+        return {node: ROLES[code] for node, code in zip(self._nodes, self.role_codes)}
+
+    def _nodes_with(self, codes: list[int]) -> set[AuthorRole]:
+        mask = np.isin(self.role_codes, codes)
+        return {self._nodes[i] for i in np.flatnonzero(mask)}
+
+    @property
+    def defenders(self) -> set[AuthorRole]:
+        return self._nodes_with(DEFENDER_CODES)
+
+    @property
+    def victims(self) -> set[AuthorRole]:
+        return self._nodes_with(VICTIM_CODES)
+
+    @property
+    def bullies(self) -> set[AuthorRole]:
+        return self._nodes_with(BULLY_CODES)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return self._num_edges
+
+    def _compute_statistics(self) -> dict[str, float]:
+        n, m = self.num_nodes, self._num_edges
+        role_codes = self.role_codes
+        sources, targets = self._sources[:m], self._targets[:m]
+        weights = self._weights[:m]
+        degrees = {
+            "in_deg": np.bincount(targets, minlength=n).astype(np.float64),
+            "out_deg": np.bincount(sources, minlength=n).astype(np.float64),
+            "weighted_in_deg": np.bincount(targets, weights=weights, minlength=n),
+            "weighted_out_deg": np.bincount(sources, weights=weights, minlength=n),
+        }
+        role_counts = np.bincount(role_codes, minlength=len(ROLES))
+        groups = {
+            "victim": np.isin(role_codes, VICTIM_CODES),
+            "bully": np.isin(role_codes, BULLY_CODES),
+        }
+        statistics: dict[str, float] = {
+            "num_victims": int(role_counts[VICTIM_CODES].sum()),
+            "num_bullies": int(role_counts[BULLY_CODES].sum()),
+            "num_defenders": int(role_counts[DEFENDER_CODES].sum()),
+            "num_non_agg_victims": int(
+                role_counts[ROLE_CODES["non_aggressive_victim"]]
+            ),
+            "num_agg_victims": int(role_counts[ROLE_CODES["aggressive_victim"]]),
+            "num_non_agg_defenders": int(
+                role_counts[ROLE_CODES["non_aggressive_defender:support_of_the_victim"]]
+                + role_counts[ROLE_CODES["non_aggressive_defender:direct_to_the_bully"]]
+            ),
+            "num_agg_defenders": int(role_counts[ROLE_CODES["aggressive_defender"]]),
+        }
+        for name, degree in degrees.items():
+            if self._main_victim_id >= 0:
+                statistics[f"main_victim_{name}"] = float(degree[self._main_victim_id])
+            else:
+                statistics[f"main_victim_{name}"] = 0.0
+            for group, mask in groups.items():
+                values = degree[mask]
+                statistics[f"{group}_avg_{name}"] = (
+                    float(values.mean()) if len(values) > 0 else 0.0
+                )
+        return statistics
+
+    def _stat(self, name: str) -> Any:
+        if self._statistics is None:
+            self._statistics = self._compute_statistics()
+        return self._statistics[name]
+
+    @property
+    def num_bullies(self) -> int:
+        return self._stat("num_bullies")
+
+    @property
+    def num_victims(self) -> int:
+        return self._stat("num_victims")
+
+    @property
+    def num_non_agg_victims(self) -> int:
+        return self._stat("num_non_agg_victims")
+
+    @property
+    def num_agg_victims(self) -> int:
+        return self._stat("num_agg_victims")
+
+    @property
+    def num_defenders(self) -> int:
+        return self._stat("num_defenders")
+
+    @property
+    def num_non_agg_defenders(self) -> int:
+        return self._stat("num_non_agg_defenders")
+
+    @property
+    def num_agg_defenders(self) -> int:
+        return self._stat("num_agg_defenders")
+
+    @property
+    def main_victim_in_deg(self) -> float:
+        return self._stat("main_victim_in_deg")
+
+    @property
+    def main_victim_weighted_in_deg(self) -> float:
+        return self._stat("main_victim_weighted_in_deg")
+
+    @property
+    def main_victim_out_deg(self) -> float:
+        return self._stat("main_victim_out_deg")
+
+    @property
+    def main_victim_weighted_out_deg(self) -> float:
+        return self._stat("main_victim_weighted_out_deg")
+
+    @property
+    def victim_avg_in_deg(self) -> float:
+        return self._stat("victim_avg_in_deg")
+
+    @property
+    def victim_avg_weighted_in_deg(self) -> float:
+        return self._stat("victim_avg_weighted_in_deg")
+
+    @property
+    def victim_avg_out_deg(self) -> float:
+        return self._stat("victim_avg_out_deg")
+
+    @property
+    def victim_avg_weighted_out_deg(self) -> float:
+        return self._stat("victim_avg_weighted_out_deg")
+
+    @property
+    def bully_avg_in_deg(self) -> float:
+        return self._stat("bully_avg_in_deg")
+
+    @property
+    def bully_avg_weighted_in_deg(self) -> float:
+        return self._stat("bully_avg_weighted_in_deg")
+
+    @property
+    def bully_avg_out_deg(self) -> float:
+        return self._stat("bully_avg_out_deg")
+
+    @property
+    def bully_avg_weighted_out_deg(self) -> float:
+        return self._stat("bully_avg_weighted_out_deg")
+
+    @property
+    def bully_score(self) -> float:
+        return self.bully_avg_out_deg - self.bully_avg_in_deg
+
+    @property
+    def bully_score_weighted(self) -> float:
+        return self.bully_avg_weighted_out_deg - self.bully_avg_weighted_in_deg
+
+    @property
+    def victim_score(self) -> float:
+        return self.victim_avg_out_deg - self.victim_avg_in_deg
+
+    @property
+    def victim_score_weighted(self) -> float:
+        return self.victim_avg_weighted_out_deg - self.victim_avg_weighted_in_deg
+
+    @property
+    def main_victim_score(self) -> float:
+        return self.main_victim_out_deg - self.main_victim_in_deg
+
+    @property
+    def main_victim_score_weighted(self) -> float:
+        return self.main_victim_weighted_out_deg - self.main_victim_weighted_in_deg
+
+    def to_compact(self) -> CompactSessionGraph:
+        """
+        Edges are emitted grouped by source in insertion order, the order
+        networkx iterates them in, so both engines serialize identically.
+        """
+        m = self._num_edges
+        order = np.argsort(self._sources[:m], kind="stable")
+        return CompactSessionGraph(
+            unit_id=self.unit_id,
+            is_true_graph=self.is_true_graph,
+            num_likes=self.num_likes,
+            num_bullying_comments=self.num_bullying_comments,
+            num_comments=self.num_comments,
+            topic_vector=np.asarray(self.topic_vector, dtype=np.int32),
+            role_codes=self.role_codes.copy(),
+            edges=self.edges[order].astype(np.int32),
+            weights=self._weights[:m][order],
+            edge_types=self._edge_types[:m][order],
+            main_victim=self._main_victim_id,
+        )
+
+    def to_igraph(self) -> ig.Graph:
+        session_igraph = self.to_compact().to_igraph()
+        session_igraph.vs["layer"] = self._layers[: self.num_nodes].tolist()
+        return session_igraph
+
+    def to_dict(
+        self, serialization: str = "pickle"
+    ) -> dict[str, int | bool | bytes | float]:
+        seralized_graph = serialize_session_graph(self, serialization)
+        return {
+            "unit_id": self.unit_id,
+            "serialized_graph": seralized_graph,
+            "is_true_graph": self.is_true_graph,
+            "ensemble_index": self.ensemble_index,
+            "num_nodes": self.num_nodes,
+            "num_edges": self.num_edges,
+            "num_bullies": self.num_bullies,
+            "num_victims": self.num_victims,
+            "num_agg_victims": self.num_agg_victims,
+            "num_non_agg_victims": self.num_non_agg_victims,
+            "num_defenders": self.num_defenders,
+            "num_non_agg_defenders": self.num_non_agg_defenders,
+            "num_agg_defenders": self.num_agg_defenders,
+            "main_victim_in_deg": self.main_victim_in_deg,
+            "main_victim_weighted_in_deg": self.main_victim_weighted_in_deg,
+            "main_victim_out_deg": self.main_victim_out_deg,
+            "main_victim_weighted_out_deg": self.main_victim_weighted_out_deg,
+            "victim_avg_in_deg": self.victim_avg_in_deg,
+            "victim_avg_weighted_in_deg": self.victim_avg_weighted_in_deg,
+            "victim_avg_out_deg": self.victim_avg_out_deg,
+            "victim_avg_weighted_out_deg": self.victim_avg_weighted_out_deg,
+            "victim_score": self.victim_score,
+            "victim_score_weighted": self.victim_score_weighted,
+            "bully_avg_in_deg": self.bully_avg_in_deg,
+            "bully_avg_weighted_in_deg": self.bully_avg_weighted_in_deg,
+            "bully_avg_out_deg": self.bully_avg_out_deg,
+            "bully_avg_weighted_out_deg": self.bully_avg_weighted_out_deg,
+            "bully_score": self.bully_score,
+            "bully_score_weighted": self.bully_score_weighted,
+            "main_victim_score": self.main_victim_score,
+            "main_victim_score_weighted": self.main_victim_score_weighted,
+        }
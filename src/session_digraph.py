@@ -1,16 +1,32 @@
 # pyright: basic
-import pickle
-import statistics
-from numbers import Real
+from collections import Counter
+from dataclasses import dataclass
 from typing import override
 import networkx as nx
 import numpy as np
 
 from src.session import Session
 from src.author_role import AuthorRole
+from src.compact_graph import serialize_session_graph
 # NOTE: Viz separate networks for each topic (subgraphs for a given topic) and then have a victim/bully score split topic-wise
 # Shelving this idea for now. Deliberately not implementing the topic stuff.
 
+VICTIM_TYPES = ("aggressive_victim", "non_aggressive_victim", "main_victim")
+BULLY_TYPES = ("bully", "bully_assistant")
+DEFENDER_TYPES = (
+    "non_aggressive_defender:support_of_the_victim",
+    "non_aggressive_defender:direct_to_the_bully",
+    "aggressive_defender",
+)
+
+
+@dataclass
+class _DegreeSums:
+    in_deg: int = 0
+    out_deg: int = 0
+    weighted_in_deg: float = 0.0
+    weighted_out_deg: float = 0.0
+
 
 class SessionDiGraph(nx.DiGraph):
     """
@@ -29,6 +45,7 @@ class SessionDiGraph(nx.DiGraph):
         num_comments: int,
         topic_vector: list[int],
         is_true_graph: bool,
+        ensemble_index: int = 0,
     ) -> None:
         super().__init__()
         self.unit_id: int = unit_id
@@ -39,9 +56,78 @@ class SessionDiGraph(nx.DiGraph):
         self.num_comments: int = num_comments
         self.topic_vector: np.ndarray = np.array(topic_vector)
         self.is_true_graph: bool = is_true_graph
+        # Which member of a null-model ensemble this is, 0 for true graphs.
+        self.ensemble_index: int = ensemble_index
+        self._reset_statistics()
+
+    def _reset_statistics(self) -> None:
+        # Role buckets and per-bucket degree sums, kept current by add_node/add_edge
+        # so that every statistic below is O(1).
+        self._type_counts: Counter[str] = Counter()
+        self._victims: set[AuthorRole] = set()
+        self._bullies: set[AuthorRole] = set()
+        self._defenders: set[AuthorRole] = set()
+        self._node_groups: dict[AuthorRole, tuple[str, ...]] = {}
+        self._degree_sums: dict[str, _DegreeSums] = {
+            "victims": _DegreeSums(),
+            "bullies": _DegreeSums(),
+            "main_victim": _DegreeSums(),
+        }
+
+    def _rebuild_statistics(self) -> None:
+        self._reset_statistics()
+        main_victim = getattr(self, "_main_victim", None)
+        for node, data in self.nodes(data=True):
+            self._register_node(node, data["type"], is_main_victim=node is main_victim)
+        for u, v, weight in self.edges(data="weight", default=1):
+            self._register_edge(u, v, weight, is_new=True)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.__dict__.setdefault("ensemble_index", 0)
+        # Graphs pickled before the statistics were tracked incrementally.
+        if "_degree_sums" not in state:
+            self._rebuild_statistics()
+
+    def _register_node(
+        self, node: AuthorRole, type_: str, is_main_victim: bool
+    ) -> None:
+        groups: tuple[str, ...] = ()
+        if type_ in VICTIM_TYPES:
+            self._victims.add(node)
+            groups += ("victims",)
+        elif type_ in BULLY_TYPES:
+            self._bullies.add(node)
+            groups += ("bullies",)
+        elif type_ in DEFENDER_TYPES:
+            self._defenders.add(node)
+        if is_main_victim:
+            groups += ("main_victim",)
+        self._type_counts[type_] += 1
+        self._node_groups[node] = groups
+
+    def _register_edge(
+        self, u: AuthorRole, v: AuthorRole, weight: float, is_new: bool
+    ) -> None:
+        for group in self._node_groups[u]:
+            sums = self._degree_sums[group]
+            sums.out_deg += is_new
+            sums.weighted_out_deg += weight
+        for group in self._node_groups[v]:
+            sums = self._degree_sums[group]
+            sums.in_deg += is_new
+            sums.weighted_in_deg += weight
+
+    def _group_average(self, group: str, degree: str) -> float:
+        num_nodes = len(self._victims if group == "victims" else self._bullies)
+        if num_nodes == 0:
+            return 0.0
+        return float(getattr(self._degree_sums[group], degree)) / num_nodes
 
     @classmethod
-    def from_session(cls, session: Session, is_true_graph: bool) -> "SessionDiGraph":
+    def from_session(
+        cls, session: Session, is_true_graph: bool, ensemble_index: int = 0
+    ) -> "SessionDiGraph":
         return cls(
             unit_id=session.unit_id,
             owner_username=session.owner_user_name,
@@ -51,6 +137,7 @@ class SessionDiGraph(nx.DiGraph):
             num_comments=session.num_comments,
             topic_vector=session.topic_vector,
             is_true_graph=is_true_graph,
+            ensemble_index=ensemble_index,
         )
 
     @property
@@ -82,19 +169,6 @@ class SessionDiGraph(nx.DiGraph):
         most_freq_topic_index = int(np.argmax(self.topic_vector))
         return topics[most_freq_topic_index]
 
-    def _process_degrees(self, iter) -> float:
-        if isinstance(iter, Real):
-            value = float(iter)
-        else:
-            list_values = [float(v) for _, v in iter]
-            if len(list_values) > 0:
-                value = statistics.mean(list_values)
-            else:
-                value = 0.0
-        if not isinstance(value, float):
-            raise TypeError(f"value was not a float, type of value {type(value)}")
-        return value
-
     @property
     def percent_comments_bullying(self) -> float:
         return float(self.num_bullying_comments) / float(self.num_comments)
@@ -106,39 +180,19 @@ class SessionDiGraph(nx.DiGraph):
 
     @property
     def defenders(self) -> set[AuthorRole]:
-        defenders: set[AuthorRole] = set()
-        for n, type_ in self.node_types.items():
-            if (
-                type_ == "non_aggressive_defender:support_of_the_victim"
-                or type_ == "non_aggressive_defender:direct_to_the_bully"
-                or type_ == "aggressive_defender"
-            ):
-                defenders.add(n)
-        return defenders
+        return set(self._defenders)
 
     @property
     def victims(self) -> set[AuthorRole]:
-        victims: set[AuthorRole] = set()
-        for n, type_ in self.node_types.items():
-            if (
-                type_ == "aggressive_victim"
-                or type_ == "non_aggressive_victim"
-                or type_ == "main_victim"
-            ):
-                victims.add(n)
-        return victims
+        return set(self._victims)
 
     @property
     def bullies(self) -> set[AuthorRole]:
-        bullies: set[AuthorRole] = set()
-        for n, type_ in self.node_types.items():
-            if type_ == "bully" or type_ == "bully_assistant":
-                bullies.add(n)
-        return bullies
+        return set(self._bullies)
 
     @property
     def num_bullies(self) -> int:
-        return len(self.bullies)
+        return len(self._bullies)
 
     @property
     def num_nodes(self) -> int:
@@ -154,110 +208,78 @@ class SessionDiGraph(nx.DiGraph):
 
     @property
     def num_victims(self) -> int:
-        return len(self.victims)
+        return len(self._victims)
 
     @property
     def num_non_agg_victims(self) -> int:
-        return len(
-            {
-                n
-                for n, type_ in self.node_types.items()
-                if type_ == "non_aggressive_victim"
-            }
-        )
+        return self._type_counts["non_aggressive_victim"]
 
     @property
     def num_agg_victims(self) -> int:
-        return len(
-            {n for n, type_ in self.node_types.items() if type_ == "aggressive_victim"}
-        )
+        return self._type_counts["aggressive_victim"]
 
     @property
     def num_defenders(self) -> int:
-        return len(self.defenders)
+        return len(self._defenders)
 
     @property
     def num_non_agg_defenders(self) -> int:
-        return len(
-            {
-                n
-                for n, type_ in self.node_types.items()
-                if (
-                    type_ == "non_aggressive_defender:support_of_the_victim"
-                    or type_ == "non_aggressive_defender:direct_to_the_bully"
-                )
-            }
+        return (
+            self._type_counts["non_aggressive_defender:support_of_the_victim"]
+            + self._type_counts["non_aggressive_defender:direct_to_the_bully"]
         )
 
     @property
     def num_agg_defenders(self) -> int:
-        return len(
-            {
-                n
-                for n, type_ in self.node_types.items()
-                if type_ == "aggressive_defender"
-            }
-        )
+        return self._type_counts["aggressive_defender"]
 
     @property
     def main_victim_in_deg(self) -> float:
-        degree = self.in_degree(self.main_victim)
-        return self._process_degrees(degree)
+        return float(self._degree_sums["main_victim"].in_deg)
 
     @property
     def main_victim_weighted_in_deg(self) -> float:
-        degree = self.in_degree(self.main_victim, weight="weight")
-        return self._process_degrees(degree)
+        return float(self._degree_sums["main_victim"].weighted_in_deg)
 
     @property
     def main_victim_out_deg(self) -> float:
-        degree = self.out_degree(self.main_victim)
-        return self._process_degrees(degree)
+        return float(self._degree_sums["main_victim"].out_deg)
 
     @property
     def main_victim_weighted_out_deg(self) -> float:
-        degree = self.out_degree(self.main_victim, weight="weight")
-        return self._process_degrees(degree)
+        return float(self._degree_sums["main_victim"].weighted_out_deg)
 
     @property
     def victim_avg_in_deg(self) -> float:
-        degree_view = self.in_degree(nbunch=self.victims)
-        return self._process_degrees(degree_view)
+        return self._group_average("victims", "in_deg")
 
     @property
     def victim_avg_weighted_in_deg(self) -> float:
-        degree_view = self.in_degree(nbunch=self.victims, weight="weight")
-        return self._process_degrees(degree_view)
+        return self._group_average("victims", "weighted_in_deg")
 
     @property
     def victim_avg_out_deg(self) -> float:
-        degree_view = self.out_degree(nbunch=self.victims)
-        return self._process_degrees(degree_view)
+        return self._group_average("victims", "out_deg")
 
     @property
     def victim_avg_weighted_out_deg(self) -> float:
-        degree_view = self.out_degree(nbunch=self.victims, weight="weight")
-        return self._process_degrees(degree_view)
+        return self._group_average("victims", "weighted_out_deg")
 
     @property
     def bully_avg_in_deg(self) -> float:
-        degree_view = self.in_degree(nbunch=self.bullies)
-        return self._process_degrees(degree_view)
+        return self._group_average("bullies", "in_deg")
 
     @property
     def bully_avg_weighted_in_deg(self) -> float:
-        degree_view = self.in_degree(nbunch=self.bullies, weight="weight")
-        return self._process_degrees(degree_view)
+        return self._group_average("bullies", "weighted_in_deg")
 
     @property
     def bully_avg_out_deg(self) -> float:
-        degree_view = self.out_degree(nbunch=self.bullies)
-        return self._process_degrees(degree_view)
+        return self._group_average("bullies", "out_deg")
 
     @property
     def bully_avg_weighted_out_deg(self) -> float:
-        degree_view = self.out_degree(nbunch=self.bullies, weight="weight")
-        return self._process_degrees(degree_view)
+        return self._group_average("bullies", "weighted_out_deg")
 
     @property
     def bully_score(self) -> float:
@@ -285,16 +307,20 @@ class SessionDiGraph(nx.DiGraph):
 
     @override
     def add_node(self, value: AuthorRole, type: str, layer: float) -> None:
-        if value.role == "main_victim":
+        is_main_victim = value.role == "main_victim"
+        if is_main_victim:
             self.main_victim = value
             if self.has_node(value):
                 raise AssertionError(
                     "Main Victim is already set. Did you mean to add it twice?"
                 )
-            else:
-                super().add_node(value, type=type, layer=layer)
+        if self.has_node(value):
+            # Re-adding only refreshes the attributes, the type counts stay put.
+            if self.nodes[value]["type"] != type:
+                raise ValueError(f"{value} was already added as another type.")
         else:
-            super().add_node(value, type=type, layer=layer)
+            self._register_node(value, type, is_main_victim)
+        super().add_node(value, type=type, layer=layer)
 
     @override
     def add_edge(self, u_of_edge: AuthorRole, v_of_edge: AuthorRole, **attrs) -> None:
@@ -303,15 +329,57 @@ class SessionDiGraph(nx.DiGraph):
             raise ValueError("Either u or v was not added to the graph.")
         if self.has_edge(u, v):  # existing edge, update the weight
             self[u][v]["weight"] += attrs["weight"]
+            self._register_edge(u, v, attrs["weight"], is_new=False)
         else:
             super().add_edge(u, v, **attrs)
+            self._register_edge(u, v, attrs.get("weight", 1), is_new=True)
+
+    def add_star_edges(
+        self,
+        center: AuthorRole,
+        others: list[AuthorRole],
+        weight: float,
+        type_: str,
+        inbound: bool = False,
+    ) -> None:
+        """
+        Same as add_edge(center, other, weight=weight, type=type_) for every
+        other (other -> center when inbound), with the new edges added in one
+        add_weighted_edges_from call.
+        """
+        if not self.has_node(center):
+            raise ValueError("Either u or v was not added to the graph.")
+        center_adj = self.pred[center] if inbound else self.succ[center]
+        # Weights of the edges that do not exist yet, in first-seen order.
+        new_weights: dict[AuthorRole, float] = {}
+        for other in others:
+            datadict = center_adj.get(other)
+            is_new = datadict is None and other not in new_weights
+            if datadict is not None:
+                datadict["weight"] += weight
+            elif not is_new:
+                new_weights[other] += weight
+            elif self.has_node(other):
+                new_weights[other] = weight
+            else:
+                raise ValueError("Either u or v was not added to the graph.")
+            u, v = (other, center) if inbound else (center, other)
+            self._register_edge(u, v, weight, is_new)
+        new_edges = (
+            (other, center, other_weight) if inbound else (center, other, other_weight)
+            for other, other_weight in new_weights.items()
+        )
+        self.add_weighted_edges_from(new_edges, type=type_)
 
-    def to_dict(self) -> dict[str, int | bool | bytes | float]:
-        seralized_graph = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+    def to_dict(
+        self, serialization: str = "pickle"
+    ) -> dict[str, int | bool | bytes | float]:
+        seralized_graph = serialize_session_graph(self, serialization)
         return {
             "unit_id": self.unit_id,
             "serialized_graph": seralized_graph,
             "is_true_graph": self.is_true_graph,
+            "ensemble_index": self.ensemble_index,
             "num_nodes": self.num_nodes,
             "num_edges": self.num_edges,
             "num_bullies": self.num_bullies,
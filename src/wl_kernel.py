@@ -0,0 +1,207 @@
+# pyright: basic
+"""
+WL subtree kernel between the true session graphs.
+
+Sessions are refined in batches against one WLFeatureDictionary, which gives
+a sparse (sessions x WL labels) count matrix. The cosine-normalized Gram
+matrix of those counts is written block by block to an .npy memmap, so it
+never has to fit in memory:
+
+    python -m src.wl_kernel [directory] [node_flavor] [edge_flavor]
+
+The directory keeps the unit ids and flavors (kernel.npz), the feature
+matrix (features.npz) and the Gram matrix (gram.npy), see WLKernel.load.
+Node and edge labels are the FlavoredMotifLabeler ones of the chosen flavors.
+"""
+
+import itertools
+import sys
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+from scipy import sparse
+
+from src import database
+from src.compact_graph import CompactSessionGraph, load_session_graph
+from src.flavored_motif_graph import MAPPED_TYPE_TABLES, remap_edge_weights
+from src.graph_hashing import WLFeatureDictionary
+from src.redo_count_motifs import as_compact
+from src.session_array_graph import SessionArrayGraph
+from src.session_digraph import SessionDiGraph
+
+KERNEL_DIRECTORY = Path(__file__).resolve().parent.parent / "wl_kernel"
+KERNEL_BATCH_SIZE = 1_000
+# 256 rows of a 50k session Gram matrix are 100 MB as float64.
+GRAM_BLOCK_SIZE = 256
+
+
+def session_labels(
+    session_G: CompactSessionGraph, node_flavor: str, edge_flavor: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Node and edge labels of one session, as FlavoredMotifLabeler assigns them.
+    """
+    node_labels = MAPPED_TYPE_TABLES[node_flavor][session_G.role_codes]
+    edge_labels = (
+        np.digitize(session_G.weights, bins=remap_edge_weights(edge_flavor)) + 1
+    )
+    return node_labels, edge_labels
+
+
+def wl_feature_matrix(
+    session_graphs: Iterable[SessionDiGraph | SessionArrayGraph | CompactSessionGraph],
+    node_flavor: str = "fine",
+    edge_flavor: str = "fine",
+    iterations: int = 3,
+    batch_size: int = KERNEL_BATCH_SIZE,
+) -> tuple[np.ndarray, sparse.csr_matrix]:
+    """
+    Unit ids and WL label counts of the session graphs, one row per session.
+    """
+    dictionary = WLFeatureDictionary(iterations)
+    unit_ids: list[int] = []
+    blocks: list[sparse.csr_matrix] = []
+    for batch in itertools.batched(session_graphs, batch_size):
+        compact_graphs = [as_compact(session_G) for session_G in batch]
+        offsets = np.zeros(len(compact_graphs) + 1, dtype=np.int64)
+        np.cumsum([G.num_nodes for G in compact_graphs], out=offsets[1:])
+        labels = [session_labels(G, node_flavor, edge_flavor) for G in compact_graphs]
+        blocks.append(
+            dictionary.transform(
+                np.concatenate(
+                    [
+                        G.edges.reshape(-1, 2) + offset
+                        for G, offset in zip(compact_graphs, offsets)
+                    ]
+                ),
+                np.repeat(np.arange(len(compact_graphs)), np.diff(offsets)),
+                np.concatenate([node_labels for node_labels, _ in labels]),
+                np.concatenate([edge_labels for _, edge_labels in labels]),
+                num_graphs=len(compact_graphs),
+            )
+        )
+        unit_ids.extend(G.unit_id for G in compact_graphs)
+    # Earlier batches only know the columns seen up to them.
+    for block in blocks:
+        block.resize((block.get_shape()[0], len(dictionary)))
+    logger.info(f"{len(unit_ids)} sessions, {len(dictionary)} WL labels")
+    features = sparse.csr_matrix(sparse.vstack(blocks, format="csr", dtype=np.int64))
+    return np.array(unit_ids, dtype=np.int64), features
+
+
+def normalized_gram(
+    features: sparse.csr_matrix, path: Path, block_size: int = GRAM_BLOCK_SIZE
+) -> np.ndarray:
+    """
+    K[i, j] = <x_i, x_j> / (|x_i| |x_j|) as a float32 .npy memmap at path.
+
+    Rows are computed block_size at a time and only from the diagonal on,
+    the lower triangle is the transpose of the blocks above it.
+    """
+    features = sparse.csr_matrix(features, dtype=np.float64)
+    norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    scaled = sparse.csr_matrix(sparse.diags(1 / norms) @ features)
+    num_sessions = len(norms)
+    gram = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(num_sessions, num_sessions)
+    )
+    for start in range(0, num_sessions, block_size):
+        stop = min(start + block_size, num_sessions)
+        block = (scaled[start:stop] @ scaled[start:].T).toarray().astype(np.float32)
+        gram[start:stop, start:] = block
+        gram[start:, start:stop] = block.T
+    gram.flush()
+    return gram
+
+
+@dataclass
+class WLKernel:
+    unit_ids: np.ndarray
+    features: sparse.csr_matrix
+    gram: np.ndarray
+    node_flavor: str
+    edge_flavor: str
+    iterations: int
+
+    @classmethod
+    def build(
+        cls,
+        session_graphs: Iterable[
+            SessionDiGraph | SessionArrayGraph | CompactSessionGraph
+        ],
+        directory: Path = KERNEL_DIRECTORY,
+        node_flavor: str = "fine",
+        edge_flavor: str = "fine",
+        iterations: int = 3,
+        batch_size: int = KERNEL_BATCH_SIZE,
+        block_size: int = GRAM_BLOCK_SIZE,
+    ) -> "WLKernel":
+        """
+        Compute the kernel of the session graphs and persist it in directory.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        unit_ids, features = wl_feature_matrix(
+            session_graphs, node_flavor, edge_flavor, iterations, batch_size
+        )
+        np.savez(
+            directory / "kernel.npz",
+            unit_ids=unit_ids,
+            node_flavor=node_flavor,
+            edge_flavor=edge_flavor,
+            iterations=iterations,
+        )
+        sparse.save_npz(directory / "features.npz", features)
+        gram = normalized_gram(features, directory / "gram.npy", block_size)
+        return cls(unit_ids, features, gram, node_flavor, edge_flavor, iterations)
+
+    @classmethod
+    def load(cls, directory: Path = KERNEL_DIRECTORY) -> "WLKernel":
+        """
+        Load a persisted kernel, with the Gram matrix memory-mapped read-only.
+        """
+        with np.load(directory / "kernel.npz") as arrays:
+            unit_ids = arrays["unit_ids"]
+            node_flavor = str(arrays["node_flavor"])
+            edge_flavor = str(arrays["edge_flavor"])
+            iterations = int(arrays["iterations"])
+        return cls(
+            unit_ids,
+            sparse.csr_matrix(sparse.load_npz(directory / "features.npz")),
+            np.load(directory / "gram.npy", mmap_mode="r"),
+            node_flavor,
+            edge_flavor,
+            iterations,
+        )
+
+    def most_similar(self, unit_id: int, k: int = 10) -> list[tuple[int, float]]:
+        """
+        The k other sessions closest to unit_id, with their kernel values.
+        """
+        row = int(np.flatnonzero(self.unit_ids == unit_id)[0])
+        similarities = np.asarray(self.gram[row], dtype=np.float64)
+        similarities[row] = -np.inf
+        nearest = np.argsort(similarities)[::-1][:k]
+        return [
+            (int(self.unit_ids[i]), float(similarities[i])) for i in nearest.tolist()
+        ]
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else KERNEL_DIRECTORY
+    node_flavor = sys.argv[2] if len(sys.argv) > 2 else "fine"
+    edge_flavor = sys.argv[3] if len(sys.argv) > 3 else "fine"
+    with database.stage():
+        kernel = WLKernel.build(
+            (load_session_graph(blob) for blob in database.iter_session_graph_blobs()),
+            directory,
+            node_flavor,
+            edge_flavor,
+        )
+    logger.info(
+        f"Kernel of {len(kernel.unit_ids)} sessions and "
+        f"{kernel.features.get_shape()[1]} WL labels in {directory}"
+    )
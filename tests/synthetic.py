@@ -0,0 +1,73 @@
+# pyright: basic
+"""
+Synthetic sessions shaped like the annotated comments, for tests and benchmarks.
+"""
+
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+
+from src.author_role import AuthorRole
+from src.session import Session
+
+COMMENT_ROLES = [
+    "aggressive_victim",
+    "non_aggressive_victim",
+    "bully",
+    "bully_assistant",
+    "aggressive_defender",
+    "non_aggressive_defender:support_of_the_victim",
+    "non_aggressive_defender:direct_to_the_bully",
+    "passive_bystander",
+]
+ROLE_WEIGHTS = [0.05, 0.05, 0.35, 0.1, 0.05, 0.1, 0.05, 0.25]
+
+
+def synthetic_session(
+    unit_id: int,
+    num_comments: int,
+    num_authors: int,
+    rng: np.random.Generator,
+    role_weights: list[float] = ROLE_WEIGHTS,
+) -> tuple[Session, list[AuthorRole]]:
+    posted_at = datetime(2020, 1, 1)
+    session = Session(
+        unit_id=unit_id,
+        posted_at=posted_at,
+        owner_user_name=f"owner_{unit_id}",
+        owner_comment="synthetic session",
+        num_likes=int(rng.integers(0, 1_000)),
+        num_bullying_comments=num_comments // 2,
+        num_comments=num_comments,
+        main_victim="OP",
+        topic_vector=rng.integers(0, 5, size=10).tolist(),
+    )
+    authors = rng.integers(0, num_authors, size=num_comments)
+    roles = rng.choice(len(COMMENT_ROLES), size=num_comments, p=role_weights)
+    severities = rng.choice([1.0, 1.5, 2.0, 2.5, 3.0], size=num_comments)
+    comments = [
+        AuthorRole(
+            unit_id=unit_id,
+            comment_id=uuid4(),
+            author_name=f"author_{author}",
+            role=COMMENT_ROLES[role],
+            severity=float(severity),
+            timestamp=posted_at + timedelta(minutes=i + 1),
+        )
+        for i, (author, role, severity) in enumerate(zip(authors, roles, severities))
+    ]
+    return session, comments
+
+
+def synthetic_sessions(
+    num_sessions: int,
+    num_comments: int,
+    num_authors: int,
+    seed: int = 0,
+) -> list[tuple[Session, list[AuthorRole]]]:
+    rng = np.random.default_rng(seed)
+    return [
+        synthetic_session(unit_id, num_comments, num_authors, rng)
+        for unit_id in range(num_sessions)
+    ]
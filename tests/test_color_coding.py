@@ -0,0 +1,159 @@
+# pyright: basic
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from src import color_coding
+from src.color_coding import (
+    ColorCoding,
+    color_coding_counts,
+    connected_subgraphs,
+    exact_flavored_counts,
+    undirected_neighbors,
+)
+from src.compact_graph import CompactSessionGraph
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import SessionGraphBatch, motif_rows
+from tests.synthetic import synthetic_session
+
+
+@pytest.fixture(scope="module")
+def session_G():
+    session, comments = synthetic_session(0, 20, 6, np.random.default_rng(24))
+    return CompactSessionGraph.from_session_digraph(
+        build_session_graph(session, comments, True)
+    )
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_enumeration_matches_randesu(session_G, size):
+    neighbors = undirected_neighbors(session_G.edges, session_G.num_nodes)
+    found = [frozenset(vertices) for vertices in connected_subgraphs(neighbors, size)]
+    assert len(found) == len(set(found))
+    _, vertices = SessionGraphBatch.pack([session_G]).occurrences(size)
+    assert set(found) == {frozenset(row) for row in vertices.tolist()}
+
+
+@pytest.mark.parametrize("size", [5, 6])
+def test_colorful_sets_are_the_colorful_connected_sets(session_G, size):
+    neighbors = undirected_neighbors(session_G.edges, session_G.num_nodes)
+    colors = np.random.default_rng(size).integers(size, size=session_G.num_nodes)
+    colorful = [
+        frozenset(vertices) for vertices in connected_subgraphs(neighbors, size, colors)
+    ]
+    assert len(colorful) == len(set(colorful))
+    assert set(colorful) == {
+        frozenset(vertices)
+        for vertices in connected_subgraphs(neighbors, size)
+        if len(set(colors[list(vertices)].tolist())) == size
+    }
+
+
+def test_small_sessions_are_counted_exactly(session_G):
+    counts = color_coding_counts(session_G, 5, ColorCoding())
+    assert counts.num_colorings == 0
+    assert counts.sampling_probability == 1.0
+    assert counts.hash_counts == exact_flavored_counts(session_G, 5)
+    assert all(counts.count_variance(key) == 0.0 for key in counts.hash_counts)
+    assert set(counts.representatives) == set(counts.hash_counts)
+
+
+def test_large_sessions_are_sized_from_colorful_sets(session_G, monkeypatch):
+    uncolored = []
+
+    def recorded_connected_subgraphs(neighbors, size, colors=None):
+        for vertices in connected_subgraphs(neighbors, size, colors):
+            if colors is None:
+                uncolored.append(vertices)
+            yield vertices
+
+    monkeypatch.setattr(
+        color_coding, "connected_subgraphs", recorded_connected_subgraphs
+    )
+    monkeypatch.setattr(color_coding, "MAX_COUNTED_OCCURRENCES", 100)
+    # About 2600 sets, estimated above 1000 with seed 0.
+    counts = color_coding_counts(
+        session_G, 5, ColorCoding(max_enumerated_occurrences=1000)
+    )
+    assert counts.num_colorings > 0
+    assert len(uncolored) == 101
+
+
+def test_sampled_counts_are_unbiased(session_G):
+    exact = exact_flavored_counts(session_G, 5)
+    estimates = Counter()
+    variances = Counter()
+    num_seeds = 40
+    for seed in range(num_seeds):
+        color_coding = ColorCoding(relative_error=0.5, min_share=0.05, seed=seed)
+        counts = color_coding_counts(session_G, 5, color_coding)
+        assert counts.num_colorings == 0
+        assert 0.0 < counts.keep_probability < 1.0
+        for key, hash_count in counts.hash_counts.items():
+            estimates[key] += hash_count / counts.sampling_probability / num_seeds
+            variances[key] += counts.count_variance(key) / num_seeds**2
+
+    num_occurrences = sum(exact.values()) / 6
+    for key, hash_count in exact.items():
+        if hash_count >= 0.05 * num_occurrences:
+            assert abs(estimates[key] - hash_count) <= 4 * math.sqrt(variances[key])
+
+
+def test_color_coding_estimates_cover_exact_counts(session_G):
+    exact = exact_flavored_counts(session_G, 5)
+    color_coding = ColorCoding(max_enumerated_occurrences=0, max_colorings=200)
+    counts = color_coding_counts(session_G, 5, color_coding)
+    assert counts.num_colorings >= color_coding.min_colorings
+    repeat = color_coding_counts(session_G, 5, color_coding)
+    assert repeat.num_colorings == counts.num_colorings
+    assert repeat.hash_counts == counts.hash_counts
+
+    # Every flavor splits the same occurrences.
+    num_occurrences = sum(exact.values()) / 6
+    assert counts.total_count / counts.sampling_probability == pytest.approx(
+        num_occurrences, rel=3 * color_coding.relative_error
+    )
+    frequent = [
+        key
+        for key, hash_count in exact.items()
+        if hash_count >= color_coding.min_share * num_occurrences
+    ]
+    assert frequent
+    within = [
+        abs(counts.hash_counts[key] / counts.sampling_probability - exact[key])
+        <= 3 * math.sqrt(counts.count_variance(key))
+        for key in frequent
+    ]
+    assert np.mean(within) >= 0.9
+    assert set(counts.hash_counts) <= set(exact)
+
+
+def test_aggregate_rows_add_color_coded_sizes(session_G):
+    blob = session_G.to_bytes()
+    color_coding = ColorCoding(max_enumerated_occurrences=0)
+    (chunk,) = motif_rows([blob], aggregate=True, color_coding=color_coding)
+    ((unit_id, size, num_colorings),) = chunk.colorings
+    assert (unit_id, size) == (session_G.unit_id, 5)
+    rows = [row for row in chunk.count_rows if row["size"] == 5]
+    assert rows
+    assert all(
+        row["sampling_probability"] == pytest.approx(num_colorings * 120 / 5**5)
+        for row in rows
+    )
+    catalogued = {
+        (row["node_flavor"], row["edge_flavor"], row["motif_hash"])
+        for row in chunk.catalog_rows
+    }
+    assert {
+        (row["node_flavor"], row["edge_flavor"], row["motif_hash"]) for row in rows
+    } <= catalogued
+
+    (plain,) = motif_rows([blob], aggregate=True)
+    assert [row for row in chunk.count_rows if row["size"] != 5] == plain.count_rows
+
+    with pytest.raises(ValueError):
+        next(motif_rows([blob], color_coding=color_coding))
+    with pytest.raises(ValueError):
+        next(motif_rows([blob], aggregate=True, color_coding=ColorCoding(sizes=(4,))))
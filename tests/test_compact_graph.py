@@ -0,0 +1,44 @@
+# pyright: basic
+import igraph as ig
+import numpy as np
+import pytest
+
+from src.compact_graph import (
+    CompactSessionGraph,
+    load_session_graph,
+    serialize_session_graph,
+)
+
+
+def test_compact_round_trip(populated_graph):
+    compact = CompactSessionGraph.from_session_digraph(populated_graph)
+    blob = serialize_session_graph(populated_graph, "compact")
+    loaded = load_session_graph(blob)
+
+    assert isinstance(loaded, CompactSessionGraph)
+    assert loaded.unit_id == populated_graph.unit_id
+    assert loaded.is_true_graph == populated_graph.is_true_graph
+    assert loaded.num_nodes == populated_graph.num_nodes
+    assert loaded.num_edges == populated_graph.num_edges
+    assert loaded.main_victim == 0
+    np.testing.assert_array_equal(loaded.topic_vector, compact.topic_vector)
+    np.testing.assert_array_equal(loaded.role_codes, compact.role_codes)
+    np.testing.assert_array_equal(loaded.edges, compact.edges)
+    np.testing.assert_array_equal(loaded.weights, compact.weights)
+
+
+def test_compact_to_igraph_matches_from_networkx(populated_graph):
+    expected = ig.Graph.from_networkx(populated_graph)
+    compact = CompactSessionGraph.from_session_digraph(populated_graph)
+    actual = compact.to_igraph()
+
+    assert actual.get_edgelist() == expected.get_edgelist()
+    assert actual.vs["type"] == expected.vs["type"]
+    assert actual.es["weight"] == expected.es["weight"]
+
+
+def test_unknown_compact_version(populated_graph):
+    blob = bytearray(serialize_session_graph(populated_graph, "compact"))
+    blob[4] = 99
+    with pytest.raises(ValueError):
+        CompactSessionGraph.from_bytes(bytes(blob))
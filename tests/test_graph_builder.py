@@ -1,6 +1,13 @@
 # pyright: basic
+from uuid import uuid4
+
+import numpy as np
 import pytest
+
+from src.author_role import AuthorRole
 from src.graph_builder import GraphBuilder
+from src.session_digraph import SessionDiGraph
+from tests.synthetic import synthetic_session
 
 
 def test_graph_builder(basic_graph, session_comments):
@@ -33,3 +40,40 @@ def test_graph_builder(basic_graph, session_comments):
 
     assert basic_graph.bully_avg_in_deg == pytest.approx(1.0)
     assert basic_graph.bully_avg_out_deg == pytest.approx(2.0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_lazy_edges_match_eager(basic_session, seed):
+    rng = np.random.default_rng(seed)
+    _, comments = synthetic_session(123, 300, 40, rng)
+    main_victim = AuthorRole(
+        unit_id=123,
+        comment_id=uuid4(),
+        author_name=basic_session.owner_user_name,
+        role="main_victim",
+        severity=0.0,
+        timestamp=basic_session.posted_at,
+    )
+    # Severities like the averaged annotations, whose sums depend on the order.
+    for author_role in comments:
+        author_role.severity = float(rng.integers(1, 10)) / 3.0
+
+    graphs = []
+    for lazy_edges in [False, True]:
+        session_G = SessionDiGraph.from_session(basic_session, is_true_graph=True)
+        builder = GraphBuilder(session_G, lazy_edges=lazy_edges)
+        builder.add_node(main_victim)
+        for author_role in comments:
+            builder.add_node(author_role)
+            builder.add_edge(author_role)
+        builder.finalize()
+        graphs.append(session_G)
+    eager_G, lazy_G = graphs
+
+    assert list(lazy_G.nodes(data=True)) == list(eager_G.nodes(data=True))
+    lazy_edges, eager_edges = dict(lazy_G.edges), dict(eager_G.edges)
+    assert lazy_edges.keys() == eager_edges.keys()
+    for edge, data in eager_edges.items():
+        # Lazy weights are differences of running sums, equal up to rounding.
+        assert lazy_edges[edge] == {**data, "weight": pytest.approx(data["weight"])}
+    assert lazy_G.bully_score_weighted == pytest.approx(eager_G.bully_score_weighted)
@@ -1,9 +1,24 @@
 # pyright: basic
+import itertools
+
+import numpy as np
 import pytest
 import igraph as ig
 import networkx as nx
 from typing import cast
-from src.graph_hashing import weisfeiler_lehman_graph_hash
+from src.graph_hashing import (
+    WLLabelCache,
+    canonical_graph_hash,
+    canonical_hash_from_edges,
+    motif_graph_hash,
+    motif_hash_cache,
+    use_hash_backend,
+    weisfeiler_lehman_graph_hash,
+    weisfeiler_lehman_hash_from_edges,
+    weisfeiler_lehman_hashes_batch,
+    weisfeiler_lehman_hashes_from_edges,
+    weisfeiler_lehman_hashes_interned,
+)
 
 
 @pytest.fixture
@@ -97,3 +112,128 @@ def test_igraph_node_and_edge_attr(
     assert weisfeiler_lehman_graph_hash(
         ig_G1, node_attr="_name", edge_attr="label"
     ) != weisfeiler_lehman_graph_hash(ig_G2, node_attr="_name", edge_attr="label")
+
+
+def test_canonical_hash_is_permutation_invariant() -> None:
+    node_labels = ["0", "3", "5", "5"]
+    edges = [(0, 1), (2, 0), (3, 0), (2, 1), (1, 2)]
+    edge_labels = ["1", "2", "2", "4", "1"]
+    expected = canonical_hash_from_edges(node_labels, edges, edge_labels)
+    for order in itertools.permutations(range(4)):
+        assert (
+            canonical_hash_from_edges(
+                [node_labels[order.index(v)] for v in range(4)],
+                [(order[u], order[v]) for u, v in edges],
+                edge_labels,
+            )
+            == expected
+        )
+    # Moving an edge label onto another edge changes the graph.
+    assert (
+        canonical_hash_from_edges(node_labels, edges, ["2", "1", "2", "4", "1"])
+        != expected
+    )
+
+
+def test_canonical_hash_separates_wl_collision() -> None:
+    # Two directed triangles and a directed 6-cycle look alike to WL.
+    triangles = ig.Graph(
+        [(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3)], directed=True
+    )
+    cycle = ig.Graph([(i, (i + 1) % 6) for i in range(6)], directed=True)
+    assert weisfeiler_lehman_graph_hash(triangles) == weisfeiler_lehman_graph_hash(
+        cycle
+    )
+    assert canonical_graph_hash(triangles) != canonical_graph_hash(cycle)
+
+
+def test_use_hash_backend() -> None:
+    with pytest.raises(ValueError):
+        use_hash_backend("md5")
+    graph = ig.Graph([(0, 1), (1, 2)], directed=True)
+    try:
+        use_hash_backend("canonical")
+        assert motif_graph_hash(graph) == canonical_graph_hash(graph)
+        motif_hash_cache.add("signature", "hash")
+        use_hash_backend("wl")
+        assert len(motif_hash_cache) == 0
+        assert motif_graph_hash(graph) == weisfeiler_lehman_graph_hash(graph)
+        use_hash_backend("wl_interned")
+        assert motif_graph_hash(graph) == weisfeiler_lehman_graph_hash(graph)
+    finally:
+        use_hash_backend("wl")
+
+
+@pytest.mark.parametrize("with_edge_labels", [True, False])
+def test_batch_hashes_match_single_graph_hashes(with_edge_labels: bool) -> None:
+    rng = np.random.default_rng(0)
+    graphs = []
+    for _ in range(200):
+        size = int(rng.integers(1, 6))
+        edges = [
+            (u, v)
+            for u, v in itertools.permutations(range(size), 2)
+            if rng.random() < 0.4
+        ]
+        graphs.append(
+            (
+                [str(label) for label in rng.integers(0, 3, size)],
+                edges,
+                [str(label) for label in rng.integers(1, 4, len(edges))],
+            )
+        )
+    offsets = np.cumsum([0] + [len(node_labels) for node_labels, _, _ in graphs])
+    edges = np.array(
+        [
+            (u + offset, v + offset)
+            for offset, (_, graph_edges, _) in zip(offsets, graphs)
+            for u, v in graph_edges
+        ]
+    )
+    graph_ids = np.repeat(np.arange(len(graphs)), np.diff(offsets))
+    node_labels = [label for labels, _, _ in graphs for label in labels]
+    edge_labels = [label for _, _, labels in graphs for label in labels]
+    if not with_edge_labels:
+        graphs = [(labels, graph_edges, None) for labels, graph_edges, _ in graphs]
+        edge_labels = None
+
+    expected = [
+        weisfeiler_lehman_hash_from_edges(labels, graph_edges, graph_edge_labels)
+        for labels, graph_edges, graph_edge_labels in graphs
+    ]
+    assert (
+        weisfeiler_lehman_hashes_batch(edges, graph_ids, node_labels, edge_labels)
+        == expected
+    )
+    graph_classes = weisfeiler_lehman_hashes_batch(
+        edges, graph_ids, node_labels, edge_labels, digest=False
+    )
+    assert len(set(graph_classes.tolist())) == len(set(expected))
+    assert len(set(zip(graph_classes.tolist(), expected))) == len(set(expected))
+
+
+@pytest.mark.parametrize("maxsize", [8, 1_000])
+def test_interned_hashes_match_string_hashes(maxsize: int) -> None:
+    rng = np.random.default_rng(1)
+    edges = [(0, 1), (1, 2), (2, 0), (0, 3), (3, 1)]
+    labelings = [
+        (
+            [str(label) for label in rng.integers(0, 3, 4)],
+            [str(label) for label in rng.integers(1, 3, len(edges))],
+        )
+        for _ in range(100)
+    ] + [(["0", "1", "1", "2"], None)]
+    cache = WLLabelCache(maxsize)
+    expected = weisfeiler_lehman_hashes_from_edges(edges, labelings)
+    # The second pass runs on a warm cache.
+    for _ in range(2):
+        assert weisfeiler_lehman_hashes_interned(edges, labelings, cache=cache) == (
+            expected
+        )
+    assert len(cache) <= maxsize
+    assert cache.misses > 0 and cache.bytes_hashed > 0
+    if maxsize > 8:
+        # Distinct labelings repeat with 3 labels on 4 nodes.
+        assert cache.hit_rate > 0.5
+    cache.clear()
+    assert (len(cache), cache.hits, cache.bytes_hashed) == (0, 0, 0)
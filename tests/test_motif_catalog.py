@@ -0,0 +1,91 @@
+# pyright: basic
+import numpy as np
+import pytest
+
+from src.flavored_motif_graph import FlavoredMotifLabeler
+from src.graph_hashing import motif_hash_cache
+from src.motif_catalog import FLAVORS, MotifCatalog
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import find_session_graph_motifs, to_session_igraph
+from tests.synthetic import synthetic_session
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    # Size 4 takes minutes to enumerate, size 3 covers the same code paths.
+    return MotifCatalog.build(sizes=[3])
+
+
+@pytest.fixture(scope="module")
+def session_motifs():
+    session, comments = synthetic_session(0, 30, 8, np.random.default_rng(18))
+    session_G = build_session_graph(session, comments, True)
+    session_igraph = to_session_igraph(session_G)
+    plain_motifs = [
+        plain_motif
+        for size in [3, 4]
+        for plain_motif in find_session_graph_motifs(session_G, size, session_igraph)
+    ]
+    return session_igraph, plain_motifs
+
+
+def test_catalog_round_trips(catalog, tmp_path):
+    path = tmp_path / "motif_catalog.npz"
+    catalog.save(path)
+    loaded = MotifCatalog.load(path)
+    assert loaded.sizes == catalog.sizes
+    for flavors in FLAVORS:
+        assert np.array_equal(loaded.keys[flavors], catalog.keys[flavors])
+        assert np.array_equal(loaded.hashes[flavors], catalog.hashes[flavors])
+        assert np.all(np.diff(catalog.keys[flavors]) > 0)
+
+
+def test_catalog_hashes_match_wl(catalog, session_motifs):
+    session_igraph, plain_motifs = session_motifs
+    motif_hash_cache.clear()
+    expected = [
+        [m.graph_hash for m in FlavoredMotifLabeler(session_igraph).flavor(p)]
+        for p in plain_motifs
+    ]
+    motif_hash_cache.clear()
+    labeler = FlavoredMotifLabeler(session_igraph, catalog)
+    assert [[m.graph_hash for m in labeler.flavor(p)] for p in plain_motifs] == (
+        expected
+    )
+
+
+def test_lookup_is_isomorphism_invariant(catalog, session_motifs):
+    session_igraph, plain_motifs = session_motifs
+    labeler = FlavoredMotifLabeler(session_igraph, catalog)
+    rng = np.random.default_rng(0)
+    num_found = 0
+    for plain_motif in plain_motifs[:300]:
+        if plain_motif.size != 3:
+            continue
+        vertices = sorted(plain_motif.vertices)
+        edges, eids = labeler._induced_edges(vertices)
+        found = catalog.lookup(
+            tuple(edges),
+            labeler.node_label_rows[:, vertices],
+            labeler.edge_label_rows[:, eids],
+        )
+        assert found is not None
+        num_found += 1
+        # The same occurrence with its vertex positions shuffled.
+        order = rng.permutation(len(vertices))
+        position = {old: new for new, old in enumerate(order)}
+        permuted = sorted(
+            ((position[u], position[v]), eid) for (u, v), eid in zip(edges, eids)
+        )
+        assert (
+            catalog.lookup(
+                tuple(edge for edge, _ in permuted),
+                labeler.node_label_rows[:, np.asarray(vertices)[order]],
+                labeler.edge_label_rows[:, [eid for _, eid in permuted]],
+            )
+            == found
+        )
+        for (node_flavor, edge_flavor), (motif_id, graph_hash) in found.items():
+            assert 0 <= motif_id < catalog.num_motifs(node_flavor, edge_flavor)
+            assert catalog.motif_hash(node_flavor, edge_flavor, motif_id) == graph_hash
+    assert num_found > 0
@@ -0,0 +1,117 @@
+# pyright: basic
+import igraph as ig
+import numpy as np
+import pytest
+
+from src.compact_graph import CompactSessionGraph
+from src.motif_significance import (
+    CensusMoments,
+    connected_classes,
+    rewired_igraphs,
+    session_significance_rows,
+    significance_rows,
+    z_scores,
+)
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import motif_census
+from tests.synthetic import synthetic_session
+
+
+@pytest.fixture(scope="module")
+def session_graphs():
+    rng = np.random.default_rng(25)
+    return [
+        CompactSessionGraph.from_session_digraph(
+            build_session_graph(*synthetic_session(unit_id, 25, 8, rng), True)
+        )
+        for unit_id in range(5)
+    ]
+
+
+def test_welford_moments_match_numpy():
+    censuses = np.random.default_rng(0).poisson(5.0, size=(40, 13)).astype(float)
+    moments = CensusMoments(13)
+    for census in censuses:
+        moments.add(census)
+    np.testing.assert_allclose(moments.mean, censuses.mean(axis=0))
+    np.testing.assert_allclose(moments.std, censuses.std(axis=0, ddof=1))
+
+    z = z_scores(censuses[0], moments)
+    expected = (censuses[0] - censuses.mean(axis=0)) / censuses.std(axis=0, ddof=1)
+    np.testing.assert_allclose(z, expected)
+
+
+def test_rewiring_preserves_degrees_and_roles(session_graphs):
+    session_igraph = session_graphs[0].to_igraph()
+    roles = session_igraph.vs["type"]
+    in_degrees = session_igraph.indegree()
+    out_degrees = session_igraph.outdegree()
+    edges = set(session_igraph.get_edgelist())
+    changed = False
+    for randomized in rewired_igraphs(session_igraph, 5, 10):
+        assert randomized.vs["type"] == roles
+        assert randomized.indegree() == in_degrees
+        assert randomized.outdegree() == out_degrees
+        assert randomized.is_simple()
+        changed |= set(randomized.get_edgelist()) != edges
+    assert changed
+    assert set(session_igraph.get_edgelist()) == edges
+
+
+def test_significance_rows(session_graphs):
+    session_G = session_graphs[0]
+    rows = session_significance_rows(session_G, ensemble_size=20)
+    # assert_equal treats the NaN z-scores as equal.
+    np.testing.assert_equal(
+        rows, session_significance_rows(session_G, ensemble_size=20)
+    )
+    assert rows != session_significance_rows(session_G, ensemble_size=20, seed=1)
+
+    session_igraph = session_G.to_igraph()
+    for size in (3, 4):
+        size_rows = [row for row in rows if row["size"] == size]
+        assert size_rows
+        census = motif_census(session_igraph, size)
+        assert {row["iso_class"] for row in size_rows} <= set(
+            connected_classes(size).tolist()
+        )
+        z = np.array([row["z_score"] for row in size_rows])
+        significance = np.array([row["significance"] for row in size_rows])
+        assert np.nansum(significance**2) == pytest.approx(1.0)
+        np.testing.assert_allclose(significance, z / np.sqrt(np.nansum(z**2)))
+        for row in size_rows:
+            assert row["motif_count"] == census[row["iso_class"]]
+            assert row["ensemble_size"] == 20
+            if row["null_std"] > 0:
+                assert row["z_score"] == pytest.approx(
+                    (row["motif_count"] - row["null_mean"]) / row["null_std"]
+                )
+
+
+def test_rows_do_not_depend_on_workers(session_graphs):
+    blobs = [session_G.to_bytes() for session_G in session_graphs]
+    serial = [
+        row
+        for rows in significance_rows(blobs, batch_size=2, ensemble_size=10)
+        for row in rows
+    ]
+    parallel = [
+        row
+        for rows in significance_rows(blobs, workers=2, batch_size=1, ensemble_size=10)
+        for row in rows
+    ]
+    np.testing.assert_equal(serial, parallel)
+    assert [row["unit_id"] for row in serial] == sorted(
+        row["unit_id"] for row in serial
+    )
+
+
+def test_empty_null_model_has_no_variance():
+    session_igraph = ig.Graph(n=3, edges=[(0, 1), (1, 2)], directed=True)
+    moments = CensusMoments(16)
+    for randomized in rewired_igraphs(session_igraph, 3, 10):
+        moments.add(motif_census(randomized, 3))
+    census = motif_census(session_igraph, 3)
+    z = z_scores(census, moments)
+    assert np.all(moments.std == 0)
+    assert np.all(z[census == moments.mean] == 0)
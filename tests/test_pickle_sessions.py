@@ -0,0 +1,115 @@
+# pyright: basic
+import random
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from src.author_role import AuthorRole
+from src.pickle_sessions import null_model_orderings, session_graph_rows
+from src.session import Session
+
+ROLES = [
+    "aggressive_victim",
+    "non_aggressive_victim",
+    "bully",
+    "bully_assistant",
+    "aggressive_defender",
+    "non_aggressive_defender:support_of_the_victim",
+    "non_aggressive_defender:direct_to_the_bully",
+    "passive_bystander",
+]
+
+
+@pytest.fixture
+def many_session_comments() -> list[tuple[Session, list[AuthorRole]]]:
+    rng = random.Random(7)
+    session_comments = []
+    for unit_id in range(12):
+        session = Session(
+            unit_id=unit_id,
+            posted_at=datetime(2020, 1, 1),
+            owner_user_name=f"owner_{unit_id}",
+            owner_comment="",
+            num_likes=0,
+            num_bullying_comments=1,
+            num_comments=20,
+            main_victim="OP",
+            topic_vector=[0] * 10,
+        )
+        comments = [
+            AuthorRole(
+                unit_id=unit_id,
+                comment_id=uuid4(),
+                author_name=f"author_{rng.randrange(8)}",
+                role=rng.choice(ROLES),
+                severity=rng.choice([1.0, 2.0, 3.0]),
+                timestamp=None,
+            )
+            for _ in range(20)
+        ]
+        session_comments.append((session, comments))
+    return session_comments
+
+
+def test_parallel_rows_match_sequential(many_session_comments):
+    sequential = list(
+        session_graph_rows(many_session_comments, True, serialization="compact")
+    )
+    parallel = list(
+        session_graph_rows(
+            many_session_comments,
+            True,
+            serialization="compact",
+            workers=2,
+            chunk_size=5,
+        )
+    )
+    assert [row["unit_id"] for row in parallel] == list(range(12))
+    assert parallel == sequential
+
+
+def test_array_engine_rows_match_networkx(many_session_comments):
+    networkx_rows = list(
+        session_graph_rows(many_session_comments, True, serialization="compact")
+    )
+    array_rows = list(
+        session_graph_rows(
+            many_session_comments, True, serialization="compact", engine="array"
+        )
+    )
+    assert array_rows == networkx_rows
+
+
+def test_null_model_ensemble_is_seeded(many_session_comments):
+    def ensemble(workers: int, seed: int) -> list[dict]:
+        return list(
+            session_graph_rows(
+                many_session_comments,
+                False,
+                serialization="compact",
+                workers=workers,
+                chunk_size=5,
+                ensemble_size=4,
+                seed=seed,
+            )
+        )
+
+    rows = ensemble(workers=1, seed=3)
+    assert [(row["unit_id"], row["ensemble_index"]) for row in rows] == [
+        (unit_id, ensemble_index)
+        for unit_id in range(12)
+        for ensemble_index in range(4)
+    ]
+    assert not any(row["is_true_graph"] for row in rows)
+    assert ensemble(workers=2, seed=3) == rows
+    assert ensemble(workers=1, seed=4) != rows
+
+
+def test_null_model_orderings_are_permutations(many_session_comments):
+    _, comments = many_session_comments[0]
+    orderings = list(null_model_orderings(0, comments, 10, seed=0))
+    assert [ensemble_index for ensemble_index, _ in orderings] == list(range(10))
+    for _, shuffled in orderings:
+        assert sorted(map(id, shuffled)) == sorted(map(id, comments))
+    assert len({tuple(map(id, shuffled)) for _, shuffled in orderings}) > 1
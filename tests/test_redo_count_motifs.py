@@ -0,0 +1,526 @@
+# pyright: basic
+import contextlib
+import itertools
+import pickle
+from collections import Counter
+from uuid import uuid4
+
+import igraph as ig
+import numpy as np
+import pytest
+
+from src import database, graph_hashing
+from src.author_role import AuthorRole
+from src.compact_graph import (
+    CompactSessionGraph,
+    load_session_graph,
+    serialize_session_graph,
+)
+from src.flavored_motif_graph import (
+    EDGE_FLAVORS,
+    NODE_FLAVORS,
+    FlavoredMotifGraph,
+    FlavoredMotifLabeler,
+)
+from src.graph_hashing import motif_hash_cache, weisfeiler_lehman_graph_hash
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import (
+    ROW_OVERHEAD_BYTES,
+    SIZES,
+    MotifSampling,
+    SessionGraphBatch,
+    compute_motifs_randesu,
+    count_confidence_interval,
+    estimate_motif_occurrences,
+    find_and_insert_all_motifs,
+    find_batch_motifs,
+    find_session_graph_motifs,
+    motif_census,
+    motif_rows,
+    to_session_igraph,
+)
+from tests.synthetic import synthetic_session
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_census_matches_callback_counts(size):
+    session, comments = synthetic_session(0, 60, 12, np.random.default_rng(size))
+    session_igraph = to_session_igraph(build_session_graph(session, comments, True))
+
+    census = motif_census(session_igraph, size)
+    occurrences = compute_motifs_randesu(session_igraph, size)
+
+    assert census.dtype == np.int64
+    # Directed isomorphism classes of 3 and 4 vertex graphs.
+    assert len(census) == {3: 16, 4: 218}[size]
+    expected = np.zeros_like(census)
+    for iso_class, vertices in occurrences.items():
+        expected[iso_class] = len(vertices)
+    assert census.sum() > 0
+    np.testing.assert_array_equal(census, expected)
+
+
+def test_cached_motif_hashes_match_uncached():
+    session, comments = synthetic_session(0, 40, 10, np.random.default_rng(0))
+    session_G = build_session_graph(session, comments, True)
+    motif_hash_cache.clear()
+
+    plain_motifs = find_session_graph_motifs(session_G, 3)
+    flavored_motifs = [
+        FlavoredMotifGraph.from_plain_motif(plain_motif, "fine", "fine")
+        for plain_motif in plain_motifs
+    ]
+
+    assert motif_hash_cache.hits > motif_hash_cache.misses
+    assert motif_hash_cache.hits + motif_hash_cache.misses == 2 * len(plain_motifs)
+    for plain_motif, flavored_motif in zip(plain_motifs, flavored_motifs):
+        assert plain_motif.graph_hash == weisfeiler_lehman_graph_hash(plain_motif.graph)
+        assert flavored_motif.graph_hash == weisfeiler_lehman_graph_hash(
+            flavored_motif.graph, "binned_weight", "mapped_type"
+        )
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_labeler_matches_from_plain_motif(size):
+    session, comments = synthetic_session(0, 30, 8, np.random.default_rng(size))
+    session_G = build_session_graph(session, comments, True)
+    session_igraph = to_session_igraph(session_G)
+    plain_motifs = find_session_graph_motifs(session_G, size, session_igraph)
+    labeler = FlavoredMotifLabeler(session_igraph)
+
+    for plain_motif in plain_motifs[:200]:
+        for flavored_motif in labeler.flavor(plain_motif):
+            expected = FlavoredMotifGraph.from_plain_motif(
+                plain_motif, flavored_motif.node_flavor, flavored_motif.edge_flavor
+            )
+            assert flavored_motif.graph_hash == expected.graph_hash
+            assert flavored_motif.graph_hash == weisfeiler_lehman_graph_hash(
+                expected.graph, "binned_weight", "mapped_type"
+            )
+            graph = flavored_motif.graph
+            assert graph.get_edgelist() == expected.graph.get_edgelist()
+            assert graph.vs["mapped_type"] == expected.graph.vs["mapped_type"]
+            assert list(graph.es["binned_weight"]) == list(
+                expected.graph.es["binned_weight"]
+            )
+
+
+def test_labeler_matches_unsorted_session_edges(basic_session):
+    # d1 replies to the victim before d2 does, so the session edge ids are
+    # not in ascending (source, target) order.
+    comments = [
+        AuthorRole(
+            unit_id=basic_session.unit_id,
+            comment_id=uuid4(),
+            author_name=author_name,
+            role=role,
+            severity=severity,
+            timestamp=basic_session.posted_at,
+        )
+        for author_name, role, severity in [
+            ("d1", "aggressive_defender", 0.5),
+            ("v", "non_aggressive_victim", 1.0),
+            ("d2", "aggressive_defender", 3.0),
+            ("d1", "aggressive_defender", 0.5),
+        ]
+    ]
+    session_G = build_session_graph(basic_session, comments, True)
+    session_igraph = to_session_igraph(session_G)
+    edges = session_igraph.get_edgelist()
+    assert edges != sorted(edges)
+    labeler = FlavoredMotifLabeler(session_igraph)
+
+    for size in [3, 4]:
+        plain_motifs = find_session_graph_motifs(session_G, size, session_igraph)
+        assert plain_motifs
+        for plain_motif in plain_motifs:
+            for flavored_motif in labeler.flavor(plain_motif):
+                expected = FlavoredMotifGraph.from_plain_motif(
+                    plain_motif, flavored_motif.node_flavor, flavored_motif.edge_flavor
+                )
+                graph = flavored_motif.graph
+                assert graph.get_edgelist() == expected.graph.get_edgelist()
+                assert graph.vs["mapped_type"] == expected.graph.vs["mapped_type"]
+                assert list(graph.es["binned_weight"]) == list(
+                    expected.graph.es["binned_weight"]
+                )
+
+
+def test_all_flavors_match_from_plain_motif():
+    session, comments = synthetic_session(0, 30, 8, np.random.default_rng(0))
+    session_G = build_session_graph(session, comments, True)
+    plain_motifs = find_session_graph_motifs(session_G, 4)
+
+    for plain_motif in plain_motifs[:100]:
+        attributes = plain_motif.graph.vs.attributes()
+        flavored_motifs = FlavoredMotifGraph.from_plain_motif_all_flavors(plain_motif)
+        assert plain_motif.graph.vs.attributes() == attributes
+        assert [(m.node_flavor, m.edge_flavor) for m in flavored_motifs] == list(
+            itertools.product(NODE_FLAVORS, EDGE_FLAVORS)
+        )
+        graphs = [m.graph for m in flavored_motifs]
+        assert len({id(graph) for graph in graphs}) == 6
+        for flavored_motif in flavored_motifs:
+            expected = FlavoredMotifGraph.from_plain_motif(
+                plain_motif, flavored_motif.node_flavor, flavored_motif.edge_flavor
+            )
+            assert flavored_motif.graph_hash == expected.graph_hash
+            assert flavored_motif.graph.vs["mapped_type"] == (
+                expected.graph.vs["mapped_type"]
+            )
+            assert list(flavored_motif.graph.es["binned_weight"]) == list(
+                expected.graph.es["binned_weight"]
+            )
+
+
+@pytest.fixture
+def session_graphs():
+    rng = np.random.default_rng(5)
+    graphs = [
+        build_session_graph(*synthetic_session(unit_id, 25, 8, rng), True)
+        for unit_id in range(6)
+    ]
+    # Mix in the compact representation the motif stage loads.
+    return graphs[:3] + [
+        load_session_graph(serialize_session_graph(G, "compact")) for G in graphs[3:]
+    ]
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_batch_census_matches_sessions(session_graphs, size):
+    batch = SessionGraphBatch.pack(session_graphs)
+    assert batch.igraph.vcount() == batch.offsets[-1]
+
+    census = batch.motif_census(size)
+    for row, session_G in zip(census, session_graphs):
+        np.testing.assert_array_equal(
+            row, motif_census(to_session_igraph(session_G), size)
+        )
+
+
+def test_batch_motifs_match_sessions(session_graphs):
+    batch = SessionGraphBatch.pack(session_graphs)
+    batch_motifs = find_batch_motifs(batch, 3)
+
+    for i, session_G in enumerate(session_graphs):
+        offset = batch.offsets[i]
+        actual = sorted(
+            (m.iso_class, m.graph_hash, tuple(v - offset for v in m.vertices))
+            for m in batch_motifs
+            if m.unit_id == session_G.unit_id
+        )
+        expected = sorted(
+            (m.iso_class, m.graph_hash, m.vertices)
+            for m in find_session_graph_motifs(session_G, 3)
+        )
+        assert actual == expected
+
+
+def test_parallel_motif_rows_match_sequential():
+    rng = np.random.default_rng(9)
+    session_graphs = [
+        build_session_graph(*synthetic_session(unit_id, 12, 6, rng), True)
+        for unit_id in range(4)
+    ]
+    # Workers must get compact blobs whichever serialization was stored.
+    blobs = [
+        serialize_session_graph(session_G, "pickle" if unit_id % 2 else "compact")
+        for unit_id, session_G in enumerate(session_graphs)
+    ]
+
+    def summarize(workers: int) -> tuple[list, list]:
+        plain, flavored = [], []
+        for chunk in motif_rows(blobs, workers=workers, batch_size=1):
+            plain_ids = {row["plain_motif_id"] for row in chunk.plain_rows}
+            assert {row["plain_motif_id"] for row in chunk.flavored_rows} == plain_ids
+            plain += [
+                (row["unit_id"], row["size"], row["iso_class"], row["motif_hash"])
+                for row in chunk.plain_rows
+            ]
+            flavored += [
+                (row["node_flavor"], row["edge_flavor"], row["motif_hash"])
+                for row in chunk.flavored_rows
+            ]
+        return plain, flavored
+
+    sequential = summarize(workers=1)
+    assert len(sequential[1]) == 6 * len(sequential[0])
+    assert summarize(workers=2) == sequential
+
+
+def _plain_keys(chunks) -> list:
+    return [
+        (row["unit_id"], row["size"], row["iso_class"], row["motif_hash"])
+        for chunk in chunks
+        for row in chunk.plain_rows
+    ]
+
+
+def test_chunks_split_at_budget():
+    session, comments = synthetic_session(0, 20, 8, np.random.default_rng(10))
+    blob = serialize_session_graph(
+        build_session_graph(session, comments, True), "compact"
+    )
+    (whole,) = motif_rows([blob])
+    # The most one occurrence can put in a chunk past the budget.
+    occurrence_bytes = max(len(row["serialized_motif"]) for row in whole.plain_rows)
+    occurrence_bytes += 6 * max(
+        len(row["serialized_motif"]) for row in whole.flavored_rows
+    )
+    occurrence_bytes += 7 * ROW_OVERHEAD_BYTES
+    max_chunk_bytes = whole.num_bytes // 5
+
+    for workers in [1, 2]:
+        chunks = list(motif_rows([blob], workers, max_chunk_bytes=max_chunk_bytes))
+        assert len(chunks) >= 5
+        assert sum(chunk.num_sessions for chunk in chunks) == 1
+        assert sum(chunk.num_bytes for chunk in chunks) == whole.num_bytes
+        for chunk in chunks:
+            assert chunk.num_bytes < max_chunk_bytes + occurrence_bytes
+            plain_ids = {row["plain_motif_id"] for row in chunk.plain_rows}
+            assert {row["plain_motif_id"] for row in chunk.flavored_rows} == plain_ids
+        assert _plain_keys(chunks) == _plain_keys([whole])
+
+
+def test_occurrences_enumerated_in_runs_within_budget(monkeypatch):
+    rng = np.random.default_rng(12)
+    blobs = [
+        serialize_session_graph(
+            build_session_graph(*synthetic_session(unit_id, 20, 8, rng), True),
+            "compact",
+        )
+        for unit_id in range(6)
+    ]
+    session_occurrences = SessionGraphBatch.session_occurrences
+    enumerated = []
+
+    def recorded_session_occurrences(batch, size, *args):
+        occurrences = session_occurrences(batch, size, *args)
+        num_bytes = sum(a.nbytes + b.nbytes for a, b in occurrences)
+        enumerated.append((len(batch.unit_ids), size, num_bytes))
+        return occurrences
+
+    monkeypatch.setattr(
+        SessionGraphBatch, "session_occurrences", recorded_session_occurrences
+    )
+    (whole,) = motif_rows(blobs, batch_size=6)
+    assert [(num_sessions, size) for num_sessions, size, _ in enumerated] == [
+        (6, size) for size in SIZES
+    ]
+    max_chunk_bytes = max(num_bytes for _, _, num_bytes in enumerated) // 3
+
+    enumerated.clear()
+    chunks = list(motif_rows(blobs, batch_size=6, max_chunk_bytes=max_chunk_bytes))
+    assert sorted(_plain_keys(chunks)) == sorted(_plain_keys([whole]))
+    # Several runs, each enumerated one size at a time.
+    assert len(enumerated) > len(SIZES)
+    assert [size for _, size, _ in enumerated] == SIZES * (len(enumerated) // 2)
+    assert sum(num_sessions for num_sessions, _, _ in enumerated) == 6 * len(SIZES)
+    for num_sessions, _, num_bytes in enumerated:
+        assert num_sessions == 1 or num_bytes <= max_chunk_bytes
+
+
+def test_inserts_one_session_within_budget(monkeypatch):
+    session, comments = synthetic_session(0, 20, 8, np.random.default_rng(10))
+    blob = serialize_session_graph(
+        build_session_graph(session, comments, True), "compact"
+    )
+    (whole,) = motif_rows([blob])
+    inserted = []
+    monkeypatch.setattr(database, "stage", contextlib.nullcontext)
+    monkeypatch.setattr(database, "iter_session_graph_blobs", lambda: iter([blob]))
+    monkeypatch.setattr(database, "insert_plain_motif_rows", inserted.append)
+    monkeypatch.setattr(database, "insert_flavored_motif_rows", lambda rows: None)
+
+    find_and_insert_all_motifs(max_inflight_bytes=whole.num_bytes // 2)
+    assert len(inserted) > 2
+    assert sum(map(len, inserted)) == len(whole.plain_rows)
+
+
+def test_aggregated_rows_match_occurrences():
+    rng = np.random.default_rng(11)
+    blobs = [
+        serialize_session_graph(
+            build_session_graph(*synthetic_session(unit_id, 12, 6, rng), True),
+            "compact",
+        )
+        for unit_id in range(3)
+    ]
+    expected: Counter = Counter()
+    for chunk in motif_rows(blobs, batch_size=2):
+        plain_rows = {row["plain_motif_id"]: row for row in chunk.plain_rows}
+        for row in chunk.flavored_rows:
+            plain_row = plain_rows[row["plain_motif_id"]]
+            expected[
+                (
+                    plain_row["unit_id"],
+                    plain_row["size"],
+                    row["node_flavor"],
+                    row["edge_flavor"],
+                    row["motif_hash"],
+                )
+            ] += 1
+
+    counts: Counter = Counter()
+    catalog = []
+    for chunk in motif_rows(blobs, batch_size=2, aggregate=True):
+        assert not chunk.plain_rows and not chunk.flavored_rows
+        for row in chunk.count_rows:
+            key = tuple(
+                row[column]
+                for column in (
+                    "unit_id",
+                    "size",
+                    "node_flavor",
+                    "edge_flavor",
+                    "motif_hash",
+                )
+            )
+            counts[key] += row["hash_count"]
+        catalog += [
+            (row["node_flavor"], row["edge_flavor"], row["motif_hash"])
+            for row in chunk.catalog_rows
+        ]
+    assert counts == expected
+    assert all(
+        row["sampling_probability"] == 1.0 and row["count_variance"] == 0.0
+        for chunk in motif_rows(blobs, aggregate=True)
+        for row in chunk.count_rows
+    )
+    # One representative per flavored hash across the whole run.
+    assert sorted(catalog) == sorted({key[2:] for key in expected})
+
+
+def test_aggregate_builds_graphs_for_new_hashes_only(monkeypatch):
+    session, comments = synthetic_session(0, 60, 12, np.random.default_rng(11))
+    blob = serialize_session_graph(
+        build_session_graph(session, comments, True), "compact"
+    )
+    induced_subgraph = ig.Graph.induced_subgraph
+    calls = []
+
+    def counted_induced_subgraph(graph, vertices, *args, **kwargs):
+        calls.append(vertices)
+        return induced_subgraph(graph, vertices, *args, **kwargs)
+
+    monkeypatch.setattr(ig.Graph, "induced_subgraph", counted_induced_subgraph)
+    (chunk,) = motif_rows([blob], aggregate=True, sampling=None)
+    # One motif graph per occurrence with a hash not catalogued yet.
+    assert 0 < len(calls) <= len(chunk.catalog_rows)
+    assert len(calls) < chunk.num_occurrences
+
+
+def test_canonical_backend_rows():
+    session, comments = synthetic_session(0, 12, 6, np.random.default_rng(19))
+    blob = serialize_session_graph(
+        build_session_graph(session, comments, True), "compact"
+    )
+    try:
+        (chunk,) = motif_rows([blob], hash_backend="canonical")
+    finally:
+        graph_hashing.use_hash_backend("wl")
+    for row in chunk.plain_rows:
+        graph = pickle.loads(row["serialized_motif"])
+        assert row["motif_hash"] == graph_hashing.canonical_graph_hash(graph)
+    for row in chunk.flavored_rows[:200]:
+        graph = pickle.loads(row["serialized_motif"])
+        assert row["motif_hash"] == graph_hashing.canonical_graph_hash(
+            graph, "binned_weight", "mapped_type"
+        )
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_occurrence_estimate_bounds_census(size):
+    rng = np.random.default_rng(23)
+    for unit_id in range(5):
+        session_G = CompactSessionGraph.from_session_digraph(
+            build_session_graph(*synthetic_session(unit_id, 40, 10, rng), True)
+        )
+        census = motif_census(session_G.to_igraph(), size)
+        estimate = estimate_motif_occurrences(
+            session_G.edges, session_G.num_nodes, size
+        )
+        assert census.sum() <= estimate
+
+
+def test_sampled_counts_are_unbiased():
+    session, comments = synthetic_session(0, 60, 12, np.random.default_rng(23))
+    blob = serialize_session_graph(
+        build_session_graph(session, comments, True), "compact"
+    )
+    (exact,) = motif_rows([blob], aggregate=True, sampling=None)
+    assert not exact.sampled
+    exact_totals = Counter()
+    for row in exact.count_rows:
+        exact_totals[row["size"]] += row["hash_count"]
+
+    # Every occurrence carries all six flavors.
+    sampling = MotifSampling(max_occurrences=min(exact_totals.values()) // 6 // 4)
+    (chunk,) = motif_rows([blob], aggregate=True, sampling=sampling)
+    assert {size for _, size, _ in chunk.sampled} == {3, 4}
+    (repeat,) = motif_rows([blob], aggregate=True, sampling=sampling)
+    assert repeat.count_rows == chunk.count_rows
+
+    estimates = []
+    for seed in range(20):
+        (chunk,) = motif_rows(
+            [blob],
+            aggregate=True,
+            sampling=MotifSampling(sampling.max_occurrences, seed=seed),
+        )
+        totals = Counter()
+        variances = Counter()
+        for row in chunk.count_rows:
+            assert row["sampling_probability"] < 1.0
+            totals[row["size"]] += row["hash_count"] / row["sampling_probability"]
+            variances[row["size"]] += row["count_variance"]
+        estimates.append((totals, variances))
+    # The six flavor counts of an occurrence are sampled together.
+    for size, exact_total in exact_totals.items():
+        mean = np.mean([totals[size] for totals, _ in estimates])
+        standard_error = np.sqrt(
+            np.mean([variances[size] for _, variances in estimates]) * 6 / 20
+        )
+        assert abs(mean - exact_total) < 4 * standard_error
+
+
+def test_time_budget_does_not_depend_on_batches():
+    rng = np.random.default_rng(23)
+    session_graphs = [
+        CompactSessionGraph.from_session_digraph(
+            build_session_graph(*synthetic_session(unit_id, 40, 10, rng), True)
+        )
+        for unit_id in range(3)
+    ]
+    sampling = MotifSampling(time_budget=0.5, seconds_per_occurrence=1e-3)
+    for session_G in session_graphs:
+        for size, probability in sampling.sampling_probabilities(session_G).items():
+            estimate = estimate_motif_occurrences(
+                session_G.edges, session_G.num_nodes, size
+            )
+            assert probability == min(1.0, 500 / estimate)
+
+    blobs = [session_G.to_bytes() for session_G in session_graphs]
+
+    def count_rows(batch_size: int) -> list:
+        return sorted(
+            (
+                row
+                for chunk in motif_rows(
+                    blobs, batch_size=batch_size, aggregate=True, sampling=sampling
+                )
+                for row in chunk.count_rows
+            ),
+            key=lambda row: tuple(row.values()),
+        )
+
+    rows = count_rows(batch_size=1)
+    assert any(row["sampling_probability"] < 1.0 for row in rows)
+    assert count_rows(batch_size=3) == rows
+
+
+def test_count_confidence_interval():
+    assert count_confidence_interval(10, 1.0) == (10.0, 10.0)
+    low, high = count_confidence_interval(10, 0.5)
+    assert low < 20.0 < high
+    assert count_confidence_interval(0, 0.5) == (0.0, 0.0)
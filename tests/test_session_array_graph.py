@@ -0,0 +1,49 @@
+# pyright: basic
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from src.author_role import AuthorRole
+from src.graph_builder import GraphBuilder
+from src.pickle_sessions import build_session_graph
+from src.redo_count_motifs import to_session_igraph
+from src.session_array_graph import SessionArrayGraph
+
+
+def _comment(author_name: str, role: str, severity: float) -> AuthorRole:
+    return AuthorRole(
+        unit_id=123,
+        comment_id=uuid4(),
+        author_name=author_name,
+        role=role,
+        severity=severity,
+        timestamp=datetime(2020, 1, 1),
+    )
+
+
+def test_igraph_export_matches_networkx(basic_session):
+    comments = [
+        _comment("bully_1", "bully", 2.0),
+        _comment("defender_1", "aggressive_defender", 1.0),
+        _comment("bully_1", "bully", 3.0),
+        _comment("victim_1", "aggressive_victim", 1.0),
+        _comment("assistant_1", "bully_assistant", 1.0),
+    ]
+    networkx_G = build_session_graph(basic_session, comments, True)
+    array_G = build_session_graph(basic_session, comments, True, engine="array")
+
+    expected = to_session_igraph(networkx_G)
+    actual = to_session_igraph(array_G)
+    assert actual.get_edgelist() == expected.get_edgelist()
+    for attribute in ["type", "layer"]:
+        assert actual.vs[attribute] == expected.vs[attribute]
+    for attribute in ["type", "weight"]:
+        assert actual.es[attribute] == expected.es[attribute]
+    assert array_G.bully_score_weighted == networkx_G.bully_score_weighted
+
+
+def test_snapshots_need_networkx(basic_session, tmp_path):
+    array_G = SessionArrayGraph.from_session(basic_session, is_true_graph=True)
+    with pytest.raises(ValueError):
+        GraphBuilder(array_G, tmp_path)
@@ -6,7 +6,8 @@ from unittest.mock import Mock
 import pytest
 import numpy as np
 
-from src.session_digraph import SessionDiGraph
+from src.graph_builder import GraphBuilder
+from src.session_digraph import VICTIM_TYPES, SessionDiGraph
 
 
 def test_out_of_order_edge_placement(basic_graph):
@@ -66,25 +67,6 @@ def test_most_frequent_topic(basic_graph):
     assert basic_graph.most_frequent_topic() == "Race"
 
 
-def test_process_degrees_single_value(basic_graph):
-    """Test _process_degrees with single value"""
-    result = basic_graph._process_degrees(3.14)
-    assert result == 3.14
-
-
-def test_process_non_empty_list(basic_graph):
-    """Test _process_degrees with iterable"""
-    iter_values = [("node1", 2), ("node2", 4), ("node3", 6)]
-    result = basic_graph._process_degrees(iter_values)
-    assert result == 4.0  # mean of [2, 4, 6]
-
-
-def test_process_degrees_empty_list(basic_graph):
-    """Test _process_degrees with empty iterable"""
-    result = basic_graph._process_degrees([])
-    assert result == 0.0
-
-
 def test_percent_comments_bullying(basic_graph):
     """Test percent_comments_bullying property"""
     assert basic_graph.percent_comments_bullying == 0.25
@@ -216,3 +198,75 @@ def test_graph_with_no_victims_or_bullies(basic_graph):
     assert len(basic_graph.bullies) == 0
     assert basic_graph.victim_avg_in_deg == 0.0
     assert basic_graph.bully_avg_in_deg == 0.0
+
+
+def _recomputed_statistics(graph: SessionDiGraph) -> dict[str, float]:
+    """Statistics recomputed from scratch off the networkx node/edge views."""
+
+    def mean_degree(degree_view) -> float:
+        values = [float(d) for _, d in degree_view]
+        return sum(values) / len(values) if values else 0.0
+
+    types = graph.node_types
+    victims = [n for n, t in types.items() if t in VICTIM_TYPES]
+    bullies = [n for n, t in types.items() if t in ("bully", "bully_assistant")]
+    main_victim = graph.main_victim
+    return {
+        "num_victims": len(victims),
+        "num_bullies": len(bullies),
+        "num_agg_victims": sum(t == "aggressive_victim" for t in types.values()),
+        "num_agg_defenders": sum(t == "aggressive_defender" for t in types.values()),
+        "main_victim_in_deg": graph.in_degree(main_victim),
+        "main_victim_weighted_in_deg": graph.in_degree(main_victim, weight="weight"),
+        "main_victim_out_deg": graph.out_degree(main_victim),
+        "main_victim_weighted_out_deg": graph.out_degree(main_victim, weight="weight"),
+        "victim_avg_in_deg": mean_degree(graph.in_degree(victims)),
+        "victim_avg_weighted_in_deg": mean_degree(
+            graph.in_degree(victims, weight="weight")
+        ),
+        "victim_avg_out_deg": mean_degree(graph.out_degree(victims)),
+        "victim_avg_weighted_out_deg": mean_degree(
+            graph.out_degree(victims, weight="weight")
+        ),
+        "bully_avg_in_deg": mean_degree(graph.in_degree(bullies)),
+        "bully_avg_weighted_in_deg": mean_degree(
+            graph.in_degree(bullies, weight="weight")
+        ),
+        "bully_avg_out_deg": mean_degree(graph.out_degree(bullies)),
+        "bully_avg_weighted_out_deg": mean_degree(
+            graph.out_degree(bullies, weight="weight")
+        ),
+    }
+
+
+def test_incremental_statistics_match_recompute(basic_graph, session_comments):
+    builder = GraphBuilder(basic_graph)
+    main_victim, *comments = session_comments
+    builder.add_node(main_victim)
+    for _ in range(3):
+        for author_role in comments:
+            builder.add_node(author_role)
+            builder.add_edge(author_role)
+
+    for name, expected in _recomputed_statistics(basic_graph).items():
+        assert getattr(basic_graph, name) == pytest.approx(expected), name
+
+
+def test_statistics_rebuilt_for_legacy_pickles(populated_graph):
+    expected = populated_graph.to_dict("compact")
+    state = dict(populated_graph.__dict__)
+    for name in [
+        "_type_counts",
+        "_victims",
+        "_bullies",
+        "_defenders",
+        "_node_groups",
+        "_degree_sums",
+    ]:
+        del state[name]
+    legacy = SessionDiGraph.__new__(SessionDiGraph)
+    legacy.__setstate__(state)
+
+    actual = legacy.to_dict("compact")
+    del expected["serialized_graph"], actual["serialized_graph"]
+    assert actual == pytest.approx(expected)
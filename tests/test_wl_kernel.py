@@ -0,0 +1,73 @@
+# pyright: basic
+import numpy as np
+import pytest
+
+from src.compact_graph import CompactSessionGraph
+from src.pickle_sessions import build_session_graph
+from src.wl_kernel import WLKernel, wl_feature_matrix
+from tests.synthetic import synthetic_session
+
+
+@pytest.fixture(scope="module")
+def session_graphs():
+    rng = np.random.default_rng(21)
+    return [
+        CompactSessionGraph.from_session_digraph(
+            build_session_graph(*synthetic_session(unit_id, 20, 6, rng), True)
+        )
+        for unit_id in range(11)
+    ]
+
+
+def test_features_do_not_depend_on_batching(session_graphs):
+    unit_ids, features = wl_feature_matrix(session_graphs, batch_size=100)
+    batched_unit_ids, batched_features = wl_feature_matrix(session_graphs, batch_size=3)
+    assert np.array_equal(unit_ids, batched_unit_ids)
+    assert features.shape == batched_features.shape
+    # Columns are numbered in first-seen order, inner products do not care.
+    assert (features @ features.T != batched_features @ batched_features.T).nnz == 0
+    # Every node has one label per refinement, plus its initial one.
+    assert np.array_equal(
+        np.asarray(features.sum(axis=1)).ravel(),
+        [4 * G.num_nodes for G in session_graphs],
+    )
+
+
+def test_features_are_permutation_invariant(session_graphs):
+    G = session_graphs[0]
+    order = np.random.default_rng(0).permutation(G.num_nodes)
+    position = np.argsort(order)
+    permuted = CompactSessionGraph(
+        unit_id=G.unit_id,
+        is_true_graph=G.is_true_graph,
+        num_likes=G.num_likes,
+        num_bullying_comments=G.num_bullying_comments,
+        num_comments=G.num_comments,
+        topic_vector=G.topic_vector,
+        role_codes=G.role_codes[order],
+        edges=position[G.edges],
+        weights=G.weights,
+        edge_types=G.edge_types,
+    )
+    _, features = wl_feature_matrix([G, permuted])
+    assert (features[0] != features[1]).nnz == 0
+
+
+def test_gram_matches_dense_kernel(session_graphs, tmp_path):
+    kernel = WLKernel.build(session_graphs, tmp_path, block_size=4)
+    dense = kernel.features.toarray().astype(np.float64)
+    norms = np.linalg.norm(dense, axis=1)
+    expected = dense @ dense.T / np.outer(norms, norms)
+    np.testing.assert_allclose(kernel.gram, expected, rtol=1e-5)
+
+    loaded = WLKernel.load(tmp_path)
+    assert np.array_equal(loaded.unit_ids, kernel.unit_ids)
+    assert (loaded.features != kernel.features).nnz == 0
+    assert np.array_equal(loaded.gram, kernel.gram)
+    assert (loaded.node_flavor, loaded.edge_flavor) == ("fine", "fine")
+    nearest = loaded.most_similar(int(kernel.unit_ids[0]), k=3)
+    assert len(nearest) == 3
+    assert int(kernel.unit_ids[0]) not in [unit_id for unit_id, _ in nearest]
+    assert [value for _, value in nearest] == sorted(
+        (value for _, value in nearest), reverse=True
+    )